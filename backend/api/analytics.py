@@ -0,0 +1,81 @@
+# api/analytics.py
+from fastapi import APIRouter, Depends, HTTPException, Query
+from api.auth import get_current_user
+from database import Session
+from fx_history import BASE_CURRENCY
+from typing import List, Optional
+import datetime
+import hierarchy
+
+router = APIRouter(prefix="/analytics", tags=["analytics"])
+
+GROUP_COLUMNS = ("month", "category", "employee", "status")
+
+async def visible_employees(current_user):
+    """None for admins (everyone), else the usernames whose expenses the user may aggregate."""
+    if current_user["role"] == "admin":
+        return None
+    if current_user["role"] == "manager":
+        return [current_user["username"]] + await hierarchy.get_reports(current_user["username"], recursive=True)
+    return [current_user["username"]]
+
+@router.get("/summary", summary="Expense totals grouped by month, category, employee and/or status")
+async def summary(
+    session: Session,
+    group_by: List[str] = Query(["month"]),
+    month_from: Optional[datetime.date] = None,
+    month_to: Optional[datetime.date] = None,
+    status: Optional[str] = None,
+    category: Optional[str] = None,
+    employee: Optional[str] = None,
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Reads the expense_rollups table (see rollups.py), never the raw expenses.
+    Totals are in BASE_CURRENCY. group_by may be repeated or comma separated,
+    e.g. ?group_by=month,category.
+    """
+    columns = list(dict.fromkeys(c.strip() for g in group_by for c in g.split(",") if c.strip()))
+    unknown = [c for c in columns if c not in GROUP_COLUMNS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Cannot group by {', '.join(unknown)}; "
+                                                    f"choose from {', '.join(GROUP_COLUMNS)}")
+
+    where, params = [], []
+    employees = await visible_employees(current_user)
+    if employees is not None:
+        where.append("employee IN (" + ",".join(["%s"] * len(employees)) + ")")
+        params.extend(employees)
+    if month_from:
+        where.append("month >= %s")
+        params.append(month_from.replace(day=1))
+    if month_to:
+        where.append("month <= %s")
+        params.append(month_to.replace(day=1))
+    if status:
+        where.append("status = %s")
+        params.append(status)
+    if category is not None:
+        where.append("category = %s")
+        params.append(category)
+    if employee:
+        where.append("employee = %s")
+        params.append(employee)
+
+    select = columns + ["SUM(expense_count) AS expense_count", "SUM(total_base_amount) AS total_base_amount"]
+    sql = "SELECT " + ", ".join(select) + " FROM expense_rollups"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    if columns:
+        sql += " GROUP BY " + ", ".join(columns) + " ORDER BY " + ", ".join(columns)
+
+    async with session.cursor() as cur:
+        await cur.execute(sql, tuple(params))
+        rows = await cur.fetchall()
+
+    # a group whose expenses all moved to another status keeps a zero row; drop it
+    rows = [r for r in rows if r["expense_count"]]
+    for r in rows:
+        r["expense_count"] = int(r["expense_count"])
+        r["total_base_amount"] = float(r["total_base_amount"] or 0)
+    return {"currency": BASE_CURRENCY, "group_by": columns, "rows": rows}
@@ -1,13 +1,17 @@
 # api/auth.py
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from passlib.context import CryptContext
 import os
 import jwt
 import datetime
+import time
 from dotenv import load_dotenv
-from database import get_db
+from database import Session
 from models import UserCreate
+from cache import TTLCache
+import hashing
+import hierarchy
+import repository
 
 load_dotenv()
 
@@ -15,18 +19,22 @@ router = APIRouter(prefix="/auth", tags=["auth"])
 SECRET_KEY = os.getenv("SECRET_KEY", "changeme")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 60))
+IDENTITY_CACHE_TTL = int(os.getenv("IDENTITY_CACHE_TTL", 60))
+IDENTITY_CACHE_SIZE = int(os.getenv("IDENTITY_CACHE_SIZE", 4096))
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
 
+# (username, token) -> user row, so authenticated requests skip the users lookup
+identity_cache = TTLCache(maxsize=IDENTITY_CACHE_SIZE, ttl=IDENTITY_CACHE_TTL)
 
-# Use Argon2 instead of bcrypt
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+def invalidate_identity(username: str):
+    """Call after a user is deleted or their role/manager changes."""
+    identity_cache.invalidate_where(lambda key: key[0] == username)
 
-def verify_password(plain, hashed):
-    return pwd_context.verify(plain, hashed)
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+# Argon2 runs in the hashing process pool, never on the request thread
+async def get_password_hash(password):
+    return await hashing.hash_password(password)
 
 def create_access_token(data: dict, expires_delta: datetime.timedelta = None):
     to_encode = data.copy()
@@ -45,62 +53,68 @@ def decode_token(token: str):
     except Exception:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
 
-def get_current_user(token: str = Depends(oauth2_scheme)):
+async def get_current_user(session: Session, token: str = Depends(oauth2_scheme)):
     payload = decode_token(token)
     username = payload.get("sub")
-    if not username:
+    # scoped tokens (stream tickets) are not access tokens
+    if not username or payload.get("scope"):
         raise HTTPException(status_code=401, detail="Invalid auth token")
-    conn = get_db()
-    cur = conn.cursor(dictionary=True)
-    cur.execute("SELECT id, username, role, manager FROM users WHERE username = %s", (username,))
-    user = cur.fetchone()
-    cur.close()
-    conn.close()
-    if not user:
-        raise HTTPException(status_code=401, detail="User not found")
-    return user
+
+    user = identity_cache.get((username, token))
+    if user is None:
+        async with session.cursor() as cur:
+            user = await repository.fetch_one(cur, repository.USER_IDENTITY, (username,))
+        if not user:
+            raise HTTPException(status_code=401, detail="User not found")
+        # never keep an identity around longer than its token is valid
+        ttl = IDENTITY_CACHE_TTL
+        if payload.get("exp"):
+            ttl = min(ttl, payload["exp"] - time.time())
+        identity_cache.set((username, token), user, ttl=ttl)
+    return dict(user)
 
 @router.post("/signup")
-def signup(user: UserCreate):
-    conn = get_db()
-    cur = conn.cursor()
-    
-    
-    hashed = get_password_hash(user.password)
-    try:
-        cur.execute("INSERT INTO users (username, password, role, manager) VALUES (%s, %s, %s, %s)",
-                    (user.username, hashed, user.role, user.manager))
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise HTTPException(status_code=400, detail=f"Could not create user: {str(e)}")
-    finally:
-        cur.close()
-        conn.close()
+async def signup(user: UserCreate, session: Session):
+    hashed = await get_password_hash(user.password)
+    async with session.cursor() as cur:
+        try:
+            await repository.insert_user(cur, user.username, hashed, user.role, user.manager)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Could not create user: {str(e)}")
+    hierarchy.invalidate()
     return {"msg": "User created"}
 
 @router.post("/login")
-def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    conn = get_db()
-    cur = conn.cursor(dictionary=True)
-    cur.execute("SELECT * FROM users WHERE username = %s", (form_data.username,))
-    user = cur.fetchone()
-    cur.close()
-    conn.close()
+async def login(session: Session, form_data: OAuth2PasswordRequestForm = Depends()):
+    async with session.cursor() as cur:
+        user = await repository.fetch_one(cur, repository.USER_WITH_PASSWORD, (form_data.username,))
+    # hand the connection back while Argon2 runs; the rehash below checks one out again
+    await session.close()
     if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
-    if not verify_password(form_data.password, user["password"]):
+    ok, new_hash = await hashing.verify_password(form_data.password, user["password"])
+    if not ok:
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    if new_hash:
+        # stored hash predates the current Argon2 parameters; upgrade it transparently
+        async with session.cursor() as cur:
+            await cur.execute(repository.UPDATE_PASSWORD, (new_hash, user["id"]))
 
     token = create_access_token({"sub": user["username"], "role": user["role"]})
     return {"access_token": token, "token_type": "bearer"}
 
 @router.get("/me")
-def get_me(current_user: dict = Depends(get_current_user)):
+async def get_me(current_user: dict = Depends(get_current_user)):
     # return minimal safe user info
     return {
         "id": current_user.get("id"),
         "username": current_user.get("username"),
         "role": current_user.get("role"),
         "manager": current_user.get("manager"),
-    }
\ No newline at end of file
+    }
+
+@router.get("/cache-stats", summary="Identity cache counters (admin)")
+async def identity_cache_stats(current_user: dict = Depends(get_current_user)):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    return identity_cache.stats()
@@ -0,0 +1,60 @@
+# api/events.py
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from api.auth import get_current_user, create_access_token, decode_token
+from cache import TTLCache
+from database import Session
+from dotenv import load_dotenv
+import datetime
+import os
+import uuid
+import events
+import repository
+
+load_dotenv()
+
+router = APIRouter(prefix="/events", tags=["events"])
+STREAM_TICKET_TTL = int(os.getenv("STREAM_TICKET_TTL", 30))  # seconds a ticket can be exchanged for a stream
+
+# jti of tickets already exchanged; kept as long as the tickets themselves are valid
+redeemed_tickets = TTLCache(maxsize=10000, ttl=STREAM_TICKET_TTL)
+
+@router.post("/ticket", summary="Short-lived, single-use ticket for GET /events/stream")
+async def stream_ticket(current_user: dict = Depends(get_current_user)):
+    """
+    EventSource cannot send an Authorization header, so the stream URL carries
+    this ticket instead of the access token: it is only good for opening one
+    stream, within STREAM_TICKET_TTL seconds, and is refused everywhere else.
+    """
+    ticket = create_access_token({"sub": current_user["username"], "scope": "events", "jti": uuid.uuid4().hex},
+                                 expires_delta=datetime.timedelta(seconds=STREAM_TICKET_TTL))
+    return {"ticket": ticket, "expires_in": STREAM_TICKET_TTL}
+
+@router.get("/stream", summary="Server-Sent Events for the caller's expenses and approvals")
+async def event_stream(session: Session, ticket: str = Query(..., description="from POST /events/ticket")):
+    """
+    Events: expense.submitted, expense.approved, expense.rejected, expense.vote and
+    resync. Each data payload is JSON with expense_ids and status.
+    """
+    payload = decode_token(ticket)
+    jti = payload.get("jti")
+    if payload.get("scope") != "events" or not jti or redeemed_tickets.get(jti):
+        raise HTTPException(status_code=401, detail="Invalid or used stream ticket")
+    redeemed_tickets.set(jti, True)
+    async with session.cursor() as cur:
+        current_user = await repository.fetch_one(cur, repository.USER_IDENTITY, (payload.get("sub"),))
+    if not current_user:
+        raise HTTPException(status_code=401, detail="User not found")
+    await session.close()
+    try:
+        events.check_capacity(current_user["username"])
+    except events.TooManyStreams as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return StreamingResponse(events.stream(current_user["username"], current_user["role"]),
+                             media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@router.get("/stats", summary="Open event streams (admin)")
+async def event_stats(current_user: dict = Depends(get_current_user)):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    return events.stats()
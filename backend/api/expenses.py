@@ -1,137 +1,168 @@
-from fastapi import APIRouter, Depends, HTTPException, Body
-from database import get_db
+from fastapi import APIRouter, Depends, HTTPException, Body, Query, Request, BackgroundTasks
+from database import get_async_db, Session, SSDictCursor
+from fastapi.responses import StreamingResponse
 from api.auth import get_current_user
-from models import ExpenseCreate
-import json, datetime
+from models import ExpenseCreate, BulkDecision
+from pydantic import ValidationError
+import approval_rules
+import events
+import fx_history
+import hierarchy
+import profiler
+import receipt_store
+import repository
+import rule_cache
+import rollups
+import upload_stream
+from typing import List, Optional
+import datetime, base64, csv, decimal, io, json, os
 
 router = APIRouter(prefix="/expenses", tags=["expenses"])
 
 # ---------------------------------
-# Helper: Load rule
+# Helper: Approval state (expense_approvers)
 # ---------------------------------
-def load_rule(rule_id):
-    conn = get_db()
-    cur = conn.cursor(dictionary=True)
-    cur.execute("SELECT * FROM rules WHERE id = %s AND is_active = 1", (rule_id,))
-    r = cur.fetchone()
-    cur.close()
-    conn.close()
-    if not r:
-        return None
-    try:
-        r["approvers"] = json.loads(r.get("approvers") or "[]")
-    except:
-        r["approvers"] = []
-    return r
-
-# ---------------------------------
-# Helper: Manager chain (up to 10 levels)
-# ---------------------------------
-def get_manager_chain(username):
-    conn = get_db()
-    cur = conn.cursor(dictionary=True)
-    chain = []
-    current = username
-    for _ in range(10):
-        cur.execute("SELECT manager FROM users WHERE username = %s", (current,))
-        row = cur.fetchone()
-        if not row or not row.get("manager"):
-            break
-        manager = row["manager"]
-        if not manager or manager in chain:
-            break
-        chain.append(manager)
-        current = manager
-    cur.close()
-    conn.close()
-    return chain
-
-# ---------------------------------
-# Helper: Conditional Approvers
-# ---------------------------------
-def get_conditional_approvers(amount, category):
-    """Auto-select approvers based on 'conditional_rules' table"""
-    conn = get_db()
-    cur = conn.cursor(dictionary=True)
-    cur.execute("SELECT * FROM conditional_rules")
-    rules = cur.fetchall()
-    cur.close()
-    conn.close()
-
-    result = []
-    for r in rules:
-        field = r.get("condition_field")
-        op = r.get("operator")
-        val = r.get("value")
-        approver = r.get("approver")
-
-        # Compare numeric (amount)
-        if field == "amount":
-            try:
-                amt = float(amount)
-                val_f = float(val)
-                if op == ">" and amt > val_f: result.append(approver)
-                elif op == "<" and amt < val_f: result.append(approver)
-                elif op in ("=", "==") and amt == val_f: result.append(approver)
-            except:
-                continue
+async def assign_approvers(cur, expense_id, approvers):
+    """Inserts one pending expense_approvers row per approver, in chain order."""
+    if not approvers:
+        return
+    await repository.insert_approvers(cur, [(expense_id, a, i + 1) for i, a in enumerate(approvers)])
+
+async def load_approval_history(cur, expense_ids):
+    """Builds {expense_id: {approvers, comments, votes}} for a page of expenses in one query."""
+    history = {eid: {"approvers": [], "comments": [], "votes": []} for eid in expense_ids}
+    if not expense_ids:
+        return history
+    placeholders = ",".join(["%s"] * len(expense_ids))
+    await cur.execute(f"""
+        SELECT expense_id, approver, decision, decided_at, comment FROM expense_approvers
+        WHERE expense_id IN ({placeholders})
+        ORDER BY expense_id, decided_at, seq, id
+    """, tuple(expense_ids))
+    for r in await cur.fetchall():
+        h = history[r["expense_id"]]
+        if r["decision"] == "pending":
+            h["approvers"].append(r["approver"])
+        elif r["decision"] in ("approved", "rejected"):
+            h["comments"].append(f"{r['approver']}: {r['comment']}")
+            h["votes"].append({
+                "user": r["approver"],
+                "decision": "approve" if r["decision"] == "approved" else "reject",
+                "at": r["decided_at"].isoformat() if r["decided_at"] else None,
+            })
+    return history
+
+async def record_decision(cur, expense_id, current_user, decision, comment):
+    """
+    Applies one approver decision inside the caller's transaction and counts it into
+    the expense's approval_state (see approval_rules.py). The expense row is locked
+    first so concurrent votes on the same expense serialize instead of overwriting
+    each other. Returns (expense row, approval state, new status or None while undecided).
+    """
+    exp = await repository.fetch_one(cur, repository.EXPENSE_FOR_UPDATE, (expense_id,))
+    if not exp:
+        raise HTTPException(status_code=404, detail="Expense not found")
+    if exp["status"] != "pending":
+        raise HTTPException(status_code=400, detail=f"Expense already {exp['status']}")
+    state = await repository.approval_state(cur, expense_id)
 
-        # Compare text (category)
-        if field == "category":
-            if op in ("=", "==") and category.lower() == val.lower():
-                result.append(approver)
+    username = current_user["username"]
+    row = await repository.fetch_one(cur, repository.PENDING_ROW_OF_APPROVER, (expense_id, username))
+    if (row is None and current_user["role"] not in ("admin", "manager")
+            and not approval_rules.is_specific(state, username, current_user["role"])):
+        raise HTTPException(status_code=403, detail="Not authorized")
+    seq = row["seq"] if row else 0
+    # without a pending row the vote would go in ad hoc; not for someone who already voted
+    voted = row is None and await repository.fetch_one(cur, repository.DECIDED_ROW_OF_APPROVER,
+                                                       (expense_id, username)) is not None
+    try:
+        approval_rules.check_turn(state, seq, voted)
+    except (approval_rules.AlreadyVoted, approval_rules.OutOfTurn) as e:
+        raise HTTPException(status_code=409, detail=str(e))
 
-    return list(set(result))
+    now = datetime.datetime.utcnow()
+    if row:
+        await cur.execute(repository.SET_VOTE, (decision, now, comment, row["id"]))
+    else:
+        await cur.execute(repository.INSERT_ADHOC_VOTE, (expense_id, username, decision, now, comment))
+    outcome = approval_rules.apply_vote(state, username, current_user["role"], seq, decision == "approved")
+    await repository.save_approval_state(cur, state)
+    return exp, state, outcome
 
 # ---------------------------------
-# POST /expenses — Employee submits
+# Helper: Live updates (events.py), published once the request commits
 # ---------------------------------
-@router.post("/", summary="Submit expense (employee)")
-def create_expense(exp: ExpenseCreate, current_user: dict = Depends(get_current_user)):
-    if current_user["role"] != "employee":
-        raise HTTPException(status_code=403, detail="Only employees can submit expenses")
+def notify(session, event_type, expense_ids, status, recipients, roles=()):
+    if events.listening():
+        data = {"expense_ids": expense_ids, "status": status}
+        session.after_commit(lambda: events.publish(event_type, data, recipients, roles))
 
-    approvers = []
+def specific_roles(state, approvers):
+    """[the specific approver] when it is a role: its holders have no approver rows to be found by."""
+    specific = state["specific_approver"]
+    return [specific] if specific and specific not in approvers else []
 
+# ---------------------------------
+# Helper: Approvers for a new expense
+# ---------------------------------
+async def resolve_approvers(manager_chain, exp):
+    """
+    Manager chain, then rule approvers (in sequence order for sequence rules), then
+    conditional approvers, without duplicates. Returns (approvers, rule or None).
+    """
     # Step 1️⃣ Manager chain
-    approvers.extend(get_manager_chain(current_user["username"]))
+    approvers = list(manager_chain)
 
     # Step 2️⃣ Rule-based approvers
+    rule = None
     if exp.rule_id:
-        rule = load_rule(exp.rule_id)
+        with profiler.span("resolve_approvers.rule"):
+            rule = await rule_cache.get_rule(exp.rule_id)
         if rule:
-            for a in rule.get("approvers", []):
+            for a in approval_rules.approval_order(rule):
                 if a not in approvers:
                     approvers.append(a)
-            if rule.get("specific_approver") and rule["specific_approver"] not in approvers:
-                approvers.append(rule["specific_approver"])
+            # a specific approver given as a role is not a user; its holders vote unassigned
+            specific = rule.get("specific_approver")
+            if specific and specific not in approvers and await hierarchy.is_user(specific):
+                approvers.append(specific)
 
     # Step 3️⃣ Conditional approvers (auto rules)
-    for a in get_conditional_approvers(exp.amount, exp.category):
+    with profiler.span("resolve_approvers.conditional"):
+        conditional = await rule_cache.match_conditional_approvers(exp.amount, exp.category)
+    for a in conditional:
         if a not in approvers:
             approvers.append(a)
+    return approvers, rule
 
-    comments, votes = [], []
-
-    conn = get_db()
-    cur = conn.cursor()
-    try:
-        cur.execute("""
-            INSERT INTO expenses (employee, amount, currency, category, description, status, approvers, comments, votes)
-            VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)
-        """, (
-            current_user["username"], exp.amount, exp.currency, exp.category, exp.description,
-            "pending", json.dumps(approvers), json.dumps(comments), json.dumps(votes)
-        ))
-        conn.commit()
-        expense_id = cur.lastrowid
-    except Exception as e:
-        conn.rollback()
-        raise HTTPException(status_code=400, detail=str(e))
-    finally:
-        cur.close()
-        conn.close()
+# ---------------------------------
+# POST /expenses — Employee submits
+# ---------------------------------
+@router.post("/", summary="Submit expense (employee)")
+async def create_expense(exp: ExpenseCreate, session: Session, current_user: dict = Depends(get_current_user)):
+    if current_user["role"] != "employee":
+        raise HTTPException(status_code=403, detail="Only employees can submit expenses")
 
+    with profiler.span("manager_chain"):
+        chain = await hierarchy.get_manager_chain(current_user["username"])
+    with profiler.span("resolve_approvers"):
+        approvers, rule = await resolve_approvers(chain, exp)
+    with profiler.span("fx_history.to_base"):
+        base_amount, fx_rate = await fx_history.to_base(exp.amount, exp.currency)
+
+    await session.begin()
+    async with session.cursor() as cur:
+        try:
+            expense_id = await repository.insert_expense(cur, current_user["username"], exp, base_amount, fx_rate)
+            await assign_approvers(cur, expense_id, approvers)
+            state = approval_rules.initial_state(rule, len(approvers))
+            await repository.insert_approval_states(cur, [(expense_id, state)])
+            await rollups.record_created(cur, [expense_id])
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    notify(session, "expense.submitted", [expense_id], "pending", [current_user["username"], *approvers],
+           specific_roles(state, approvers))
     return {
         "msg": "Expense submitted successfully",
         "expense_id": expense_id,
@@ -139,105 +170,548 @@ def create_expense(exp: ExpenseCreate, current_user: dict = Depends(get_current_
     }
 
 # ---------------------------------
-# GET /expenses — role filtered
+# POST /expenses/batch — many expenses in one transaction
 # ---------------------------------
-@router.get("/", summary="Get expenses (role filtered)")
-def get_expenses(current_user: dict = Depends(get_current_user)):
-    conn = get_db()
-    cur = conn.cursor(dictionary=True)
-
-    if current_user["role"] == "admin":
-        cur.execute("SELECT * FROM expenses ORDER BY created_at DESC")
-    elif current_user["role"] == "manager":
-        # Managers see all expenses from their team
-        cur.execute("""
-            SELECT * FROM expenses 
-            WHERE employee IN (SELECT username FROM users WHERE manager = %s)
-            OR status IN ('pending','approved','rejected')
-            ORDER BY created_at DESC
-        """, (current_user["username"],))
-    else:
-        cur.execute("SELECT * FROM expenses WHERE employee = %s ORDER BY created_at DESC", (current_user["username"],))
+BATCH_MAX_ITEMS = 1000
+BATCH_INSERT_CHUNK = 200
+
+@router.post("/batch", summary="Submit many expenses at once (employee)")
+async def create_expenses_batch(session: Session, items: List[dict] = Body(...),
+                                current_user: dict = Depends(get_current_user)):
+    """
+    Each item is validated on its own, so one bad row is reported instead of failing the batch.
+    Valid items share a single manager-chain lookup and are inserted with multi-row
+    statements in one transaction.
+    """
+    if current_user["role"] != "employee":
+        raise HTTPException(status_code=403, detail="Only employees can submit expenses")
+    if len(items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_ITEMS} items per batch")
 
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
+    username = current_user["username"]
+    with profiler.span("manager_chain"):
+        chain = await hierarchy.get_manager_chain(username)
 
-    for r in rows:
-        for key in ["approvers", "comments", "votes"]:
+    results, valid = [], []
+    with profiler.span("validate_and_resolve_approvers"):
+        for i, item in enumerate(items):
+            try:
+                exp = ExpenseCreate.model_validate(item)
+            except ValidationError as e:
+                errors = [{"field": ".".join(str(p) for p in err["loc"]), "msg": err["msg"]} for err in e.errors()]
+                results.append({"index": i, "ok": False, "errors": errors})
+                continue
+            approvers, rule = await resolve_approvers(chain, exp)
+            result = {"index": i, "ok": True, "approvers": approvers}
+            results.append(result)
+            valid.append((exp, result, approval_rules.initial_state(rule, len(approvers))))
+
+    if valid:
+        # rates first, so the transaction below only holds locks for the inserts
+        rates = [await fx_history.to_base(exp.amount, exp.currency) for exp, _, _ in valid]
+        await session.begin()
+        async with session.cursor() as cur:
             try:
-                r[key] = json.loads(r.get(key) or "[]")
-            except:
-                r[key] = []
-    return rows
+                # ids of a multi-row insert are spaced by auto_increment_increment (not 1 under replication setups)
+                step = (await repository.fetch_one(cur, repository.AUTO_INCREMENT_STEP))["step"]
+                approver_rows = []
+                for start in range(0, len(valid), BATCH_INSERT_CHUNK):
+                    chunk = valid[start:start + BATCH_INSERT_CHUNK]
+                    params = []
+                    for (exp, _, _), (base_amount, fx_rate) in zip(chunk, rates[start:start + BATCH_INSERT_CHUNK]):
+                        params.extend([username, exp.amount, exp.currency, exp.category, exp.description, "pending",
+                                       base_amount, fx_rate])
+                    await cur.execute(
+                        "INSERT INTO expenses (employee, amount, currency, category, description, status,"
+                        " base_amount, fx_rate) VALUES "
+                        + ",".join(["(%s,%s,%s,%s,%s,%s,%s,%s)"] * len(chunk)),
+                        params
+                    )
+                    # InnoDB reserves a multi-row "simple insert" one run of ids starting at lastrowid
+                    first_id = cur.lastrowid
+                    for offset, (_, result, _) in enumerate(chunk):
+                        result["expense_id"] = first_id + offset * step
+                        approver_rows.extend((result["expense_id"], a, seq + 1)
+                                             for seq, a in enumerate(result["approvers"]))
+                await repository.insert_approvers(cur, approver_rows)
+                await repository.insert_approval_states(cur, [(result["expense_id"], state)
+                                                              for _, result, state in valid])
+                await rollups.record_created(cur, [result["expense_id"] for _, result, _ in valid])
+            except Exception as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        if events.listening():
+            # one event per recipient, naming only the expenses that concern them
+            by_user = {username: [result["expense_id"] for _, result, _ in valid]}
+            by_role = {}
+            for _, result, state in valid:
+                for a in result["approvers"]:
+                    by_user.setdefault(a, []).append(result["expense_id"])
+                for role in specific_roles(state, result["approvers"]):
+                    by_role.setdefault(role, []).append(result["expense_id"])
+            for user, ids in by_user.items():
+                notify(session, "expense.submitted", ids, "pending", [user])
+            for role, ids in by_role.items():
+                notify(session, "expense.submitted", ids, "pending", [], [role])
+
+    return {
+        "submitted": len(valid),
+        "failed": len(results) - len(valid),
+        "results": results,
+    }
 
 # ---------------------------------
-# POST /approve
+# Helper: Keyset cursor over (created_at, id)
 # ---------------------------------
-@router.post("/{expense_id}/approve", summary="Approve an expense")
-def approve_expense(expense_id: int, comment: str = Body(None), current_user: dict = Depends(get_current_user)):
-    conn = get_db()
-    cur = conn.cursor(dictionary=True)
+LIST_COLUMNS = "id, employee, amount, currency, category, description, status, base_amount, created_at"
 
-    cur.execute("SELECT * FROM expenses WHERE id=%s", (expense_id,))
-    exp = cur.fetchone()
-    if not exp:
-        raise HTTPException(status_code=404, detail="Expense not found")
+def encode_cursor(created_at, expense_id):
+    raw = f"{created_at.isoformat()}|{expense_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        created_at, expense_id = raw.rsplit("|", 1)
+        return datetime.datetime.fromisoformat(created_at), int(expense_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
-    approvers = json.loads(exp["approvers"]) if exp.get("approvers") else []
-    comments = json.loads(exp["comments"]) if exp.get("comments") else []
-    votes = json.loads(exp["votes"]) if exp.get("votes") else []
+# ---------------------------------
+# Helper: Role scope + list filters
+# ---------------------------------
+def build_expense_filters(current_user, status=None, category=None, employee=None,
+                          date_from=None, date_to=None, min_amount=None, max_amount=None,
+                          min_base_amount=None, max_base_amount=None):
+    """Returns (where_clauses, params) for the role-scoped, filtered expense list."""
+    where, params = [], []
 
-    username = current_user["username"]
+    if current_user["role"] == "admin":
+        pass
+    elif current_user["role"] == "manager":
+        # Managers see all expenses from their team
+        where.append("""(employee IN (SELECT username FROM users WHERE manager = %s)
+            OR status IN ('pending','approved','rejected'))""")
+        params.append(current_user["username"])
+    elif current_user["role"] == "employee":
+        where.append("employee = %s")
+        params.append(current_user["username"])
+    else:
+        # other roles (e.g. cfo) also see the expenses they approve, including as a rule's
+        # specific approver by role, which gives them no approver rows
+        where.append("""(employee = %s
+            OR expenses.id IN (SELECT expense_id FROM expense_approvers WHERE approver = %s)
+            OR expenses.id IN (SELECT expense_id FROM approval_state WHERE specific_approver IN (%s, %s)))""")
+        params.extend([current_user["username"], current_user["username"],
+                       current_user["username"], current_user["role"]])
+
+    if status:
+        where.append("status = %s")
+        params.append(status)
+    if category:
+        where.append("category = %s")
+        params.append(category)
+    if employee:
+        where.append("employee = %s")
+        params.append(employee)
+    if date_from:
+        where.append("created_at >= %s")
+        params.append(date_from)
+    if date_to:
+        # date_to is inclusive of the whole day
+        where.append("created_at < %s")
+        params.append(date_to + datetime.timedelta(days=1))
+    if min_amount is not None:
+        where.append("amount >= %s")
+        params.append(min_amount)
+    if max_amount is not None:
+        where.append("amount <= %s")
+        params.append(max_amount)
+    # base_amount compares across currencies (see fx_history.py)
+    if min_base_amount is not None:
+        where.append("base_amount >= %s")
+        params.append(min_base_amount)
+    if max_base_amount is not None:
+        where.append("base_amount <= %s")
+        params.append(max_base_amount)
+
+    return where, params
 
-    if username not in approvers and current_user["role"] not in ("admin", "manager"):
-        raise HTTPException(status_code=403, detail="Not authorized")
+# ---------------------------------
+# GET /expenses — role filtered, keyset paginated
+# ---------------------------------
+@router.get("/", summary="Get expenses (role filtered, paginated)")
+async def get_expenses(
+    session: Session,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    status: Optional[str] = None,
+    category: Optional[str] = None,
+    employee: Optional[str] = None,
+    date_from: Optional[datetime.date] = None,
+    date_to: Optional[datetime.date] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    min_base_amount: Optional[float] = None,
+    max_base_amount: Optional[float] = None,
+    include_history: bool = False,
+    current_user: dict = Depends(get_current_user),
+):
+    where, params = build_expense_filters(current_user, status, category, employee,
+                                          date_from, date_to, min_amount, max_amount,
+                                          min_base_amount, max_base_amount)
+    if cursor:
+        created_at, last_id = decode_cursor(cursor)
+        where.append("(created_at < %s OR (created_at = %s AND id < %s))")
+        params.extend([created_at, created_at, last_id])
+
+    sql = f"SELECT {LIST_COLUMNS} FROM expenses"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    # fetch one extra row to know whether another page exists
+    sql += " ORDER BY created_at DESC, id DESC LIMIT %s"
+    params.append(limit + 1)
+
+    async with session.cursor() as cur:
+        with profiler.span("list_query"):
+            rows = await repository.fetch_all(cur, sql, tuple(params))
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+
+        if include_history:
+            with profiler.span("load_approval_history"):
+                history = await load_approval_history(cur, [r["id"] for r in rows])
+            for r in rows:
+                r.update(history[r["id"]])
+    return {"items": rows, "next_cursor": next_cursor}
 
-    comments.append(f"{username}: {comment or 'Approved'}")
-    votes.append({"user": username, "decision": "approve", "at": datetime.datetime.utcnow().isoformat()})
+# ---------------------------------
+# GET /expenses/export — streamed CSV / NDJSON
+# ---------------------------------
+EXPORT_COLUMNS = ["id", "employee", "amount", "currency", "category", "description", "status",
+                  "base_amount", "fx_rate", "created_at"]
+EXPORT_FETCH_SIZE = int(os.getenv("EXPORT_FETCH_SIZE", 500))
+# seconds MySQL waits on a slow client before aborting an unbuffered result
+EXPORT_NET_WRITE_TIMEOUT = int(os.getenv("EXPORT_NET_WRITE_TIMEOUT", 600))
+
+def _export_value(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    return value
+
+def _sorted_votes(expense):
+    expense["votes"] = [vote for _, vote in sorted(expense["votes"], key=lambda v: v[0])]
+    return expense
+
+async def stream_export_rows(sql, params, include_votes):
+    """
+    Yields one dict per expense from a server-side (unbuffered) cursor, EXPORT_FETCH_SIZE
+    rows at a time. With include_votes the query is a LEFT JOIN ordered by expense only
+    (so the index on created_at still serves the sort), and consecutive rows of the same
+    expense are folded into its "votes" list, sorted here by (seq, vote id).
+    """
+    async with get_async_db() as conn:
+        cur = await conn.cursor(SSDictCursor)
+        finished = False
+        try:
+            await cur.execute("SET SESSION net_write_timeout = %s", (EXPORT_NET_WRITE_TIMEOUT,))
+            await cur.execute(sql, params)
+            current = None
+            while True:
+                rows = await cur.fetchmany(EXPORT_FETCH_SIZE)
+                if not rows:
+                    break
+                for row in rows:
+                    if not include_votes:
+                        yield {c: _export_value(row[c]) for c in EXPORT_COLUMNS}
+                        continue
+                    if current is None or current["id"] != row["id"]:
+                        if current is not None:
+                            yield _sorted_votes(current)
+                        current = {c: _export_value(row[c]) for c in EXPORT_COLUMNS}
+                        current["votes"] = []
+                    if row["approver"] is not None:
+                        current["votes"].append(((row["seq"], row["vote_id"]),
+                                                 {"approver": row["approver"], "seq": row["seq"],
+                                                  "decision": row["decision"],
+                                                  "decided_at": _export_value(row["decided_at"]),
+                                                  "comment": row["comment"]}))
+            if current is not None:
+                yield _sorted_votes(current)
+            finished = True
+        finally:
+            if finished:
+                await cur.close()
+                async with conn.cursor() as reset:
+                    await reset.execute("SET SESSION net_write_timeout = DEFAULT")
+            else:
+                # the client went away with rows still unread; dropping the connection is
+                # cheaper than draining the rest of the result set
+                conn.close()
+
+async def csv_lines(rows, include_votes):
+    columns = EXPORT_COLUMNS + (["votes"] if include_votes else [])
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(columns)
+    count = 0
+    try:
+        async for row in rows:
+            if include_votes:
+                row["votes"] = json.dumps(row["votes"])
+            writer.writerow([row[c] for c in columns])
+            count += 1
+            if count % EXPORT_FETCH_SIZE == 0:
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+        yield buf.getvalue()
+    finally:
+        await rows.aclose()
 
-    if username in approvers:
-        approvers.remove(username)
+async def ndjson_lines(rows):
+    try:
+        async for row in rows:
+            yield json.dumps(row) + "\n"
+    finally:
+        await rows.aclose()
+
+@router.get("/export", summary="Export expenses as CSV or NDJSON (streamed)")
+async def export_expenses(
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    include_votes: bool = False,
+    status: Optional[str] = None,
+    category: Optional[str] = None,
+    employee: Optional[str] = None,
+    date_from: Optional[datetime.date] = None,
+    date_to: Optional[datetime.date] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    min_base_amount: Optional[float] = None,
+    max_base_amount: Optional[float] = None,
+    current_user: dict = Depends(get_current_user),
+):
+    """Same filters and visibility as GET /expenses, oldest first, without pagination."""
+    where, params = build_expense_filters(current_user, status, category, employee,
+                                          date_from, date_to, min_amount, max_amount,
+                                          min_base_amount, max_base_amount)
+    columns = ", ".join(f"expenses.{c}" for c in EXPORT_COLUMNS)
+    if include_votes:
+        sql = (f"SELECT {columns}, ea.id AS vote_id, ea.approver, ea.seq, ea.decision, ea.decided_at, ea.comment"
+               " FROM expenses LEFT JOIN expense_approvers ea ON ea.expense_id = expenses.id")
+    else:
+        sql = f"SELECT {columns} FROM expenses"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY expenses.created_at, expenses.id"
+
+    rows = stream_export_rows(sql, tuple(params), include_votes)
+    stamp = datetime.datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+    if format == "csv":
+        body, media_type = csv_lines(rows, include_votes), "text/csv"
+    else:
+        body, media_type = ndjson_lines(rows), "application/x-ndjson"
+    return StreamingResponse(body, media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="expenses-{stamp}.{format}"'})
 
-    new_status = exp["status"]
-    if not approvers:
-        new_status = "approved"
+# ---------------------------------
+# GET /expenses/inbox — my pending approvals
+# ---------------------------------
+@router.get("/inbox", summary="Expenses waiting on my decision")
+async def get_inbox(
+    session: Session,
+    cursor: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=200),
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Served from the (approver, decision, expense_id) index on expense_approvers,
+    so the cost depends on the caller's pending work, not on the size of expenses.
+    Expenses whose rule names the caller's role as specific approver have no row
+    there; they come from approval_state (specific_approver, expense_id) instead,
+    with seq 0. `cursor` is the last expense id of the previous page.
+    """
+    username, role = current_user["username"], current_user["role"]
+    assigned = """
+        SELECT e.id, e.employee, e.amount, e.currency, e.category, e.description, e.status,
+               e.created_at, ea.seq
+        FROM expense_approvers ea JOIN expenses e ON e.id = ea.expense_id
+        WHERE ea.approver=%s AND ea.decision='pending'
+    """
+    by_role = f"""
+        SELECT e.id, e.employee, e.amount, e.currency, e.category, e.description, e.status,
+               e.created_at, 0 AS seq
+        FROM approval_state s JOIN expenses e ON e.id = s.expense_id
+        WHERE {repository.SPECIFIC_PENDING_WHERE}
+    """
+    assigned_params, role_params = [username], [role, username]
+    if cursor:
+        assigned += " AND ea.expense_id < %s"
+        assigned_params.append(cursor)
+        by_role += " AND s.expense_id < %s"
+        role_params.append(cursor)
+    # each branch stops after one page on its own index, then the pages are merged
+    sql = (f"({assigned} ORDER BY ea.expense_id DESC LIMIT %s) UNION ALL"
+           f" ({by_role} ORDER BY s.expense_id DESC LIMIT %s) ORDER BY id DESC LIMIT %s")
+    params = [*assigned_params, limit + 1, *role_params, limit + 1, limit + 1]
+
+    async with session.cursor() as cur:
+        pending = (await repository.fetch_one(cur, repository.INBOX_PENDING_COUNT, (username,)))["pending"]
+        pending += (await repository.fetch_one(cur, repository.SPECIFIC_PENDING_COUNT, (role, username)))["pending"]
+        rows = await repository.fetch_all(cur, sql, tuple(params))
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1]["id"]
+    return {"items": rows, "next_cursor": next_cursor, "pending": pending}
 
-    cur.execute("UPDATE expenses SET status=%s, approvers=%s, comments=%s, votes=%s WHERE id=%s",
-                (new_status, json.dumps(approvers), json.dumps(comments), json.dumps(votes), expense_id))
-    conn.commit()
-    cur.close()
-    conn.close()
-    return {"msg": "Expense approved", "status": new_status, "remaining": approvers}
+# ---------------------------------
+# Helper: Approve / reject inside a transaction
+# ---------------------------------
+async def apply_decision(session, cur, expense_id, current_user, decision, comment):
+    """decision: 'approved' | 'rejected'. Settles the expense once its rule is decided."""
+    with profiler.span("record_decision"):
+        exp, state, outcome = await record_decision(cur, expense_id, current_user, decision, comment)
+    recipients, roles = [exp["employee"], current_user["username"]], []
+    if outcome:
+        if events.listening():
+            recipients += [r["approver"] for r in await repository.fetch_all(cur, repository.PENDING_APPROVERS,
+                                                                             (expense_id,))]
+            roles = specific_roles(state, recipients)
+        # nobody else needs to vote on a decided expense
+        await cur.execute(repository.SKIP_PENDING_APPROVERS, (expense_id,))
+        await cur.execute(repository.SET_EXPENSE_STATUS, (outcome, expense_id))
+        await cur.execute(repository.DELETE_APPROVAL_STATE, (expense_id,))
+        await rollups.record_status_change(cur, expense_id, exp["status"], outcome)
+    status = outcome or exp["status"]
+    notify(session, f"expense.{outcome}" if outcome else "expense.vote", [expense_id], status, recipients, roles)
+    return {"status": status, "rule": state["rule_type"], "approved_votes": state["approved"],
+            "rejected_votes": state["rejected"], "total_approvers": state["total"]}
+
+# ---------------------------------
+# POST /approve
+# ---------------------------------
+@router.post("/{expense_id}/approve", summary="Approve an expense")
+async def approve_expense(expense_id: int, session: Session, comment: str = Body(None),
+                          current_user: dict = Depends(get_current_user)):
+    await session.begin()
+    async with session.cursor() as cur:
+        result = await apply_decision(session, cur, expense_id, current_user, "approved", comment or "Approved")
+    return {"msg": "Expense approved" if result["status"] == "approved" else "Approval recorded", **result}
 
 # ---------------------------------
 # POST /reject
 # ---------------------------------
 @router.post("/{expense_id}/reject", summary="Reject an expense")
-def reject_expense(expense_id: int, comment: str = Body(None), current_user: dict = Depends(get_current_user)):
-    conn = get_db()
-    cur = conn.cursor(dictionary=True)
-
-    cur.execute("SELECT * FROM expenses WHERE id=%s", (expense_id,))
-    exp = cur.fetchone()
-    if not exp:
-        raise HTTPException(status_code=404, detail="Expense not found")
-
-    approvers = json.loads(exp["approvers"]) if exp.get("approvers") else []
-    comments = json.loads(exp["comments"]) if exp.get("comments") else []
-    votes = json.loads(exp["votes"]) if exp.get("votes") else []
+async def reject_expense(expense_id: int, session: Session, comment: str = Body(None),
+                         current_user: dict = Depends(get_current_user)):
+    await session.begin()
+    async with session.cursor() as cur:
+        result = await apply_decision(session, cur, expense_id, current_user, "rejected", comment or "Rejected")
+    return {"msg": "Expense rejected" if result["status"] == "rejected" else "Rejection recorded", **result}
 
-    username = current_user["username"]
+# ---------------------------------
+# POST /expenses/bulk-decision — approve/reject many
+# ---------------------------------
+BULK_MAX_IDS = 500
+
+@router.post("/bulk-decision", summary="Approve or reject many expenses at once")
+async def bulk_decision(body: BulkDecision, session: Session, current_user: dict = Depends(get_current_user)):
+    """
+    Applies the same decision to every id in one transaction, running the same
+    authorization checks as the single approve/reject endpoints for each one.
+    A failing id is rolled back to its savepoint and reported; the others still commit.
+    """
+    if body.decision not in ("approve", "reject"):
+        raise HTTPException(status_code=400, detail="decision must be 'approve' or 'reject'")
+    expense_ids = list(dict.fromkeys(body.expense_ids))
+    if len(expense_ids) > BULK_MAX_IDS:
+        raise HTTPException(status_code=413, detail=f"At most {BULK_MAX_IDS} expenses per request")
+    if not expense_ids:
+        return {"applied": 0, "failed": 0, "results": []}
+    decision, default_comment = ("approved", "Approved") if body.decision == "approve" else ("rejected", "Rejected")
+
+    results = []
+    await session.begin()
+    async with session.cursor() as cur:
+        # lock every row up front in id order so two bulk requests cannot deadlock
+        placeholders = ",".join(["%s"] * len(expense_ids))
+        await cur.execute(f"SELECT id FROM expenses WHERE id IN ({placeholders}) ORDER BY id FOR UPDATE",
+                          tuple(expense_ids))
+        await cur.fetchall()
+        for expense_id in expense_ids:
+            await cur.execute("SAVEPOINT bulk_item")
+            try:
+                result = await apply_decision(session, cur, expense_id, current_user, decision,
+                                              body.comment or default_comment)
+                results.append({"expense_id": expense_id, "ok": True, **result})
+            except HTTPException as e:
+                await cur.execute("ROLLBACK TO SAVEPOINT bulk_item")
+                results.append({"expense_id": expense_id, "ok": False,
+                                "status_code": e.status_code, "error": e.detail})
 
-    if username not in approvers and current_user["role"] not in ("admin", "manager"):
-        raise HTTPException(status_code=403, detail="Not authorized")
+    applied = sum(1 for r in results if r["ok"])
+    return {"applied": applied, "failed": len(results) - applied, "results": results}
 
-    comments.append(f"{username}: {comment or 'Rejected'}")
-    votes.append({"user": username, "decision": "reject", "at": datetime.datetime.utcnow().isoformat()})
+# ---------------------------------
+# Receipts attached to an expense (files in receipt_store)
+# ---------------------------------
+async def get_visible_expense(cur, expense_id, current_user):
+    """The expense row if current_user may see it (same scoping as GET /expenses), else 404."""
+    where, params = build_expense_filters(current_user)
+    where.append("id = %s")
+    params.append(expense_id)
+    exp = await repository.fetch_one(cur, "SELECT id, employee, status FROM expenses WHERE " + " AND ".join(where),
+                                     tuple(params))
+    if not exp:
+        raise HTTPException(status_code=404, detail="Expense not found")
+    return exp
+
+@router.post("/{expense_id}/receipts", summary="Attach a receipt file to an expense")
+async def attach_receipt(expense_id: int, request: Request, background_tasks: BackgroundTasks, session: Session,
+                         current_user: dict = Depends(get_current_user)):
+    """
+    multipart/form-data with the receipt in field `file`. The body is read here, not
+    before the endpoint runs, and stored as it arrives (upload_stream.FilePart).
+    """
+    # reject obviously oversized bodies before reading any of them; chunked ones are checked while streaming
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > receipt_store.RECEIPT_MAX_BYTES + 64 * 1024:
+        raise HTTPException(status_code=413, detail=f"Receipt exceeds {receipt_store.RECEIPT_MAX_BYTES} bytes")
+
+    async with session.cursor() as cur:
+        exp = await get_visible_expense(cur, expense_id, current_user)
+    # the upload is received below, at the client's pace: give the connection back meanwhile
+    await session.close()
+    if exp["employee"] != current_user["username"] and current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Only the submitter can attach receipts")
+
+    upload = upload_stream.FilePart(request, "file")
+    try:
+        sha256, size, content_type = await receipt_store.save(upload.chunks())
+    except receipt_store.TooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except upload_stream.BadUpload as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    cur.execute("UPDATE expenses SET status=%s, approvers=%s, comments=%s, votes=%s WHERE id=%s",
-                ("rejected", json.dumps([]), json.dumps(comments), json.dumps(votes), expense_id))
-    conn.commit()
-    cur.close()
-    conn.close()
-    return {"msg": "Expense rejected"}
\ No newline at end of file
+    await session.begin()
+    async with session.cursor() as cur:
+        await cur.execute(repository.INSERT_RECEIPT,
+                          (expense_id, upload.filename, sha256, size, content_type, current_user["username"]))
+        receipt_id = cur.lastrowid
+        await cur.execute(repository.SET_RECEIPT_URL, (f"/receipts/{receipt_id}", receipt_id))
+
+    background_tasks.add_task(receipt_store.make_thumbnail, sha256)
+    return {"id": receipt_id, "expense_id": expense_id, "filename": upload.filename, "url": f"/receipts/{receipt_id}",
+            "sha256": sha256, "size_bytes": size, "content_type": content_type}
+
+@router.get("/{expense_id}/receipts", summary="List receipts of an expense")
+async def list_receipts(expense_id: int, session: Session, current_user: dict = Depends(get_current_user)):
+    async with session.cursor() as cur:
+        await get_visible_expense(cur, expense_id, current_user)
+        return await repository.fetch_all(cur, repository.RECEIPTS_OF_EXPENSE, (expense_id,))
@@ -0,0 +1,41 @@
+# api/receipts.py
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse
+from api.auth import get_current_user
+from api.expenses import get_visible_expense
+from database import Session
+import os
+import receipt_store
+import repository
+
+router = APIRouter(prefix="/receipts", tags=["receipts"])
+
+async def load_receipt(session, receipt_id, current_user):
+    async with session.cursor() as cur:
+        receipt = await repository.fetch_one(cur, repository.RECEIPT_FILE, (receipt_id,))
+        if not receipt or not receipt["sha256"]:
+            raise HTTPException(status_code=404, detail="Receipt not found")
+        await get_visible_expense(cur, receipt["expense_id"], current_user)
+    return receipt
+
+@router.get("/{receipt_id}", summary="Download a receipt (supports Range requests)")
+async def download_receipt(receipt_id: int, session: Session, current_user: dict = Depends(get_current_user)):
+    receipt = await load_receipt(session, receipt_id, current_user)
+    path = receipt_store.path_for(receipt["sha256"])
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Receipt file missing")
+    # only allowlisted types are rendered by the browser, anything else is a download;
+    # nosniff stops the browser from second-guessing the type (e.g. HTML in a "PNG")
+    inline = receipt["content_type"] in receipt_store.CONTENT_TYPES
+    # FileResponse streams from disk in chunks and answers Range / If-Range itself
+    return FileResponse(path, media_type=receipt["content_type"] if inline else receipt_store.UNKNOWN_TYPE,
+                        filename=receipt["filename"], content_disposition_type="inline" if inline else "attachment",
+                        headers={"X-Content-Type-Options": "nosniff"})
+
+@router.get("/{receipt_id}/thumbnail", summary="Receipt thumbnail (images only)")
+async def receipt_thumbnail(receipt_id: int, session: Session, current_user: dict = Depends(get_current_user)):
+    receipt = await load_receipt(session, receipt_id, current_user)
+    path = receipt_store.thumbnail_path(receipt["sha256"])
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="No thumbnail for this receipt")
+    return FileResponse(path, media_type="image/jpeg", headers={"X-Content-Type-Options": "nosniff"})
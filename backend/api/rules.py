@@ -1,101 +1,123 @@
 # api/rules.py
 from fastapi import APIRouter, Depends, HTTPException
-from database import get_db
-from models import RuleCreate
+from database import Session
+from models import RuleCreate, ConditionalRuleCreate
 from api.auth import get_current_user
 
+import approval_rules
 import json
+import repository
+import rule_cache
 
 router = APIRouter(prefix="/rules", tags=["rules"])
 
 def admin_only(user):
     return user.get("role") == "admin"
 
+def checked_type(rule: RuleCreate):
+    """The normalized rule type; 400 when the rule cannot be evaluated."""
+    error = approval_rules.validate(rule.type, rule.threshold, rule.approvers, rule.specific_approver, rule.seq)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
+    return approval_rules.normalize_type(rule.type)
+
+def parse_json_fields(r):
+    for key in ("approvers", "seq"):
+        try:
+            r[key] = json.loads(r[key]) if r.get(key) else []
+        except:
+            r[key] = []
+    return r
+
 @router.post("/", summary="Create an approval rule (admin)")
-def create_rule(rule: RuleCreate, current_user: dict = Depends(get_current_user)):
+async def create_rule(rule: RuleCreate, session: Session, current_user: dict = Depends(get_current_user)):
     if not admin_only(current_user):
         raise HTTPException(status_code=403, detail="Admin only")
-    conn = get_db()
-    cur = conn.cursor()
-    try:
-        cur.execute("""
-            INSERT INTO rules (name, type, threshold, approvers, specific_approver, is_active)
-            VALUES (%s, %s, %s, %s, %s, %s)
-        """, (rule.name, rule.type, rule.threshold, json.dumps(rule.approvers or []), rule.specific_approver, int(rule.is_active)))
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise HTTPException(status_code=400, detail=str(e))
-    finally:
-        cur.close()
-        conn.close()
+    rule_type = checked_type(rule)
+    async with session.cursor() as cur:
+        try:
+            await cur.execute(repository.INSERT_RULE, repository.rule_params(rule, rule_type))
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    rule_cache.invalidate()
     return {"msg": "Rule created"}
 
 @router.get("/", summary="List rules (admin)")
-def list_rules(current_user: dict = Depends(get_current_user)):
+async def list_rules(session: Session, current_user: dict = Depends(get_current_user)):
     if not admin_only(current_user):
         raise HTTPException(status_code=403, detail="Admin only")
-    conn = get_db()
-    cur = conn.cursor(dictionary=True)
-    cur.execute("SELECT * FROM rules")
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
-    # parse JSON fields
-    for r in rows:
-        if r.get("approvers"):
-            try:
-                r["approvers"] = json.loads(r["approvers"])
-            except:
-                r["approvers"] = []
-    return rows
+    async with session.cursor() as cur:
+        rows = await repository.fetch_all(cur, repository.LIST_RULES)
+    return [parse_json_fields(r) for r in rows]
+
+# Conditional rules are declared before /{rule_id} so "conditional" is not parsed as an id
+@router.post("/conditional", summary="Create a conditional approval rule (admin)")
+async def create_conditional_rule(rule: ConditionalRuleCreate, session: Session,
+                                  current_user: dict = Depends(get_current_user)):
+    if not admin_only(current_user):
+        raise HTTPException(status_code=403, detail="Admin only")
+    if rule.condition_field not in ("amount", "category") or rule.operator not in (">", "<", "=", "=="):
+        raise HTTPException(status_code=400, detail="Unsupported condition")
+    if rule.condition_field == "category" and rule.operator not in ("=", "=="):
+        raise HTTPException(status_code=400, detail="Category rules only support '='")
+    if rule.condition_field == "amount":
+        try:
+            float(rule.value)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Amount rules need a numeric value")
+    async with session.cursor() as cur:
+        try:
+            await cur.execute(repository.INSERT_CONDITIONAL_RULE,
+                              (rule.name, rule.condition_field, rule.operator, rule.value, rule.approver))
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    rule_cache.invalidate()
+    return {"msg": "Conditional rule created"}
+
+@router.get("/conditional", summary="List conditional rules (admin)")
+async def list_conditional_rules(session: Session, current_user: dict = Depends(get_current_user)):
+    if not admin_only(current_user):
+        raise HTTPException(status_code=403, detail="Admin only")
+    async with session.cursor() as cur:
+        return await repository.fetch_all(cur, repository.LIST_CONDITIONAL_RULES)
+
+@router.delete("/conditional/{rule_id}", summary="Delete conditional rule (admin)")
+async def delete_conditional_rule(rule_id: int, session: Session, current_user: dict = Depends(get_current_user)):
+    if not admin_only(current_user):
+        raise HTTPException(status_code=403, detail="Admin only")
+    async with session.cursor() as cur:
+        await cur.execute(repository.DELETE_CONDITIONAL_RULE, (rule_id,))
+    rule_cache.invalidate()
+    return {"msg": "Conditional rule deleted"}
 
 @router.get("/{rule_id}", summary="Get rule by id (admin)")
-def get_rule(rule_id: int, current_user: dict = Depends(get_current_user)):
+async def get_rule(rule_id: int, session: Session, current_user: dict = Depends(get_current_user)):
     if not admin_only(current_user):
         raise HTTPException(status_code=403, detail="Admin only")
-    conn = get_db()
-    cur = conn.cursor(dictionary=True)
-    cur.execute("SELECT * FROM rules WHERE id = %s", (rule_id,))
-    r = cur.fetchone()
-    cur.close()
-    conn.close()
+    async with session.cursor() as cur:
+        r = await repository.fetch_one(cur, repository.RULE_BY_ID, (rule_id,))
     if not r:
         raise HTTPException(status_code=404, detail="Rule not found")
-    try:
-        r["approvers"] = json.loads(r["approvers"]) if r.get("approvers") else []
-    except:
-        r["approvers"] = []
-    return r
+    return parse_json_fields(r)
 
 @router.put("/{rule_id}", summary="Update rule (admin)")
-def update_rule(rule_id: int, rule: RuleCreate, current_user: dict = Depends(get_current_user)):
+async def update_rule(rule_id: int, rule: RuleCreate, session: Session, current_user: dict = Depends(get_current_user)):
     if not admin_only(current_user):
         raise HTTPException(status_code=403, detail="Admin only")
-    conn = get_db()
-    cur = conn.cursor()
-    try:
-        cur.execute("""
-            UPDATE rules SET name=%s, type=%s, threshold=%s, approvers=%s, specific_approver=%s, is_active=%s
-            WHERE id=%s
-        """, (rule.name, rule.type, rule.threshold, json.dumps(rule.approvers or []), rule.specific_approver, int(rule.is_active), rule_id))
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise HTTPException(status_code=400, detail=str(e))
-    finally:
-        cur.close()
-        conn.close()
+    rule_type = checked_type(rule)
+    async with session.cursor() as cur:
+        try:
+            await cur.execute(repository.UPDATE_RULE, (*repository.rule_params(rule, rule_type), rule_id))
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    rule_cache.invalidate()
     return {"msg": "Rule updated"}
 
 @router.delete("/{rule_id}", summary="Delete rule (admin)")
-def delete_rule(rule_id: int, current_user: dict = Depends(get_current_user)):
+async def delete_rule(rule_id: int, session: Session, current_user: dict = Depends(get_current_user)):
     if not admin_only(current_user):
         raise HTTPException(status_code=403, detail="Admin only")
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM rules WHERE id = %s", (rule_id,))
-    conn.commit()
-    cur.close()
-    conn.close()
-    return {"msg": "Rule deleted"}
\ No newline at end of file
+    async with session.cursor() as cur:
+        await cur.execute(repository.DELETE_RULE, (rule_id,))
+    rule_cache.invalidate()
+    return {"msg": "Rule deleted"}
@@ -1,8 +1,10 @@
 # api/users.py
 from fastapi import APIRouter, Depends, HTTPException
-from api.auth import get_current_user, get_password_hash
-from database import get_db
-from models import UserCreate
+from api.auth import get_current_user, get_password_hash, invalidate_identity
+from database import Session
+from models import UserCreate, UserUpdate
+import hierarchy
+import repository
 
 router = APIRouter(prefix="/users", tags=["users"])
 
@@ -10,44 +12,56 @@ def is_admin(user: dict):
     return user.get("role") == "admin"
 
 @router.post("/", summary="Create user (admin only)")
-def create_user(user_in: UserCreate, current_user: dict = Depends(get_current_user)):
+async def create_user(user_in: UserCreate, session: Session, current_user: dict = Depends(get_current_user)):
     if not is_admin(current_user):
         raise HTTPException(status_code=403, detail="Admin only")
-    conn = get_db()
-    cur = conn.cursor()
-    hashed = get_password_hash(user_in.password)
-    try:
-        cur.execute("INSERT INTO users (username, password, role, manager) VALUES (%s, %s, %s, %s)",
-                    (user_in.username, hashed, user_in.role, user_in.manager))
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise HTTPException(status_code=400, detail=str(e))
-    finally:
-        cur.close()
-        conn.close()
+    hashed = await get_password_hash(user_in.password)
+    async with session.cursor() as cur:
+        try:
+            await repository.insert_user(cur, user_in.username, hashed, user_in.role, user_in.manager)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    hierarchy.invalidate()
     return {"msg": "User created by admin"}
 
 @router.get("/", summary="List users (admin only)")
-def list_users(current_user: dict = Depends(get_current_user)):
+async def list_users(session: Session, current_user: dict = Depends(get_current_user)):
     if not is_admin(current_user):
         raise HTTPException(status_code=403, detail="Admin only")
-    conn = get_db()
-    cur = conn.cursor(dictionary=True)
-    cur.execute("SELECT id, username, role, manager, created_at FROM users")
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
-    return rows
+    async with session.cursor() as cur:
+        return await repository.fetch_all(cur, repository.LIST_USERS)
+
+@router.patch("/{username}", summary="Change role / manager (admin only)")
+async def update_user(username: str, user_in: UserUpdate, session: Session,
+                      current_user: dict = Depends(get_current_user)):
+    if not is_admin(current_user):
+        raise HTTPException(status_code=403, detail="Admin only")
+    fields = user_in.model_dump(exclude_unset=True)
+    if not fields:
+        raise HTTPException(status_code=400, detail="Nothing to update")
+    async with session.cursor() as cur:
+        if not await repository.fetch_one(cur, repository.USER_EXISTS, (username,)):
+            raise HTTPException(status_code=404, detail="User not found")
+        try:
+            await repository.update_user_fields(cur, username, fields)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    hierarchy.invalidate()
+    invalidate_identity(username)
+    return {"msg": "User updated"}
 
 @router.delete("/{username}", summary="Delete user (admin only)")
-def delete_user(username: str, current_user: dict = Depends(get_current_user)):
+async def delete_user(username: str, session: Session, current_user: dict = Depends(get_current_user)):
     if not is_admin(current_user):
         raise HTTPException(status_code=403, detail="Admin only")
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM users WHERE username = %s", (username,))
-    conn.commit()
-    cur.close()
-    conn.close()
-    return {"msg": "User deleted"}
\ No newline at end of file
+    async with session.cursor() as cur:
+        await cur.execute(repository.DELETE_USER, (username,))
+    hierarchy.invalidate()
+    invalidate_identity(username)
+    return {"msg": "User deleted"}
+
+@router.get("/{username}/reports", summary="Everyone reporting to a manager (admin or self)")
+async def list_reports(username: str, recursive: bool = True, current_user: dict = Depends(get_current_user)):
+    if not is_admin(current_user) and current_user["username"] != username:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return {"manager": username, "reports": await hierarchy.get_reports(username, recursive=recursive)}
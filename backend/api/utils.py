@@ -1,11 +1,15 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Query
 from api.auth import get_current_user
 from dotenv import load_dotenv
-import os
-import requests
+from models import ConversionRequest, CURRENCY_CODE
+from typing import List
+import asyncio
 import io
+import fx
 from PIL import Image
-import pytesseract
+from workers import PoolBusy
+import ocr
+import ocr_jobs
 
 load_dotenv()
 router = APIRouter(prefix="/utils", tags=["utils"])
@@ -15,60 +19,99 @@ router = APIRouter(prefix="/utils", tags=["utils"])
 async def ocr_receipt(file: UploadFile = File(...), current_user: dict = Depends(get_current_user)):
     try:
         contents = await file.read()
-        image = Image.open(io.BytesIO(contents))
+        Image.open(io.BytesIO(contents))
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Could not read image: {str(e)}")
 
-    # Try to use pytesseract; if not installed/configured, instruct user
+    # Recognition runs in the OCR process pool; if tesseract is missing, instruct user
     try:
-        text = pytesseract.image_to_string(image)
+        text = await ocr.recognize(contents)
+    except PoolBusy:
+        raise HTTPException(status_code=503, detail="OCR queue is full, please retry", headers={"Retry-After": "5"})
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail=f"OCR timed out after {ocr.OCR_TIMEOUT:g} seconds; "
+                                                    "try a smaller image or POST /utils/ocr/jobs")
     except Exception as e:
         # return helpful message to user if pytesseract/tesseract not available
         raise HTTPException(status_code=500, detail="OCR not available on server. Install Tesseract and pytesseract. Error: " + str(e))
 
-    # Very simple parse heuristics: you can extend with regexes to capture amount, date, vendor
-    # Here we return raw text plus placeholder parsed fields
-    parsed = {
-        "raw_text": text,
-        "amount": None,
-        "date": None,
-        "possible_descriptions": text.splitlines()[:8]
-    }
-    return parsed
+    return ocr.parse(text)
+
+@router.get("/ocr/stats")
+async def ocr_stats(current_user: dict = Depends(get_current_user)):
+    return dict(ocr.stats(), jobs=await ocr_jobs.stats())
+
+# Job-based OCR: submit returns immediately, poll (or wait on) the job for the result
+@router.post("/ocr/jobs", status_code=202)
+async def submit_ocr_job(file: UploadFile = File(...), current_user: dict = Depends(get_current_user)):
+    try:
+        contents = await file.read()
+        Image.open(io.BytesIO(contents))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not read image: {str(e)}")
+    try:
+        job_id = await ocr_jobs.submit(contents, current_user["username"])
+    except ocr_jobs.QueueFull:
+        raise HTTPException(status_code=503, detail="OCR job queue is full, please retry", headers={"Retry-After": "30"})
+    return {"job_id": job_id, "status": "queued"}
+
+@router.get("/ocr/jobs/{job_id}")
+async def get_ocr_job(job_id: str, wait: float = Query(0, ge=0, le=30),
+                      current_user: dict = Depends(get_current_user)):
+    """Job status; with ?wait=N, blocks up to N seconds for the job to finish."""
+    found = await ocr_jobs.wait(job_id, wait)
+    if found is None or (found[0] != current_user["username"] and current_user["role"] != "admin"):
+        raise HTTPException(status_code=404, detail="OCR job not found")
+    return found[1]
 
 # Currency conversion proxy
 @router.get("/convert")
-def convert_currency(amount: float, from_currency: str, to_currency: str):
+async def convert_currency(amount: float, from_currency: str = Query(..., pattern=CURRENCY_CODE),
+                           to_currency: str = Query(..., pattern=CURRENCY_CODE)):
     """
-    Uses EXCHANGE_API_URL from env. Example provider: exchangerate-api or others.
-    This function expects a URL like 'https://api.exchangerate-api.com/v4/latest'
-    which expects base appended: /{BASE}
+    Rates come from fx.py (cached per base currency, provider chosen by FX_PROVIDER).
+    With the default http provider, EXCHANGE_API_URL is expected to look like
+    'https://api.exchangerate-api.com/v4/latest', with the base appended: /{BASE}
     """
-    EXCHANGE_API_URL = os.getenv("EXCHANGE_API_URL", "")
-    API_KEY = os.getenv("EXCHANGE_API_KEY", "")
-    if not EXCHANGE_API_URL:
-        raise HTTPException(status_code=500, detail="Exchange API URL not configured in .env")
-
-    # Some APIs expect base appended, some need query param; adapt as needed.
-    url = f"{EXCHANGE_API_URL}/{from_currency}"
-    headers = {}
-    params = {}
-    if API_KEY:
-        # for providers using header auth
-        headers["apikey"] = API_KEY
-        # or use params['access_key'] = API_KEY depending on provider
     try:
-        resp = requests.get(url, headers=headers, params=params, timeout=10)
-        resp.raise_for_status()
-        data = resp.json()
-        # try to find rates in common formats
-        rates = data.get("rates") or data.get("conversion_rates") or {}
-        if to_currency not in rates:
-            raise HTTPException(status_code=400, detail=f"Target currency {to_currency} not found in rates")
-        rate = rates[to_currency]
-        converted = float(amount) * float(rate)
-        return {"amount": amount, "from": from_currency, "to": to_currency, "rate": rate, "converted": converted}
-    except HTTPException:
-        raise
+        rate = await fx.get_rate(from_currency, to_currency)
+    except KeyError:
+        raise HTTPException(status_code=400, detail=f"Target currency {to_currency} not found in rates")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Currency conversion failed: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Currency conversion failed: {str(e)}")
+    converted = float(amount) * rate
+    return {"amount": amount, "from": from_currency, "to": to_currency, "rate": rate, "converted": converted}
+
+CONVERT_BATCH_MAX_ITEMS = 500
+
+@router.post("/convert/batch")
+async def convert_currency_batch(items: List[ConversionRequest], current_user: dict = Depends(get_current_user)):
+    """Converts many (amount, from, to) tuples; each base currency's rates are fetched at most once."""
+    if len(items) > CONVERT_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {CONVERT_BATCH_MAX_ITEMS} items per batch")
+    bases = list({item.from_currency for item in items})
+    tables = await asyncio.gather(*(fx.get_rates(b) for b in bases), return_exceptions=True)
+    rates_by_base = dict(zip(bases, tables))
+
+    results = []
+    for item in items:
+        rates = rates_by_base[item.from_currency]
+        if item.from_currency == item.to_currency:
+            rate = 1.0
+        elif isinstance(rates, Exception):
+            results.append({"ok": False, "error": f"Currency conversion failed: {rates}"})
+            continue
+        elif item.to_currency not in rates:
+            results.append({"ok": False, "error": f"Target currency {item.to_currency} not found in rates"})
+            continue
+        else:
+            rate = float(rates[item.to_currency])
+        results.append({"ok": True, "amount": item.amount, "from": item.from_currency, "to": item.to_currency,
+                        "rate": rate, "converted": float(item.amount) * rate})
+    return {"results": results}
+
+@router.get("/convert/stats")
+async def convert_cache_stats(current_user: dict = Depends(get_current_user)):
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    return fx.cache_stats()
@@ -0,0 +1,131 @@
+# approval_rules.py
+"""
+Approval rule evaluation, one vote at a time.
+
+Every pending expense has an approval_state row (see database_setup.py),
+deleted once the expense is decided. It holds a copy of the rule the expense
+was submitted under, so editing a rule does not change expenses already in
+flight. It also holds the number of assigned approvers, running approve /
+reject counters and, for sequence rules, the seq of the approver whose turn it
+is. A vote updates the counters and resolves the expense in constant time,
+without reading the vote history.
+
+Rule types:
+  all         no rule: every assigned approver must approve; a rejection rejects
+  percentage  approved once threshold % of the assigned approvers approved,
+              rejected once that can no longer happen
+  specific    decided by specific_approver, a username or a role (any user
+              with that role may decide)
+  hybrid      approved by the percentage or by specific_approver; rejected once
+              the percentage is out of reach and specific_approver rejected
+  sequence    assigned approvers vote in seq order; all must approve, a
+              rejection rejects
+
+Admins, managers and the specific approver may vote on an expense they are
+not assigned to (seq 0). Everyone votes at most once per expense. A role named as specific approver gets no approver
+rows; its holders vote this way. Such a vote counts when the voter is the
+specific approver. Otherwise a rejection rejects the expense outright, and an
+approval is only recorded.
+"""
+RULE_TYPES = ("percentage", "specific", "hybrid", "sequence")
+TYPE_ALIASES = {"sequential": "sequence"}
+
+class OutOfTurn(Exception):
+    pass
+
+class AlreadyVoted(Exception):
+    pass
+
+def normalize_type(rule_type):
+    rule_type = (rule_type or "").strip().lower()
+    return TYPE_ALIASES.get(rule_type, rule_type)
+
+def validate(rule_type, threshold, approvers, specific_approver, seq):
+    """Error message for an inconsistent rule definition, or None."""
+    rule_type = normalize_type(rule_type)
+    if rule_type not in RULE_TYPES:
+        return f"type must be one of {', '.join(RULE_TYPES)}"
+    if rule_type in ("percentage", "hybrid") and (threshold is None or not 1 <= threshold <= 100):
+        return f"{rule_type} rules need a threshold between 1 and 100"
+    if rule_type in ("specific", "hybrid") and not specific_approver:
+        return f"{rule_type} rules need a specific_approver"
+    if rule_type == "sequence" and not (seq or approvers):
+        return "sequence rules need seq (or approvers) in approval order"
+    return None
+
+def approval_order(rule):
+    """The rule's own approvers, in the order they are assigned to an expense."""
+    if normalize_type(rule.get("type")) == "sequence" and rule.get("seq"):
+        return list(rule["seq"])
+    return list(rule.get("approvers") or [])
+
+def initial_state(rule, total):
+    """approval_state values for a new expense with `total` assigned approvers."""
+    state = {"rule_id": None, "rule_type": "all", "threshold": None, "specific_approver": None,
+             "total": total, "approved": 0, "rejected": 0, "seq_pos": 1, "specific_decision": None}
+    if rule:
+        rule_type = normalize_type(rule.get("type"))
+        if validate(rule_type, rule.get("threshold"), rule.get("approvers"), rule.get("specific_approver"),
+                     rule.get("seq")) is None:
+            specific = rule.get("specific_approver") if rule_type in ("specific", "hybrid") else None
+            state.update(rule_id=rule.get("id"), rule_type=rule_type, threshold=rule.get("threshold"),
+                         specific_approver=specific)
+    return state
+
+def check_turn(state, seq, voted=False):
+    """
+    Raises AlreadyVoted when the voter has already decided the expense (`voted`): one
+    vote per person, assigned or not. Raises OutOfTurn when an assigned approver of a
+    sequence rule votes early.
+    """
+    if voted:
+        raise AlreadyVoted("You have already voted on this expense")
+    if state["rule_type"] == "sequence" and seq > 0 and seq != state["seq_pos"]:
+        raise OutOfTurn(f"Waiting for approver #{state['seq_pos']} of the sequence")
+
+def is_specific(state, username, role):
+    """True when the voter is the state's specific approver, by username or by role."""
+    specific = state["specific_approver"]
+    return bool(specific) and specific in (username, role)
+
+def _percentage_reached(state):
+    return state["approved"] * 100 >= state["threshold"] * state["total"]
+
+def _percentage_possible(state):
+    return (state["total"] - state["rejected"]) * 100 >= state["threshold"] * state["total"]
+
+def apply_vote(state, username, role, seq, approve):
+    """
+    Counts one vote into `state` (in place); seq is the voter's assigned position,
+    0 for a vote from outside the assigned approvers. Returns the expense's new
+    status, 'approved' or 'rejected', or None while the rule is undecided.
+    """
+    decision = "approved" if approve else "rejected"
+    assigned = seq > 0
+    specific = is_specific(state, username, role)
+    if assigned:
+        state[decision] += 1
+        if state["rule_type"] == "sequence":
+            state["seq_pos"] = seq + 1
+    if specific:
+        state["specific_decision"] = decision
+    elif not assigned and not approve:
+        return "rejected"
+
+    rule_type = state["rule_type"]
+    if rule_type == "percentage":
+        if _percentage_reached(state):
+            return "approved"
+        return None if _percentage_possible(state) else "rejected"
+    if rule_type == "specific":
+        return state["specific_decision"]
+    if rule_type == "hybrid":
+        if state["specific_decision"] == "approved" or _percentage_reached(state):
+            return "approved"
+        if state["specific_decision"] == "rejected" and not _percentage_possible(state):
+            return "rejected"
+        return None
+    # all / sequence
+    if state["rejected"]:
+        return "rejected"
+    return "approved" if state["approved"] >= state["total"] else None
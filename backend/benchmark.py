@@ -0,0 +1,246 @@
+# benchmark.py
+"""
+Load benchmark for the approval workflow.
+
+Drives login, create_expense, get_expenses and approve_expense at each
+concurrency level (--concurrency) and data volume (--volumes, expenses
+already in the table for the benchmark employees). It records throughput and
+p50/p95/p99 latency for every combination and writes one JSON file per run
+to --output-dir, named after the time and git commit, so runs can be compared
+across commits.
+
+approve_expense needs a pending expense per request. Before each level, the
+manager's queue is topped up to --approvals expenses (or --requests, if larger)
+outside the timed window; a level that uses them all up stops early and is
+marked "exhausted" rather than seeding while latencies are being recorded.
+
+By default the app runs in process (httpx over ASGI, the real lifespan and
+database pool). --url targets a running server instead. Either way the
+database is whatever MYSQL_* points at; use a scratch MySQL/MariaDB, since the
+run creates its own users (bench_<run>_*) and expenses.
+
+Usage:
+    python benchmark.py
+    python benchmark.py --concurrency 1,8,32,64 --volumes 0,10000,100000 --duration 20
+    python benchmark.py --url http://localhost:8000 --endpoints get_expenses,approve_expense
+"""
+from dotenv import load_dotenv
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+import uuid
+import httpx
+
+load_dotenv()
+
+ENDPOINTS = ("login", "create_expense", "get_expenses", "approve_expense")
+PASSWORD = "bench-password"
+SEED_CHUNK = 1000  # /expenses/batch accepts at most this many items
+
+class Exhausted(Exception):
+    """No pending expense left for approve_expense."""
+
+def percentile(ordered, pct):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+class Bench:
+    def __init__(self, client, run_id, employees):
+        self.client = client
+        self.manager = f"bench_{run_id}_mgr"
+        self.employees = [f"bench_{run_id}_emp{i}" for i in range(employees)]
+        self.tokens = {}
+        self.seeded = 0
+        self.approvable = []  # pending expense ids the manager can approve
+
+    # ---------------------------------
+    # Setup
+    # ---------------------------------
+    async def login(self, username):
+        resp = await self.client.post("/auth/login", data={"username": username, "password": PASSWORD})
+        resp.raise_for_status()
+        return resp.json()["access_token"]
+
+    def auth(self, username):
+        return {"Authorization": f"Bearer {self.tokens[username]}"}
+
+    async def setup(self):
+        users = [(self.manager, "manager", None)] + [(e, "employee", self.manager) for e in self.employees]
+        for username, role, manager in users:
+            resp = await self.client.post("/auth/signup", json={"username": username, "password": PASSWORD,
+                                                                "role": role, "manager": manager})
+            resp.raise_for_status()
+            self.tokens[username] = await self.login(username)
+
+    async def seed(self, volume):
+        """Adds expenses (spread over the employees) until the benchmark users own `volume` of them."""
+        while self.seeded < volume:
+            n = min(SEED_CHUNK, volume - self.seeded)
+            employee = self.employees[(self.seeded // SEED_CHUNK) % len(self.employees)]
+            items = [{"amount": 10 + i % 500, "currency": "USD", "category": ("travel", "meals", "office")[i % 3],
+                      "description": f"seed {self.seeded + i}"} for i in range(n)]
+            resp = await self.client.post("/expenses/batch", json=items, headers=self.auth(employee))
+            resp.raise_for_status()
+            self.approvable.extend(r["expense_id"] for r in resp.json()["results"] if r["ok"])
+            self.seeded += n
+
+    async def prepare(self, endpoint, needed):
+        """Seeds, before the timed window, whatever `needed` requests to `endpoint` will consume."""
+        if endpoint == "approve_expense" and len(self.approvable) < needed:
+            await self.seed(self.seeded + needed - len(self.approvable))
+
+    # ---------------------------------
+    # One request per endpoint
+    # ---------------------------------
+    async def call(self, endpoint, i):
+        employee = self.employees[i % len(self.employees)]
+        if endpoint == "login":
+            return await self.client.post("/auth/login", data={"username": employee, "password": PASSWORD})
+        if endpoint == "create_expense":
+            return await self.client.post("/expenses/", headers=self.auth(employee), json={
+                "amount": 42.5, "currency": "USD", "category": "meals", "description": "bench"})
+        if endpoint == "get_expenses":
+            user = self.manager if i % 2 else employee
+            return await self.client.get("/expenses/", params={"limit": 50}, headers=self.auth(user))
+        if endpoint == "approve_expense":
+            if not self.approvable:
+                raise Exhausted()
+            expense_id = self.approvable.pop()
+            return await self.client.post(f"/expenses/{expense_id}/approve", json="bench",
+                                          headers=self.auth(self.manager))
+        raise ValueError(endpoint)
+
+    async def measure(self, endpoint, concurrency, duration, max_requests):
+        latencies, errors, statuses, exhausted = [], 0, {}, False
+        deadline = time.perf_counter() + duration
+        counter = iter(range(max_requests or 10 ** 12))
+
+        async def worker():
+            nonlocal errors, exhausted
+            for i in counter:
+                if time.perf_counter() >= deadline:
+                    return
+                started = time.perf_counter()
+                try:
+                    resp = await self.call(endpoint, i)
+                    status = resp.status_code
+                except Exhausted:
+                    exhausted = True
+                    return
+                except httpx.HTTPError:
+                    status = "error"
+                latencies.append(time.perf_counter() - started)
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == "error" or status >= 400:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        ordered = sorted(latencies)
+        ms = lambda v: round(v * 1000, 2) if v is not None else None
+        return {
+            "endpoint": endpoint,
+            "concurrency": concurrency,
+            "requests": len(latencies),
+            "errors": errors,
+            "exhausted": exhausted,
+            "status_codes": {str(k): v for k, v in statuses.items()},
+            "duration_s": round(elapsed, 3),
+            "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+            "latency_ms": {
+                "p50": ms(percentile(ordered, 0.50)),
+                "p95": ms(percentile(ordered, 0.95)),
+                "p99": ms(percentile(ordered, 0.99)),
+                "max": ms(ordered[-1] if ordered else None),
+                "mean": ms(statistics.fmean(ordered) if ordered else None),
+            },
+        }
+
+async def run(args):
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout,
+                                   limits=httpx.Limits(max_connections=max(args.concurrency) * 2))
+        lifespan = None
+    else:
+        import main  # the app, with its real lifespan (database pool, worker pools)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench",
+                                   timeout=args.timeout)
+        lifespan = main.lifespan(main.app)
+
+    run_id = uuid.uuid4().hex[:8]
+    results = []
+    started_at = datetime.datetime.utcnow()
+    if lifespan is not None:
+        await lifespan.__aenter__()
+    try:
+        bench = Bench(client, run_id, args.employees)
+        await bench.setup()
+        for volume in args.volumes:
+            await bench.seed(volume)
+            for concurrency in args.concurrency:
+                for endpoint in args.endpoints:
+                    await bench.prepare(endpoint, max(args.approvals, args.requests))
+                    result = await bench.measure(endpoint, concurrency, args.duration, args.requests)
+                    result["volume"] = volume
+                    results.append(result)
+                    lat = result["latency_ms"]
+                    print(f"{endpoint:16} vol={volume:<8} c={concurrency:<4} {result['throughput_rps']:>9} req/s  "
+                          f"p50={lat['p50']}ms p95={lat['p95']}ms p99={lat['p99']}ms errors={result['errors']}"
+                          + (" (ran out of pending expenses, raise --approvals)" if result["exhausted"] else ""))
+    finally:
+        await client.aclose()
+        if lifespan is not None:
+            await lifespan.__aexit__(None, None, None)
+
+    commit = git_commit()
+    report = {
+        "meta": {
+            "run_id": run_id,
+            "git_commit": commit,
+            "started_at": started_at.isoformat() + "Z",
+            "target": args.url or "in-process",
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "settings": {k: v for k, v in vars(args).items() if k != "output_dir"},
+        },
+        "results": results,
+    }
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(args.output_dir, f"{started_at:%Y%m%d-%H%M%S}-{commit or 'nogit'}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {path}")
+
+def int_list(value):
+    return [int(v) for v in value.split(",") if v]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Approval workflow load benchmark")
+    parser.add_argument("--url", help="benchmark a running server instead of the app in process")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS),
+                        type=lambda v: [e for e in v.split(",") if e in ENDPOINTS])
+    parser.add_argument("--concurrency", default="1,8,32", type=int_list)
+    parser.add_argument("--volumes", default="0,10000", type=int_list, help="expenses in the table per level")
+    parser.add_argument("--duration", default=10.0, type=float, help="seconds per endpoint and level")
+    parser.add_argument("--requests", default=0, type=int, help="cap on requests per endpoint and level")
+    parser.add_argument("--approvals", default=5000, type=int,
+                        help="pending expenses seeded for approve_expense before each level")
+    parser.add_argument("--employees", default=10, type=int)
+    parser.add_argument("--timeout", default=30.0, type=float)
+    parser.add_argument("--output-dir", default="bench_results")
+    asyncio.run(run(parser.parse_args()))
@@ -1,7 +1,16 @@
 # database.py
 from dotenv import load_dotenv
+from contextvars import ContextVar
+from typing import Annotated
+import asyncio
+import contextlib
 import os
+import time
+import aiomysql
+from fastapi import Depends
 from mysql.connector import pooling
+import metrics
+import profiler
 
 load_dotenv()
 
@@ -14,10 +23,236 @@ dbconfig = {
     "use_unicode": True,
 }
 
-pool = pooling.MySQLConnectionPool(pool_name="mypool", pool_size=5, **dbconfig)
+# Pool sizing for the async pool used by the API (see get_async_db)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))          # connections kept open
+DB_POOL_OVERFLOW = int(os.getenv("DB_POOL_OVERFLOW", 10))  # extra connections under load
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 5))   # seconds to wait for a checkout
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))  # reconnect idle connections older than this
+DB_SYNC_POOL_SIZE = int(os.getenv("DB_SYNC_POOL_SIZE", 5))
+
+class _TimedCursorMixin:
+    """
+    Reports each execute to metrics.py and to the slow-request log in profiler.py
+    (for unbuffered cursors, the time to the first row).
+    """
+    _in_executemany = False
+
+    async def execute(self, query, args=None):
+        if self._in_executemany:
+            # executemany may fall back to one execute per row; it is timed as one query
+            return await super().execute(query, args)
+        started = time.perf_counter()
+        try:
+            return await super().execute(query, args)
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.record_query(elapsed)
+            profiler.record_query(query, elapsed)
+
+    async def executemany(self, query, args):
+        started = time.perf_counter()
+        self._in_executemany = True
+        try:
+            return await super().executemany(query, args)
+        finally:
+            self._in_executemany = False
+            elapsed = time.perf_counter() - started
+            metrics.record_query(elapsed)
+            profiler.record_query(query, elapsed, many=args)
+
+class Cursor(_TimedCursorMixin, aiomysql.Cursor):
+    pass
+
+class DictCursor(_TimedCursorMixin, aiomysql.DictCursor):
+    pass
+
+class SSDictCursor(_TimedCursorMixin, aiomysql.SSDictCursor):
+    pass
+
+class PoolTimeout(Exception):
+    """No connection became free within DB_POOL_TIMEOUT seconds."""
+
+# ---------------------------------
+# Sync pool (scripts: database_setup, data generation)
+# ---------------------------------
+pool = None
 
 def get_db():
     """
     Returns a connection from the pool. Caller must close cursor & conn.
     """
-    return pool.get_connection()
\ No newline at end of file
+    global pool
+    if pool is None:
+        pool = pooling.MySQLConnectionPool(pool_name="mypool", pool_size=DB_SYNC_POOL_SIZE, **dbconfig)
+    return pool.get_connection()
+
+# ---------------------------------
+# Async pool (API)
+# ---------------------------------
+async_pool = None
+_async_pool_lock = asyncio.Lock()
+
+pool_stats_counters = {
+    "in_use": 0,
+    "waiting": 0,
+    "checkouts": 0,
+    "timeouts": 0,
+    "checkout_seconds_total": 0.0,
+    "checkout_seconds_max": 0.0,
+}
+
+async def get_async_pool():
+    global async_pool
+    if async_pool is None:
+        async with _async_pool_lock:
+            if async_pool is None:
+                async_pool = await aiomysql.create_pool(
+                    host=dbconfig["host"], user=dbconfig["user"], password=dbconfig["password"],
+                    db=dbconfig["database"], charset=dbconfig["charset"],
+                    minsize=DB_POOL_SIZE, maxsize=DB_POOL_SIZE + DB_POOL_OVERFLOW,
+                    pool_recycle=DB_POOL_RECYCLE,
+                    # a connection released mid-transaction is closed by aiomysql, so reads run
+                    # in autocommit and writes open an explicit transaction with conn.begin()
+                    autocommit=True,
+                    cursorclass=Cursor,
+                )
+    return async_pool
+
+@contextlib.asynccontextmanager
+async def get_async_db():
+    """
+    async with get_async_db() as conn: ...
+    Checks out a connection, waiting at most DB_POOL_TIMEOUT seconds, and always releases it.
+    """
+    db_pool = await get_async_pool()
+    stats = pool_stats_counters
+    stats["waiting"] += 1
+    started = time.perf_counter()
+    try:
+        conn = await asyncio.wait_for(db_pool.acquire(), DB_POOL_TIMEOUT)
+    except asyncio.TimeoutError:
+        stats["timeouts"] += 1
+        raise PoolTimeout("Timed out waiting for a database connection")
+    finally:
+        stats["waiting"] -= 1
+    waited = time.perf_counter() - started
+    metrics.record_pool_wait(waited)
+    stats["checkouts"] += 1
+    stats["checkout_seconds_total"] += waited
+    stats["checkout_seconds_max"] = max(stats["checkout_seconds_max"], waited)
+    stats["in_use"] += 1
+    try:
+        yield conn
+    finally:
+        stats["in_use"] -= 1
+        db_pool.release(conn)
+
+# ---------------------------------
+# Request scope (API handlers)
+# ---------------------------------
+_request_session = ContextVar("db_request_session", default=None)
+
+class RequestSession:
+    """
+    The database connection of one request. It is checked out on first use, so a
+    request served entirely from caches never touches the pool. begin() opens the
+    request's one transaction; get_session commits it when the handler returns,
+    rolls it back when the handler raises, and releases the connection either way.
+    """
+    def __init__(self):
+        self._checkout = None
+        self._after_commit = []
+        self.conn = None
+        self.in_transaction = False
+
+    def after_commit(self, callback):
+        """Calls callback() once the request's writes are committed; never after a rollback."""
+        self._after_commit.append(callback)
+
+    async def connection(self):
+        if self.conn is None:
+            self._checkout = get_async_db()
+            self.conn = await self._checkout.__aenter__()
+        return self.conn
+
+    @contextlib.asynccontextmanager
+    async def cursor(self, cursor_class=None):
+        conn = await self.connection()
+        async with conn.cursor(cursor_class or DictCursor) as cur:
+            yield cur
+
+    async def begin(self):
+        """Starts the request's transaction (once); later calls are no-ops."""
+        conn = await self.connection()
+        if not self.in_transaction:
+            await conn.begin()
+            self.in_transaction = True
+
+    async def close(self, failed=False):
+        """
+        Commits (or, with failed=True, rolls back) and returns the connection to the
+        pool now. Handlers call it before long waits that need no database, such as
+        reading an upload; a later query checks out a connection again.
+        """
+        callbacks, self._after_commit = self._after_commit, []
+        if self.conn is not None:
+            checkout, conn, in_transaction = self._checkout, self.conn, self.in_transaction
+            self._checkout, self.conn, self.in_transaction = None, None, False
+            try:
+                if in_transaction:
+                    if failed:
+                        await conn.rollback()
+                    else:
+                        await conn.commit()
+            finally:
+                await checkout.__aexit__(None, None, None)
+        if not failed:
+            for callback in callbacks:
+                callback()
+
+async def get_session():
+    session = RequestSession()
+    token = _request_session.set(session)
+    try:
+        yield session
+    except BaseException:
+        await session.close(failed=True)
+        raise
+    else:
+        await session.close()
+    finally:
+        _request_session.reset(token)
+
+# Handler parameter type: `session: Session`. The "function" scope ends the
+# dependency, and so commits, before the response is sent.
+Session = Annotated[RequestSession, Depends(get_session, scope="function")]
+
+@contextlib.asynccontextmanager
+async def connection():
+    """
+    The current request's connection inside a request (see get_session), otherwise
+    a fresh checkout. Shared code (caches, auth) uses this so it joins the request's
+    checkout instead of taking a second one.
+    """
+    session = _request_session.get()
+    if session is None:
+        async with get_async_db() as conn:
+            yield conn
+    else:
+        yield await session.connection()
+
+def pool_stats():
+    stats = dict(pool_stats_counters)
+    stats["checkout_seconds_avg"] = (stats["checkout_seconds_total"] / stats["checkouts"]
+                                     if stats["checkouts"] else None)
+    if async_pool is not None:
+        stats.update(size=async_pool.size, free=async_pool.freesize,
+                     minsize=async_pool.minsize, maxsize=async_pool.maxsize)
+    return stats
+
+async def close_async_pool():
+    global async_pool
+    if async_pool is not None:
+        async_pool.close()
+        await async_pool.wait_closed()
+        async_pool = None
@@ -1,4 +1,5 @@
 from database import get_db
+import migrations
 
 def setup_database():
     conn = get_db()
@@ -29,10 +30,22 @@ def setup_database():
         approvers JSON,
         comments JSON,
         votes JSON,
+        base_amount DECIMAL(14,2) NULL, -- amount in BASE_CURRENCY (fx_history.py)
+        fx_rate DECIMAL(18,8) NULL,     -- currency units per 1 BASE_CURRENCY used for base_amount
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     );
     """)
 
+    # fx_rates - daily snapshots: units of `currency` per 1 BASE_CURRENCY
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS fx_rates (
+        rate_date DATE NOT NULL,
+        currency VARCHAR(10) NOT NULL,
+        rate DECIMAL(18,8) NOT NULL,
+        PRIMARY KEY (rate_date, currency)
+    );
+    """)
+
     # rules - approval rules configured by admin
     cur.execute("""
     CREATE TABLE IF NOT EXISTS rules (
@@ -68,13 +81,30 @@ def setup_database():
         expense_id INT NOT NULL,
         approver VARCHAR(100) NOT NULL,
         seq INT NOT NULL DEFAULT 0,
-        decision ENUM('pending','approved','rejected') DEFAULT 'pending',
+        decision ENUM('pending','approved','rejected','skipped') DEFAULT 'pending',
         decided_at DATETIME NULL,
         comment TEXT NULL,
         FOREIGN KEY (expense_id) REFERENCES expenses(id) ON DELETE CASCADE
     );
     """)
 
+    # approval_state - per-expense rule counters, see approval_rules.py
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS approval_state (
+        expense_id INT PRIMARY KEY,
+        rule_id INT NULL,
+        rule_type VARCHAR(20) NOT NULL DEFAULT 'all',
+        threshold INT NULL,
+        specific_approver VARCHAR(100) NULL,
+        total INT NOT NULL DEFAULT 0,        -- assigned approvers (seq > 0)
+        approved INT NOT NULL DEFAULT 0,
+        rejected INT NOT NULL DEFAULT 0,
+        seq_pos INT NOT NULL DEFAULT 1,      -- seq whose turn it is (sequence rules)
+        specific_decision ENUM('approved','rejected') NULL,
+        FOREIGN KEY (expense_id) REFERENCES expenses(id) ON DELETE CASCADE
+    );
+    """)
+
     # receipts - for uploaded expense receipts
     cur.execute("""
     CREATE TABLE IF NOT EXISTS receipts (
@@ -82,13 +112,33 @@ def setup_database():
         expense_id INT NOT NULL,
         filename VARCHAR(255),
         url TEXT,
+        sha256 CHAR(64) NULL,
+        size_bytes BIGINT NULL,
+        content_type VARCHAR(100) NULL,
+        uploaded_by VARCHAR(100) NULL,
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         FOREIGN KEY (expense_id) REFERENCES expenses(id) ON DELETE CASCADE
     );
     """)
 
+    # expense_rollups - analytics totals per (month, category, employee, status), see rollups.py
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS expense_rollups (
+        month DATE NOT NULL,
+        category VARCHAR(100) NOT NULL DEFAULT '',
+        employee VARCHAR(100) NOT NULL,
+        status VARCHAR(30) NOT NULL,
+        expense_count INT NOT NULL DEFAULT 0,
+        total_base_amount DECIMAL(16,2) NOT NULL DEFAULT 0,
+        PRIMARY KEY (month, category, employee, status)
+    );
+    """)
+
     conn.commit()
     cur.close()
+
+    # column changes, indexes and backfills for existing databases (see migrations.py)
+    migrations.migrate(conn)
     conn.close()
     print("✅ Database setup completed.")
 
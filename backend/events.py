@@ -0,0 +1,129 @@
+# events.py
+"""
+In-process broadcaster for expense events, delivered as Server-Sent Events.
+
+GET /events/stream (api/events.py) subscribes the caller. The expense endpoints
+publish after their transaction commits (RequestSession.after_commit), and only
+to the users an event concerns: the submitting employee, the voter and the
+approvers who still have to vote. Dashboards re-fetch or patch the rows named
+in an event instead of polling GET /expenses.
+
+Events can also name roles: a rule whose specific approver is a role (e.g.
+'cfo') has no approver rows, so its events go to every open stream of a user
+holding that role.
+
+Each subscription has a bounded queue. A client that falls EVENTS_QUEUE_SIZE
+events behind gets one `resync` event instead of the backlog, and reloads its
+page. Subscribers live in this process only; behind several workers, a client
+hears the events published by the worker it is connected to. A stream ends
+after EVENTS_MAX_STREAM_SECONDS, so EventSource reconnects and the token is
+checked again.
+"""
+from dotenv import load_dotenv
+import asyncio
+import itertools
+import json
+import os
+import time
+
+load_dotenv()
+
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", 100))
+EVENTS_KEEPALIVE = float(os.getenv("EVENTS_KEEPALIVE", 15))
+EVENTS_MAX_PER_USER = int(os.getenv("EVENTS_MAX_PER_USER", 5))
+EVENTS_MAX_STREAM_SECONDS = float(os.getenv("EVENTS_MAX_STREAM_SECONDS", 900))
+RETRY_MS = 3000  # EventSource reconnect delay
+
+class TooManyStreams(Exception):
+    pass
+
+class Subscription:
+    __slots__ = ("username", "role", "queue", "overflowed")
+
+    def __init__(self, username, role=None):
+        self.username = username
+        self.role = role
+        self.queue = asyncio.Queue(maxsize=EVENTS_QUEUE_SIZE)
+        self.overflowed = False
+
+_subscribers = {}  # username -> set of Subscription
+_event_ids = itertools.count(1)
+_stats = {"published": 0, "delivered": 0, "dropped": 0}
+
+def check_capacity(username):
+    if len(_subscribers.get(username, ())) >= EVENTS_MAX_PER_USER:
+        raise TooManyStreams(f"At most {EVENTS_MAX_PER_USER} open event streams per user")
+
+def subscribe(username, role=None):
+    check_capacity(username)
+    sub = Subscription(username, role)
+    _subscribers.setdefault(username, set()).add(sub)
+    return sub
+
+def unsubscribe(sub):
+    subs = _subscribers.get(sub.username)
+    if subs is not None:
+        subs.discard(sub)
+        if not subs:
+            del _subscribers[sub.username]
+
+def listening():
+    """False while nobody is subscribed, so publishers can skip building recipient lists."""
+    return bool(_subscribers)
+
+def publish(event_type, data, recipients, roles=()):
+    """
+    Queues one event for every open stream of the recipients (usernames) and of the
+    users holding one of `roles`; never blocks.
+    """
+    if not _subscribers:
+        return
+    _stats["published"] += 1
+    message = (next(_event_ids), event_type, json.dumps(data, default=str))
+    targets = {sub for username in set(recipients) for sub in _subscribers.get(username, ())}
+    if roles:
+        targets.update(sub for subs in _subscribers.values() for sub in subs if sub.role in roles)
+    for sub in targets:
+        if sub.overflowed:
+            continue
+        try:
+            sub.queue.put_nowait(message)
+            _stats["delivered"] += 1
+        except asyncio.QueueFull:
+            sub.overflowed = True
+            _stats["dropped"] += 1
+
+def stats():
+    return {"subscribers": sum(len(s) for s in _subscribers.values()), "users": len(_subscribers), **_stats}
+
+async def stream(username, role=None):
+    """
+    SSE text for a new subscription of `username` (holding `role`), until the client goes away or the
+    stream times out. The subscription starts with the first chunk, so a response
+    that is never sent leaves nothing behind.
+    """
+    sub = subscribe(username, role)
+    deadline = time.monotonic() + EVENTS_MAX_STREAM_SECONDS
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            if sub.overflowed:
+                # the backlog is useless to a client that reloads anyway
+                while not sub.queue.empty():
+                    sub.queue.get_nowait()
+                sub.overflowed = False
+                yield "event: resync\ndata: {}\n\n"
+                continue
+            try:
+                event_id, event_type, data = await asyncio.wait_for(sub.queue.get(),
+                                                                    min(EVENTS_KEEPALIVE, remaining))
+            except asyncio.TimeoutError:
+                # a comment line keeps proxies from closing an idle connection
+                yield ": keep-alive\n\n"
+                continue
+            yield f"id: {event_id}\nevent: {event_type}\ndata: {data}\n\n"
+    finally:
+        unsubscribe(sub)
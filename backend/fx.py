@@ -0,0 +1,168 @@
+# fx.py
+"""
+Exchange rates for /utils/convert.
+
+Rates are cached per base currency. A cached table is served as-is for
+FX_CACHE_TTL seconds; for FX_STALE_TTL seconds after that it is still served
+while a background refresh fetches a new one (stale-while-revalidate). Only
+one fetch per base currency runs at a time.
+
+FX_PROVIDER selects where rates come from:
+  http - EXCHANGE_API_URL/{BASE} through a pooled async HTTP client (default)
+  file - a local JSON file (FX_RATES_FILE), for tests and air-gapped deployments:
+         {"base": "USD", "rates": {"EUR": 0.92, ...}}  or  {"USD": {"EUR": 0.92}, "EUR": {...}}
+"""
+from dotenv import load_dotenv
+import asyncio
+import json
+import os
+import time
+import httpx
+
+load_dotenv()
+
+FX_PROVIDER = os.getenv("FX_PROVIDER", "http")
+FX_RATES_FILE = os.getenv("FX_RATES_FILE", "fx_rates.json")
+FX_CACHE_TTL = float(os.getenv("FX_CACHE_TTL", 3600))
+FX_STALE_TTL = float(os.getenv("FX_STALE_TTL", 86400))
+FX_HTTP_TIMEOUT = float(os.getenv("FX_HTTP_TIMEOUT", 10))
+
+class RatesUnavailable(Exception):
+    pass
+
+class HTTPRateProvider:
+    def __init__(self, url, api_key="", timeout=FX_HTTP_TIMEOUT):
+        self.url = url
+        self.api_key = api_key
+        self.timeout = timeout
+        self._client = None
+
+    async def fetch(self, base):
+        if not self.url:
+            raise RatesUnavailable("Exchange API URL not configured in .env")
+        if self._client is None:
+            # one client for the process so connections to the provider are reused
+            self._client = httpx.AsyncClient(timeout=self.timeout,
+                                             limits=httpx.Limits(max_keepalive_connections=10))
+        headers = {}
+        if self.api_key:
+            # for providers using header auth
+            headers["apikey"] = self.api_key
+        resp = await self._client.get(f"{self.url}/{base}", headers=headers)
+        resp.raise_for_status()
+        data = resp.json()
+        # try to find rates in common formats
+        return data.get("rates") or data.get("conversion_rates") or {}
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+class FileRateProvider:
+    def __init__(self, path):
+        self.path = path
+        self._mtime = None
+        self._tables = {}
+
+    def _load(self):
+        mtime = os.path.getmtime(self.path)
+        if mtime != self._mtime:
+            with open(self.path) as f:
+                data = json.load(f)
+            if "rates" in data:
+                self._tables = {data.get("base", "USD"): data["rates"]}
+            else:
+                self._tables = data
+            self._mtime = mtime
+        return self._tables
+
+    async def fetch(self, base):
+        try:
+            tables = self._load()
+        except OSError as e:
+            raise RatesUnavailable(f"Could not read {self.path}: {e}")
+        if base in tables:
+            return dict(tables[base], **{base: 1.0})
+        # derive a table for `base` through any table that quotes it
+        for pivot, rates in tables.items():
+            if rates.get(base):
+                cross = {cur: float(rate) / float(rates[base]) for cur, rate in rates.items()}
+                cross[pivot] = 1.0 / float(rates[base])
+                cross[base] = 1.0
+                return cross
+        raise RatesUnavailable(f"No rates for base currency {base}")
+
+    async def close(self):
+        pass
+
+def make_provider():
+    if FX_PROVIDER == "file":
+        return FileRateProvider(FX_RATES_FILE)
+    return HTTPRateProvider(os.getenv("EXCHANGE_API_URL", ""), os.getenv("EXCHANGE_API_KEY", ""))
+
+provider = make_provider()
+
+_cache = {}          # base -> (fetched_at, rates)
+_locks = {}          # base -> [asyncio.Lock, tasks using it], one fetch per base at a time
+_refreshing = {}     # base -> background refresh task in flight
+stats = {"hits": 0, "stale_hits": 0, "misses": 0, "fetch_errors": 0}
+
+async def _fetch(base):
+    # the lock lives only while a fetch for `base` is in flight, so unknown bases leave nothing behind
+    slot = _locks.setdefault(base, [asyncio.Lock(), 0])
+    slot[1] += 1
+    try:
+        async with slot[0]:
+            entry = _cache.get(base)
+            if entry and time.monotonic() - entry[0] < FX_CACHE_TTL:
+                return entry[1]
+            try:
+                rates = await provider.fetch(base)
+            except Exception:
+                stats["fetch_errors"] += 1
+                raise
+            _cache[base] = (time.monotonic(), rates)
+            return rates
+    finally:
+        slot[1] -= 1
+        if not slot[1]:
+            del _locks[base]
+
+async def _refresh_in_background(base):
+    try:
+        await _fetch(base)
+    except Exception:
+        pass  # keep serving the stale table; the next request retries
+    finally:
+        _refreshing.pop(base, None)
+
+async def get_rates(base):
+    """Rate table for `base` (units of each currency per 1 `base`)."""
+    entry = _cache.get(base)
+    if entry:
+        age = time.monotonic() - entry[0]
+        if age < FX_CACHE_TTL:
+            stats["hits"] += 1
+            return entry[1]
+        if age < FX_CACHE_TTL + FX_STALE_TTL:
+            stats["stale_hits"] += 1
+            if base not in _refreshing:
+                _refreshing[base] = asyncio.create_task(_refresh_in_background(base))
+            return entry[1]
+    stats["misses"] += 1
+    return await _fetch(base)
+
+async def get_rate(from_currency, to_currency):
+    if from_currency == to_currency:
+        return 1.0
+    rates = await get_rates(from_currency)
+    if to_currency not in rates:
+        raise KeyError(to_currency)
+    return float(rates[to_currency])
+
+def cache_stats():
+    return dict(stats, cached_bases=len(_cache), provider=FX_PROVIDER)
+
+async def close():
+    await provider.close()
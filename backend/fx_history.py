@@ -0,0 +1,163 @@
+# fx_history.py
+"""
+Daily FX snapshots (fx_rates table) and base-currency normalization.
+
+fx_rates holds, per day, how many units of each currency one BASE_CURRENCY buys.
+Expenses store base_amount = amount converted with the latest snapshot on or
+before the submission day, so reports can compare and sum across currencies in
+plain SQL. The whole table is small (days x currencies) and is kept in memory.
+
+Usage:
+    python fx_history.py load rates.csv             # rows: date,currency,rate
+    python fx_history.py load rates.json --date 2024-05-01
+                                                    # {"base": "USD", "rates": {...}}
+    python fx_history.py backfill                   # fill base_amount where it is NULL
+"""
+from dotenv import load_dotenv
+import argparse
+import bisect
+import csv
+import datetime
+import json
+import os
+import time
+from database import get_db, connection
+
+load_dotenv()
+
+BASE_CURRENCY = os.getenv("BASE_CURRENCY", "USD")
+FX_HISTORY_TTL = float(os.getenv("FX_HISTORY_TTL", 3600))
+
+_state = {"loaded_at": None, "rates": {}}  # currency -> ([dates ascending], [rates])
+
+def _build(rows):
+    rates = {}
+    for rate_date, currency, rate in rows:
+        dates, values = rates.setdefault(currency, ([], []))
+        dates.append(rate_date)
+        values.append(float(rate))
+    return rates
+
+RATES_SQL = "SELECT rate_date, currency, rate FROM fx_rates ORDER BY currency, rate_date"
+
+def load_rates_sync():
+    conn = get_db()
+    cur = conn.cursor()
+    cur.execute(RATES_SQL)
+    rows = cur.fetchall()
+    cur.close()
+    conn.close()
+    _state.update(rates=_build(rows), loaded_at=time.monotonic())
+
+async def _ensure_loaded():
+    if _state["loaded_at"] is None or time.monotonic() - _state["loaded_at"] > FX_HISTORY_TTL:
+        async with connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(RATES_SQL)
+                rows = await cur.fetchall()
+        _state.update(rates=_build(rows), loaded_at=time.monotonic())
+
+def rate_on(currency, day):
+    """Units of `currency` per 1 BASE_CURRENCY on `day` (latest snapshot on or before it), or None."""
+    if currency == BASE_CURRENCY:
+        return 1.0
+    series = _state["rates"].get(currency)
+    if not series:
+        return None
+    i = bisect.bisect_right(series[0], day)
+    return series[1][i - 1] if i else None
+
+def convert_to_base(amount, currency, day):
+    """(base_amount, rate) or (None, None) when no snapshot covers the day."""
+    rate = rate_on(currency, day)
+    if not rate:
+        return None, None
+    return round(float(amount) / rate, 2), rate
+
+async def to_base(amount, currency, day=None):
+    await _ensure_loaded()
+    return convert_to_base(amount, currency, day or datetime.datetime.utcnow().date())
+
+# ---------------------------------
+# Loading snapshots
+# ---------------------------------
+def _read_snapshot(path, default_date):
+    """Yields (date, currency, rate) rows relative to BASE_CURRENCY."""
+    if path.endswith(".csv"):
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                yield datetime.date.fromisoformat(row["date"]), row["currency"], float(row["rate"])
+        return
+    with open(path) as f:
+        data = json.load(f)
+    day = datetime.date.fromisoformat(data.get("date") or default_date.isoformat())
+    base = data.get("base", BASE_CURRENCY)
+    rates = data.get("rates") or data.get("conversion_rates") or {}
+    # re-express the table against BASE_CURRENCY if the file uses another base
+    scale = 1.0 if base == BASE_CURRENCY else 1.0 / float(rates[BASE_CURRENCY])
+    for currency, rate in rates.items():
+        yield day, currency, float(rate) * scale
+    if base != BASE_CURRENCY:
+        yield day, base, scale
+
+def load_snapshot(path, default_date=None):
+    rows = list(_read_snapshot(path, default_date or datetime.date.today()))
+    conn = get_db()
+    cur = conn.cursor()
+    cur.executemany("""
+        INSERT INTO fx_rates (rate_date, currency, rate) VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE rate = VALUES(rate)
+    """, rows)
+    conn.commit()
+    cur.close()
+    conn.close()
+    return len(rows)
+
+# ---------------------------------
+# Backfill
+# ---------------------------------
+def backfill(batch_size=5000):
+    """Fills base_amount/fx_rate for expenses that have none, in id order, one batch per commit."""
+    load_rates_sync()
+    conn = get_db()
+    cur = conn.cursor()
+    last_id, updated, missing = 0, 0, 0
+    while True:
+        cur.execute("""
+            SELECT id, amount, currency, DATE(created_at) FROM expenses
+            WHERE base_amount IS NULL AND id > %s ORDER BY id LIMIT %s
+        """, (last_id, batch_size))
+        rows = cur.fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        changes = []
+        for expense_id, amount, currency, day in rows:
+            base_amount, rate = convert_to_base(amount, currency, day)
+            if base_amount is None:
+                missing += 1
+                continue
+            changes.append((base_amount, rate, expense_id))
+        if changes:
+            cur.executemany("UPDATE expenses SET base_amount = %s, fx_rate = %s WHERE id = %s", changes)
+            conn.commit()
+            updated += len(changes)
+    cur.close()
+    conn.close()
+    return updated, missing
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FX snapshot loader and base-currency backfill")
+    sub = parser.add_subparsers(dest="command", required=True)
+    load = sub.add_parser("load", help="load a CSV or JSON rate snapshot into fx_rates")
+    load.add_argument("path")
+    load.add_argument("--date", type=datetime.date.fromisoformat, help="snapshot date for JSON files")
+    fill = sub.add_parser("backfill", help="compute base_amount for expenses missing it")
+    fill.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    if args.command == "load":
+        print(f"Loaded {load_snapshot(args.path, args.date)} rates (base {BASE_CURRENCY}).")
+    else:
+        updated, missing = backfill(args.batch_size)
+        print(f"Normalized {updated} expenses to {BASE_CURRENCY}; {missing} have no rate for their date.")
@@ -0,0 +1,221 @@
+# generate_data.py
+"""
+Synthetic org and expense data for scale testing.
+
+Builds an org tree under one admin: --roots top managers, each with --fanout
+reports per level down to --depth, where the last level are employees. It
+then adds --expenses expenses spread over the last --months months, with
+their approval rows and approval state, monthly FX snapshots and some
+conditional rules.
+
+Statuses, currencies, categories and votes follow the distributions below.
+Older expenses are more likely to be decided. A rejected expense has approved
+votes up to the rejecting manager, and the rest of its approvers are skipped.
+
+All users share one password hash, computed once (--password, default
+"password"). Rows go in through multi-row INSERTs of --batch rows, one commit
+per batch, with explicit ids, so approval rows can reference their expenses
+without a read back. Millions of expenses load in minutes.
+
+Each --prefix can be loaded once; a prefix that already has users is refused.
+Run database_setup.py first. Afterwards the analytics rollups are rebuilt.
+A running API keeps cached org and rule data until ORG_CACHE_TTL and
+RULE_CACHE_TTL expire.
+
+Usage:
+    python generate_data.py --depth 3 --fanout 8 --expenses 1000000
+    python generate_data.py --prefix load2 --roots 2 --expenses 50000 --seed 7
+"""
+from dotenv import load_dotenv
+import argparse
+import datetime
+import random
+import time
+from database import get_db
+from fx_history import BASE_CURRENCY
+import hashing
+import rollups
+
+load_dotenv()
+
+STATUS_WEIGHTS = {"approved": 55, "pending": 30, "rejected": 15}
+# currency -> (weight, units per 1 BASE_CURRENCY); the rate drifts a little month to month
+CURRENCIES = {BASE_CURRENCY: (60, 1.0), "EUR": (15, 0.92), "GBP": (8, 0.79), "INR": (12, 83.0), "JPY": (5, 150.0)}
+CATEGORIES = {"travel": 30, "meals": 30, "office": 15, "software": 10, "training": 8, "other": 7}
+APPROVAL_LEVELS = 3  # how far up the manager chain approvals go
+
+def weighted(rng, weights):
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+def insert_rows(cur, table, columns, rows):
+    if not rows:
+        return
+    placeholders = "(" + ",".join(["%s"] * len(columns)) + ")"
+    cur.execute(f"INSERT INTO {table} ({', '.join(columns)}) VALUES " + ",".join([placeholders] * len(rows)),
+                [v for row in rows for v in row])
+
+def build_org(prefix, roots, fanout, depth):
+    """[(username, role, manager)] breadth first, plus {employee: [manager chain, nearest first]}."""
+    admin = f"{prefix}_admin"
+    users = [(admin, "admin", None)]
+    chains = {}
+    level = []
+    for r in range(roots):
+        name = f"{prefix}_m0_{r}"
+        users.append((name, "manager", admin))
+        level.append((name, [name]))
+    for d in range(1, depth + 1):
+        role = "employee" if d == depth else "manager"
+        tag = "e" if d == depth else f"m{d}_"
+        next_level = []
+        for i, (manager, chain) in enumerate(level):
+            for f in range(fanout):
+                name = f"{prefix}_{tag}{i * fanout + f}"
+                users.append((name, role, manager))
+                next_level.append((name, [name] + chain))
+        level = next_level
+    for name, chain in level:
+        chains[name] = chain[1:]
+    return users, chains
+
+def fx_snapshots(rng, months, today):
+    """{first day of month: {currency: rate}} for the last `months` months, as a small random walk."""
+    snapshots, rates = {}, {c: rate for c, (_, rate) in CURRENCIES.items()}
+    for m in range(months, -1, -1):
+        year, month = divmod(today.year * 12 + today.month - 1 - m, 12)
+        day = datetime.date(year, month + 1, 1)
+        rates = {c: (r if c == BASE_CURRENCY else round(r * rng.uniform(0.98, 1.02), 6)) for c, r in rates.items()}
+        snapshots[day] = dict(rates)
+    return snapshots
+
+def generate(args):
+    rng = random.Random(args.seed)
+    now = datetime.datetime.utcnow().replace(microsecond=0)
+    started = time.perf_counter()
+
+    conn = get_db()
+    cur = conn.cursor()
+    # with unique_checks off nothing would stop a second run from duplicating usernames
+    escaped = args.prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    cur.execute("SELECT username FROM users WHERE username LIKE %s LIMIT 1", (escaped + "\\_%",))
+    taken = cur.fetchone()
+    if taken:
+        cur.close()
+        conn.close()
+        raise SystemExit(f"Prefix '{args.prefix}' is already used (e.g. {taken[0]}); pick another --prefix")
+    # bulk load: the generator guarantees uniqueness and references itself
+    cur.execute("SET SESSION unique_checks = 0, foreign_key_checks = 0")
+
+    # users - one Argon2 hash for everybody
+    password_hash = hashing.pwd_context.hash(args.password)
+    users, chains = build_org(args.prefix, args.roots, args.fanout, args.depth)
+    for start in range(0, len(users), args.batch):
+        insert_rows(cur, "users", ["username", "password", "role", "manager"],
+                    [(u, password_hash, role, m) for u, role, m in users[start:start + args.batch]])
+        conn.commit()
+    employees = list(chains)
+    print(f"{len(users)} users ({len(employees)} employees), password '{args.password}'")
+
+    # fx_rates - monthly snapshots covering the generated period; rates already stored for a day
+    # (real ones, or another dataset's) are kept, and the generated expenses use them
+    snapshots = fx_snapshots(rng, args.months, now.date())
+    cur.executemany(
+        "INSERT IGNORE INTO fx_rates (rate_date, currency, rate) VALUES (%s, %s, %s)",
+        [(day, c, r) for day, rates in snapshots.items() for c, r in rates.items()])
+    placeholders = ", ".join(["%s"] * len(snapshots))
+    cur.execute(f"SELECT rate_date, currency, rate FROM fx_rates WHERE rate_date IN ({placeholders})", tuple(snapshots))
+    for day, currency, rate in cur.fetchall():
+        if currency in snapshots[day]:
+            snapshots[day][currency] = float(rate)
+    conn.commit()
+    snapshot_days = sorted(snapshots)
+
+    # conditional rules - amount thresholds and category routes to senior managers
+    seniors = [u for u, role, _ in users if role == "manager" and u.startswith(f"{args.prefix}_m0_")]
+    rules = []
+    for i in range(args.conditional_rules):
+        if i % 2 == 0:
+            rules.append((f"{args.prefix} amount > {1000 * (i + 1)}", "amount", ">", str(1000 * (i + 1)),
+                          rng.choice(seniors)))
+        else:
+            rules.append((f"{args.prefix} {list(CATEGORIES)[i % len(CATEGORIES)]}", "category", "=",
+                          list(CATEGORIES)[i % len(CATEGORIES)], rng.choice(seniors)))
+    insert_rows(cur, "conditional_rules", ["name", "condition_field", "operator", "value", "approver"], rules)
+    conn.commit()
+
+    # expenses + expense_approvers, explicit ids after the current maximum
+    cur.execute("SELECT COALESCE(MAX(id), 0) FROM expenses")
+    next_id = cur.fetchone()[0] + 1
+    span = args.months * 30 * 86400
+    expense_cols = ["id", "employee", "amount", "currency", "category", "description", "status",
+                    "base_amount", "fx_rate", "created_at"]
+    approver_cols = ["expense_id", "approver", "seq", "decision", "decided_at", "comment"]
+    state_cols = ["expense_id", "rule_type", "total", "approved", "seq_pos"]
+    done = 0
+    while done < args.expenses:
+        n = min(args.batch, args.expenses - done)
+        expenses, approvals, states = [], [], []
+        for _ in range(n):
+            employee = rng.choice(employees)
+            age = rng.random() ** 1.5 * span  # more recent expenses than old ones
+            created_at = now - datetime.timedelta(seconds=int(age))
+            # recent expenses are still mostly pending
+            status = "pending" if age < 7 * 86400 and rng.random() < 0.7 else weighted(rng, STATUS_WEIGHTS)
+            currency = weighted(rng, {c: w for c, (w, _) in CURRENCIES.items()})
+            amount = round(min(rng.lognormvariate(4.0, 1.1), 50000), 2)
+            category = weighted(rng, CATEGORIES)
+            snapshot = max((d for d in snapshot_days if d <= created_at.date()), default=snapshot_days[0])
+            rate = snapshots[snapshot][currency]
+            expenses.append((next_id, employee, amount, currency, category, f"{category} expense",
+                             status, round(amount / rate, 2), rate, created_at))
+
+            chain = chains[employee][:APPROVAL_LEVELS]
+            if status == "approved":
+                votes = ["approved"] * len(chain)
+            elif status == "rejected":
+                k = rng.randrange(len(chain))
+                votes = ["approved"] * k + ["rejected"] + ["skipped"] * (len(chain) - k - 1)
+            else:
+                k = rng.randrange(len(chain))
+                votes = ["approved"] * k + ["pending"] * (len(chain) - k)
+                states.append((next_id, "all", len(chain), k, k + 1))
+            decided_at = created_at
+            for seq, (approver, decision) in enumerate(zip(chain, votes), start=1):
+                if decision in ("approved", "rejected"):
+                    decided_at = min(now, decided_at + datetime.timedelta(hours=rng.randint(1, 72)))
+                    approvals.append((next_id, approver, seq, decision, decided_at, decision.capitalize()))
+                else:
+                    approvals.append((next_id, approver, seq, decision, None, None))
+            next_id += 1
+
+        insert_rows(cur, "expenses", expense_cols, expenses)
+        insert_rows(cur, "expense_approvers", approver_cols, approvals)
+        insert_rows(cur, "approval_state", state_cols, states)
+        conn.commit()
+        done += n
+        if done % (args.batch * 20) == 0 or done == args.expenses:
+            print(f"  {done}/{args.expenses} expenses ({done / (time.perf_counter() - started):.0f}/s)")
+
+    cur.execute("SET SESSION unique_checks = 1, foreign_key_checks = 1")
+    cur.close()
+    conn.close()
+
+    print(f"Rebuilt expense_rollups: {rollups.rebuild()} rows.")
+    print(f"Done in {time.perf_counter() - started:.1f}s.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic org and expense history")
+    parser.add_argument("--prefix", default="gen", help="username prefix, so several datasets can coexist")
+    parser.add_argument("--roots", type=int, default=5, help="top-level managers")
+    parser.add_argument("--fanout", type=int, default=6, help="reports per manager")
+    parser.add_argument("--depth", type=int, default=3, help="levels below the top managers; the last are employees")
+    parser.add_argument("--expenses", type=int, default=100000)
+    parser.add_argument("--months", type=int, default=24, help="history length")
+    parser.add_argument("--conditional-rules", type=int, default=6)
+    parser.add_argument("--batch", type=int, default=5000, help="rows per INSERT / commit")
+    parser.add_argument("--password", default="password")
+    parser.add_argument("--seed", type=int, default=42, help="random seed, for reproducible datasets")
+    args = parser.parse_args()
+    if args.depth < 1 or args.fanout < 1 or args.roots < 1:
+        parser.error("--roots, --fanout and --depth must be at least 1")
+    generate(args)
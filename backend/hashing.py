@@ -0,0 +1,53 @@
+# hashing.py
+"""
+Argon2 password hashing, run in a dedicated process pool.
+
+Cost parameters come from the environment (ARGON2_TIME_COST, ARGON2_MEMORY_COST
+in KiB, ARGON2_PARALLELISM); unset values keep passlib's defaults. Hashes made
+with older parameters are reported by verify_password so login can rehash them.
+"""
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from passlib.context import CryptContext
+import asyncio
+import os
+from workers import BoundedProcessPool, PoolBusy
+
+load_dotenv()
+
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", PASSWORD_HASH_WORKERS * 8))
+PASSWORD_HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", 10))
+
+_argon2_settings = {}
+for _name, _env in (("time_cost", "ARGON2_TIME_COST"),
+                    ("memory_cost", "ARGON2_MEMORY_COST"),
+                    ("parallelism", "ARGON2_PARALLELISM")):
+    if os.getenv(_env):
+        _argon2_settings["argon2__" + _name] = int(os.getenv(_env))
+
+pwd_context = CryptContext(schemes=["argon2"], deprecated="auto", **_argon2_settings)
+
+pool = BoundedProcessPool("password-hash", PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING)
+
+# These two run inside the worker processes
+def _hash(password):
+    return pwd_context.hash(password)
+
+def _verify_and_update(plain, hashed):
+    return pwd_context.verify_and_update(plain, hashed)
+
+async def _run(fn, *args):
+    try:
+        return await pool.run_async(fn, *args, timeout=PASSWORD_HASH_TIMEOUT)
+    except (PoolBusy, asyncio.TimeoutError):
+        # a full queue or a hash that outlived PASSWORD_HASH_TIMEOUT: both mean overload
+        raise HTTPException(status_code=503, detail="Server busy, please retry",
+                            headers={"Retry-After": "1"})
+
+async def hash_password(password):
+    return await _run(_hash, password)
+
+async def verify_password(plain, hashed):
+    """Returns (ok, new_hash); new_hash is set when the stored hash uses outdated parameters."""
+    return await _run(_verify_and_update, plain, hashed)
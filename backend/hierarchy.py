@@ -0,0 +1,99 @@
+# hierarchy.py
+"""
+In-process cache of the org tree (username -> manager).
+
+The whole users.manager column is loaded with one query and kept in memory;
+manager chains and report lists are answered from it without touching MySQL.
+Call invalidate() after any change to users. Other worker processes pick up
+changes after ORG_CACHE_TTL seconds at the latest.
+"""
+from dotenv import load_dotenv
+import asyncio
+import os
+import time
+from database import connection
+import repository
+
+load_dotenv()
+
+ORG_CACHE_TTL = int(os.getenv("ORG_CACHE_TTL", 300))
+MAX_CHAIN_DEPTH = 10
+
+_load_lock = asyncio.Lock()
+_state = {
+    "generation": 0,       # bumped by invalidate()
+    "loaded_generation": -1,
+    "loaded_at": 0.0,
+    "managers": {},        # username -> manager
+    "reports": {},         # manager -> [direct reports]
+    "chains": {},          # username -> [manager, manager's manager, ...] (memoized)
+}
+
+def invalidate():
+    _state["generation"] += 1
+
+async def _load():
+    async with connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(repository.ORG_EDGES)
+            rows = await cur.fetchall()
+
+    managers, reports = {}, {}
+    for username, manager in rows:
+        managers[username] = manager
+        if manager:
+            reports.setdefault(manager, []).append(username)
+    return managers, reports
+
+def _is_fresh():
+    return (_state["loaded_generation"] == _state["generation"]
+            and time.monotonic() - _state["loaded_at"] < ORG_CACHE_TTL)
+
+async def _snapshot():
+    if _is_fresh():
+        return _state["managers"], _state["reports"], _state["chains"]
+    async with _load_lock:
+        # another request may have reloaded while we waited for the lock
+        if not _is_fresh():
+            generation = _state["generation"]
+            managers, reports = await _load()
+            _state.update(managers=managers, reports=reports, chains={},
+                          loaded_generation=generation, loaded_at=time.monotonic())
+        return _state["managers"], _state["reports"], _state["chains"]
+
+async def get_manager_chain(username):
+    """Managers above `username`, nearest first (up to 10 levels, cycle safe)."""
+    managers, _, chains = await _snapshot()
+    chain = chains.get(username)
+    if chain is None:
+        chain = []
+        current = username
+        for _ in range(MAX_CHAIN_DEPTH):
+            manager = managers.get(current)
+            if not manager or manager in chain:
+                break
+            chain.append(manager)
+            current = manager
+        chains[username] = chain
+    return list(chain)
+
+async def is_user(name):
+    """True when `name` is a username (as opposed to, e.g., a role name)."""
+    managers, _, _ = await _snapshot()
+    return name in managers
+
+async def get_reports(manager, recursive=True):
+    """Usernames reporting to `manager`; with recursive=True the whole subtree below them."""
+    _, reports, _ = await _snapshot()
+    result = list(reports.get(manager, []))
+    if not recursive:
+        return result
+    seen = set(result)
+    i = 0
+    while i < len(result):
+        for r in reports.get(result[i], []):
+            if r not in seen and r != manager:
+                seen.add(r)
+                result.append(r)
+        i += 1
+    return result
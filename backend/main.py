@@ -1,25 +1,71 @@
-from fastapi import FastAPI
-from api import auth, users, rules, expenses, utils
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from api import auth, users, rules, expenses, receipts, analytics, events, utils
 from fastapi.middleware.cors import CORSMiddleware
+import database
+import fx
+import hashing
+import metrics
+import profiler
+import ocr
+import ocr_jobs
 
-app = FastAPI(title="Expense Management API (MySQL)")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await database.get_async_pool()
+    await ocr_jobs.start()
+    yield
+    await ocr_jobs.stop()
+    await database.close_async_pool()
+    await fx.close()
+    hashing.pool.shutdown()
+    ocr.pool.shutdown()
+
+app = FastAPI(title="Expense Management API (MySQL)", lifespan=lifespan)
 
 app.include_router(auth.router)
 app.include_router(users.router)
 app.include_router(rules.router)
 app.include_router(expenses.router)
+app.include_router(receipts.router)
+app.include_router(analytics.router)
+app.include_router(events.router)
 app.include_router(utils.router)
 
+@app.exception_handler(database.PoolTimeout)
+async def pool_timeout_handler(request: Request, exc: database.PoolTimeout):
+    return JSONResponse(status_code=503, content={"detail": "Database busy, please retry"},
+                        headers={"Retry-After": "1"})
+
 @app.get("/")
 def root():
     return {"msg": "Expense Management API - ready"}
 
+@app.get("/stats/db-pool")
+def db_pool_stats():
+    return database.pool_stats()
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def prometheus_metrics():
+    # async so rendering runs on the event loop, where the metrics are updated
+    pool = database.pool_stats()
+    return PlainTextResponse(metrics.render({
+        "db_pool_in_use": ("Database connections checked out.", pool["in_use"]),
+        "db_pool_waiting": ("Requests waiting for a database connection.", pool["waiting"]),
+        "db_pool_size": ("Open database connections.", pool.get("size")),
+        "db_pool_checkout_timeouts": ("Checkouts that timed out since startup.", pool["timeouts"]),
+    }), media_type="text/plain; version=0.0.4")
+
 
 
+app.add_middleware(metrics.MetricsMiddleware)
+if profiler.PROFILE_ENABLED:
+    app.add_middleware(profiler.ProfilerMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # or ["http://localhost:3000"]
     allow_credentials=True,
     allow_methods=["*"],  # this allows OPTIONS, POST, GET, etc.
     allow_headers=["*"],  # allows Authorization, Content-Type, etc.
-)
\ No newline at end of file
+)
@@ -0,0 +1,151 @@
+# metrics.py
+"""
+Request metrics in Prometheus text format, without extra dependencies.
+
+MetricsMiddleware times every HTTP request and labels it with the route
+template (e.g. /expenses/{expense_id}/approve), never the raw path, so the
+number of label sets stays bounded. database.py reports every query and pool
+checkout here. Through a context variable, those are added to the current
+request's totals, which are recorded as per-request histograms when the
+response finishes.
+
+Recording costs a few dict lookups and a bisect per observation, so it can
+stay on under full load.
+"""
+from contextvars import ContextVar
+import bisect
+import time
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(names, values, extra=""):
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.label_names = name, help, labels
+        self.values = {}
+
+    def inc(self, labels=(), amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in self.values.items():
+            yield f"{self.name}{_labels(self.label_names, labels)} {value}"
+
+class Histogram:
+    def __init__(self, name, help, buckets, labels=()):
+        self.name, self.help, self.label_names = name, help, labels
+        self.buckets = tuple(buckets)
+        self.series = {}  # labels -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value, labels=()):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, series in self.series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = 'le="%s"' % bound
+                yield f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}"
+            cumulative += series[len(self.buckets)]
+            le = 'le="+Inf"'
+            yield f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.label_names, labels)} {series[-1]}"
+            yield f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}"
+
+# ---------------------------------
+# Metrics
+# ---------------------------------
+requests_total = Counter("http_requests_total", "HTTP requests by route and status.",
+                         ("method", "route", "status"))
+request_seconds = Histogram("http_request_duration_seconds", "HTTP request latency.",
+                            LATENCY_BUCKETS, ("method", "route"))
+request_queries = Histogram("http_request_db_queries", "Database queries per HTTP request.",
+                            COUNT_BUCKETS, ("method", "route"))
+request_db_seconds = Histogram("http_request_db_seconds", "Time spent in database queries per HTTP request.",
+                               LATENCY_BUCKETS, ("method", "route"))
+query_seconds = Histogram("db_query_duration_seconds", "Latency of single database queries.", QUERY_BUCKETS)
+pool_wait_seconds = Histogram("db_pool_wait_seconds", "Time waiting for a database pool checkout.",
+                              QUERY_BUCKETS + (2.5, 5.0))
+
+REGISTRY = [requests_total, request_seconds, request_queries, request_db_seconds, query_seconds, pool_wait_seconds]
+
+_in_flight = {"value": 0}
+_current = ContextVar("request_db_stats", default=None)  # [queries, db seconds] of the running request
+
+def record_query(seconds):
+    query_seconds.observe(seconds)
+    stats = _current.get()
+    if stats is not None:
+        stats[0] += 1
+        stats[1] += seconds
+
+def record_pool_wait(seconds):
+    pool_wait_seconds.observe(seconds)
+
+def render(gauges=None):
+    """Prometheus exposition text; `gauges` adds {name: (help, value)} read at scrape time."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    gauges = dict(gauges or {})
+    gauges["http_requests_in_flight"] = ("HTTP requests being served.", _in_flight["value"])
+    for name, (help, value) in gauges.items():
+        if value is None:
+            continue
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge", f"{name} {value}"]
+    return "\n".join(lines) + "\n"
+
+# ---------------------------------
+# ASGI middleware
+# ---------------------------------
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        stats = [0, 0.0]
+        token = _current.set(stats)
+        _in_flight["value"] += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _in_flight["value"] -= 1
+            _current.reset(token)
+            # the router stores the matched route in the scope; unmatched paths share one label
+            route = scope.get("route")
+            labels = (scope["method"], getattr(route, "path", "unmatched"))
+            requests_total.inc(labels + (str(status["code"]),))
+            request_seconds.observe(elapsed, labels)
+            request_queries.observe(stats[0], labels)
+            request_db_seconds.observe(stats[1], labels)
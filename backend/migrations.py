@@ -0,0 +1,279 @@
+# migrations.py
+"""
+Versioned schema migrations.
+
+database_setup.py creates the tables; everything that changes an existing
+schema lives here as a numbered step. schema_migrations records which steps
+have run, and `migrate` applies the missing ones in order, each followed by
+its version row. MySQL commits DDL implicitly, so a step that fails halfway
+cannot be rolled back. Every step therefore checks information_schema before
+it changes anything, and can safely run again.
+
+`verify` runs EXPLAIN on the hot queries of the API and fails when one of
+them still scans a whole table or a whole index.
+
+Usage:
+    python migrations.py            # apply pending migrations
+    python migrations.py status     # current version and pending steps
+    python migrations.py verify     # EXPLAIN the hot queries
+"""
+from database import get_db
+import json
+import repository
+import os
+import sys
+
+# A full scan of a table this small is what the optimizer should do, so verify
+# only reports it instead of failing. EXPLAIN's row estimate accounts for LIMIT,
+# so an ordered index walk that stops after one page also stays below it.
+VERIFY_MIN_ROWS = int(os.getenv("VERIFY_MIN_ROWS", 1000))
+
+# ---------------------------------
+# Idempotent building blocks
+# ---------------------------------
+def column_exists(cur, table, column):
+    cur.execute("""
+        SELECT COUNT(*) FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+    """, (table, column))
+    return cur.fetchone()[0] > 0
+
+def add_column_if_missing(cur, table, column, definition):
+    """MySQL has no ADD COLUMN IF NOT EXISTS, so check information_schema first."""
+    if not column_exists(cur, table, column):
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+def add_index_if_missing(cur, table, name, columns):
+    cur.execute("""
+        SELECT COUNT(*) FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+    """, (table, name))
+    if cur.fetchone()[0] == 0:
+        cur.execute(f"ALTER TABLE {table} ADD INDEX {name} ({columns})")
+
+# ---------------------------------
+# Steps
+# ---------------------------------
+def m001_hot_query_indexes(cur):
+    """Composite indexes matching the WHERE + ORDER BY of the queries in api/expenses.py."""
+    # org tree lookups and the manager branch of the expense list
+    add_index_if_missing(cur, "users", "idx_users_manager", "manager")
+    # keyset pagination on (created_at, id), optionally narrowed by employee/status
+    add_index_if_missing(cur, "expenses", "idx_expenses_created", "created_at, id")
+    add_index_if_missing(cur, "expenses", "idx_expenses_employee_created", "employee, created_at, id")
+    add_index_if_missing(cur, "expenses", "idx_expenses_status_created", "status, created_at, id")
+    # record_decision (by expense) and the inbox (by approver)
+    add_index_if_missing(cur, "expense_approvers", "idx_ea_expense_approver", "expense_id, approver, decision")
+    add_index_if_missing(cur, "expense_approvers", "idx_ea_approver_decision", "approver, decision, expense_id")
+    # analytics scoped to a set of employees
+    add_index_if_missing(cur, "expense_rollups", "idx_rollups_employee_month", "employee, month")
+
+def m002_approval_skipped_state(cur):
+    # 'skipped' marks approvers who no longer need to vote (e.g. expense rejected)
+    cur.execute("""
+        SELECT column_type FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = 'expense_approvers' AND column_name = 'decision'
+    """)
+    if "'skipped'" not in cur.fetchone()[0]:
+        cur.execute("""
+            ALTER TABLE expense_approvers
+            MODIFY decision ENUM('pending','approved','rejected','skipped') DEFAULT 'pending'
+        """)
+
+def m003_json_approvals_to_rows(cur):
+    """
+    Copies the legacy approvers/votes JSON of expenses that have no
+    expense_approvers rows yet into expense_approvers.
+    """
+    cur.execute("""
+        SELECT e.id, e.approvers, e.comments, e.votes FROM expenses e
+        WHERE e.approvers IS NOT NULL
+        AND NOT EXISTS (SELECT 1 FROM expense_approvers ea WHERE ea.expense_id = e.id)
+    """)
+    rows = cur.fetchall()
+    for expense_id, approvers, comments, votes in rows:
+        try:
+            approvers = json.loads(approvers or "[]")
+            comments = json.loads(comments or "[]")
+            votes = json.loads(votes or "[]")
+        except ValueError:
+            continue
+        # comments were stored as "user: text", in the same order as votes
+        texts = [c.split(": ", 1)[-1] for c in comments]
+        for i, v in enumerate(votes):
+            decision = "approved" if v.get("decision") == "approve" else "rejected"
+            cur.execute("""
+                INSERT INTO expense_approvers (expense_id, approver, seq, decision, decided_at, comment)
+                VALUES (%s, %s, 0, %s, %s, %s)
+            """, (expense_id, v.get("user"), decision,
+                  (v.get("at") or "").replace("T", " ")[:19] or None,
+                  texts[i] if i < len(texts) else None))
+        for i, a in enumerate(approvers):
+            cur.execute("INSERT INTO expense_approvers (expense_id, approver, seq) VALUES (%s, %s, %s)",
+                        (expense_id, a, i + 1))
+    if rows:
+        print(f"Moved approval history of {len(rows)} expenses into expense_approvers.")
+
+def m004_base_currency_amounts(cur):
+    # amounts normalized to BASE_CURRENCY, see fx_history.py
+    add_column_if_missing(cur, "expenses", "base_amount", "DECIMAL(14,2) NULL")
+    add_column_if_missing(cur, "expenses", "fx_rate", "DECIMAL(18,8) NULL")
+
+def m005_receipt_files(cur):
+    # files live in RECEIPT_DIR, addressed by sha256 (see receipt_store.py)
+    add_column_if_missing(cur, "receipts", "sha256", "CHAR(64) NULL")
+    add_column_if_missing(cur, "receipts", "size_bytes", "BIGINT NULL")
+    add_column_if_missing(cur, "receipts", "content_type", "VARCHAR(100) NULL")
+    add_column_if_missing(cur, "receipts", "uploaded_by", "VARCHAR(100) NULL")
+    add_index_if_missing(cur, "receipts", "idx_receipts_sha256", "sha256")
+
+def m006_approval_state(cur):
+    """Per-expense rule counters (see approval_rules.py) for expenses still pending."""
+    # the table itself is created by database_setup.py
+    cur.execute(repository.BACKFILL_APPROVAL_STATE + " GROUP BY e.id")
+    if cur.rowcount:
+        print(f"Created approval state for {cur.rowcount} pending expenses.")
+
+def m007_specific_approver_inbox(cur):
+    # expenses waiting on a role named as specific approver (GET /expenses/inbox)
+    add_index_if_missing(cur, "approval_state", "idx_state_specific", "specific_approver, expense_id")
+    cur.execute("DELETE s FROM approval_state s JOIN expenses e ON e.id = s.expense_id WHERE e.status <> 'pending'")
+
+MIGRATIONS = [
+    (1, "hot query indexes", m001_hot_query_indexes),
+    (2, "approval skipped state", m002_approval_skipped_state),
+    (3, "json approvals to rows", m003_json_approvals_to_rows),
+    (4, "base currency amounts", m004_base_currency_amounts),
+    (5, "receipt files", m005_receipt_files),
+    (6, "approval state", m006_approval_state),
+    (7, "specific approver inbox", m007_specific_approver_inbox),
+]
+
+# ---------------------------------
+# Runner
+# ---------------------------------
+def ensure_version_table(cur):
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INT PRIMARY KEY,
+        name VARCHAR(200) NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """)
+
+def applied_versions(cur):
+    ensure_version_table(cur)
+    cur.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cur.fetchall()}
+
+def migrate(conn):
+    """Applies pending migrations in version order; returns the versions applied."""
+    cur = conn.cursor()
+    done = applied_versions(cur)
+    applied = []
+    for version, name, step in MIGRATIONS:
+        if version in done:
+            continue
+        step(cur)
+        cur.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+        conn.commit()
+        applied.append(version)
+        print(f"Applied migration {version}: {name}")
+    cur.close()
+    return applied
+
+# ---------------------------------
+# Verification
+# ---------------------------------
+# (description, statement, params) - the statements the API runs most, with sample values
+HOT_QUERIES = [
+    ("expense list, employee",
+     "SELECT id FROM expenses WHERE employee = %s ORDER BY created_at DESC, id DESC LIMIT 51", ("alice",)),
+    ("expense list, status filter",
+     "SELECT id FROM expenses WHERE status = %s ORDER BY created_at DESC, id DESC LIMIT 51", ("pending",)),
+    ("expense list, admin",
+     "SELECT id FROM expenses ORDER BY created_at DESC, id DESC LIMIT 51", ()),
+    ("expense list, manager",
+     "SELECT id FROM expenses WHERE (employee IN (SELECT username FROM users WHERE manager = %s)"
+     " OR status IN ('pending','approved','rejected')) ORDER BY created_at DESC, id DESC LIMIT 51", ("bob",)),
+    ("export, employee",
+     "SELECT id FROM expenses WHERE employee = %s ORDER BY expenses.created_at, expenses.id", ("alice",)),
+    ("export with votes, employee",
+     "SELECT expenses.id, ea.id, ea.approver FROM expenses"
+     " LEFT JOIN expense_approvers ea ON ea.expense_id = expenses.id"
+     " WHERE employee = %s ORDER BY expenses.created_at, expenses.id", ("alice",)),
+    ("export, admin",
+     "SELECT id FROM expenses ORDER BY expenses.created_at, expenses.id", ()),
+    ("team members of a manager",
+     "SELECT username FROM users WHERE manager = %s", ("bob",)),
+    ("inbox",
+     "SELECT e.id FROM expense_approvers ea JOIN expenses e ON e.id = ea.expense_id"
+     " WHERE ea.approver = %s AND ea.decision = 'pending' ORDER BY ea.expense_id DESC LIMIT 51", ("bob",)),
+    ("inbox, role as specific approver",
+     "SELECT e.id FROM approval_state s JOIN expenses e ON e.id = s.expense_id WHERE "
+     + repository.SPECIFIC_PENDING_WHERE + " ORDER BY s.expense_id DESC LIMIT 51", ("cfo", "carol")),
+    ("inbox count",
+     "SELECT COUNT(*) FROM expense_approvers WHERE approver = %s AND decision = 'pending'", ("bob",)),
+    ("pending row of an approver",
+     "SELECT id, seq FROM expense_approvers WHERE expense_id = %s AND approver = %s"
+     " AND decision = 'pending' ORDER BY seq LIMIT 1", (1, "bob")),
+    ("analytics, one employee",
+     "SELECT month, SUM(expense_count) FROM expense_rollups WHERE employee IN (%s) GROUP BY month", ("alice",)),
+]
+
+# scans that are the point of the query: description -> why
+EXPECTED_SCANS = {
+    "export, admin": "an unfiltered export reads every expense; walking idx_expenses_created avoids the sort",
+}
+
+SCAN_TYPES = {"ALL": "full scan", "index": "full index scan"}
+
+def verify(conn):
+    """EXPLAINs every hot query; returns a list of problems (empty when all use an index)."""
+    cur = conn.cursor(dictionary=True)
+    problems = []
+    for description, sql, params in HOT_QUERIES:
+        cur.execute("EXPLAIN " + sql, params)
+        scans = [row for row in cur.fetchall() if row.get("type") in SCAN_TYPES]
+        failed = False
+        for row in scans:
+            note = f"{description}: {SCAN_TYPES[row['type']]} of {row['table']} (~{row['rows']} rows)"
+            if description in EXPECTED_SCANS:
+                print(f"  note  {note}; expected, {EXPECTED_SCANS[description]}")
+            elif (row.get("rows") or 0) < VERIFY_MIN_ROWS:
+                print(f"  note  {note}; too few rows for the index to matter")
+            else:
+                problems.append(note)
+                failed = True
+        print(f"  {'FAIL' if failed else 'ok  '}  {description}")
+    cur.close()
+    return problems
+
+def main(argv):
+    command = argv[1] if len(argv) > 1 else "migrate"
+    conn = get_db()
+    try:
+        if command == "migrate":
+            applied = migrate(conn)
+            print(f"Schema at version {MIGRATIONS[-1][0]}" + ("" if applied else " (nothing to do)"))
+        elif command == "status":
+            cur = conn.cursor()
+            done = applied_versions(cur)
+            cur.close()
+            for version, name, _ in MIGRATIONS:
+                print(f"  {'applied' if version in done else 'pending'}  {version:03d} {name}")
+        elif command == "verify":
+            problems = verify(conn)
+            if problems:
+                print("\n".join(problems))
+                return 1
+            print("All hot queries use an index.")
+        else:
+            print(__doc__)
+            return 2
+    finally:
+        conn.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
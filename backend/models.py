@@ -1,5 +1,5 @@
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List
 
 # Auth / Users
@@ -9,6 +9,10 @@ class UserCreate(BaseModel):
     role: str  # admin, manager, employee, cfo, etc
     manager: Optional[str] = None
 
+class UserUpdate(BaseModel):
+    role: Optional[str] = None
+    manager: Optional[str] = None
+
 # Expense creation
 class ExpenseCreate(BaseModel):
     amount: float
@@ -17,6 +21,12 @@ class ExpenseCreate(BaseModel):
     description: Optional[str] = None
     rule_id: Optional[int] = None  # optional, to tie a rule to this expense
 
+# Bulk approve / reject
+class BulkDecision(BaseModel):
+    expense_ids: List[int]
+    decision: str  # 'approve' | 'reject'
+    comment: Optional[str] = None
+
 # Basic expense out
 class ExpenseOut(BaseModel):
     id: int
@@ -33,8 +43,25 @@ class ExpenseOut(BaseModel):
 # Rule create/update
 class RuleCreate(BaseModel):
     name: str
-    type: str  # 'percentage' | 'specific' | 'hybrid' | 'sequential'
-    threshold: Optional[int] = None
+    type: str  # 'percentage' | 'specific' | 'hybrid' | 'sequence' (see approval_rules.py)
+    threshold: Optional[int] = None  # percent of approvers, for percentage / hybrid
     approvers: Optional[List[str]] = None
     specific_approver: Optional[str] = None
-    is_active: Optional[bool] = True
\ No newline at end of file
+    seq: Optional[List[str]] = None  # approval order for sequence rules (default: approvers)
+    is_active: Optional[bool] = True
+
+# Conditional approval trigger (e.g. amount > 1000 -> cfo)
+class ConditionalRuleCreate(BaseModel):
+    name: str
+    condition_field: str  # 'amount' | 'category'
+    operator: str  # '>', '<', '=', '=='
+    value: str
+    approver: str
+
+# Currency conversion (batch item)
+CURRENCY_CODE = "^[A-Z]{3}$"  # ISO 4217
+
+class ConversionRequest(BaseModel):
+    amount: float
+    from_currency: str = Field(pattern=CURRENCY_CODE)
+    to_currency: str = Field(pattern=CURRENCY_CODE)
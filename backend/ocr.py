@@ -0,0 +1,104 @@
+# ocr.py
+"""
+Receipt OCR off the event loop.
+
+Recognition runs in a bounded process pool (OCR_WORKERS, OCR_MAX_PENDING).
+Images are converted to grayscale and downscaled to OCR_MAX_DIMENSION pixels on
+the long side first, which is plenty for receipts and much faster for
+tesseract. Results are cached by the SHA-256 of the uploaded bytes, and
+identical uploads that arrive together share one recognition.
+"""
+from dotenv import load_dotenv
+from collections import deque
+import asyncio
+import hashlib
+import io
+import os
+import time
+from cache import TTLCache
+from workers import BoundedProcessPool
+
+load_dotenv()
+
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", 2))
+OCR_MAX_PENDING = int(os.getenv("OCR_MAX_PENDING", OCR_WORKERS * 4))
+OCR_TIMEOUT = float(os.getenv("OCR_TIMEOUT", 60))
+OCR_MAX_DIMENSION = int(os.getenv("OCR_MAX_DIMENSION", 2000))
+OCR_CACHE_SIZE = int(os.getenv("OCR_CACHE_SIZE", 512))
+OCR_CACHE_TTL = int(os.getenv("OCR_CACHE_TTL", 86400))
+
+pool = BoundedProcessPool("ocr", OCR_WORKERS, OCR_MAX_PENDING)
+cache = TTLCache(maxsize=OCR_CACHE_SIZE, ttl=OCR_CACHE_TTL)
+
+_inflight = {}                   # sha256 -> asyncio.Future of a running recognition
+_latencies = deque(maxlen=500)   # seconds, most recent recognitions
+
+# Runs inside the worker processes
+def _recognize(contents, max_dimension):
+    from PIL import Image
+    import pytesseract
+
+    try:
+        image = Image.open(io.BytesIO(contents)).convert("L")
+        image.thumbnail((max_dimension, max_dimension))
+        return pytesseract.image_to_string(image)
+    except Exception as e:
+        # pytesseract's exceptions do not survive pickling back to the parent
+        raise RuntimeError(str(e))
+
+async def recognize(contents):
+    """
+    OCR text for an image. Raises workers.PoolBusy when the queue is full and
+    asyncio.TimeoutError when recognition takes longer than OCR_TIMEOUT seconds.
+    """
+    digest = hashlib.sha256(contents).hexdigest()
+    text = cache.get(digest)
+    if text is not None:
+        return text
+    if digest in _inflight:
+        return await asyncio.shield(_inflight[digest])
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[digest] = future
+    started = time.perf_counter()
+    try:
+        text = await pool.run_async(_recognize, contents, OCR_MAX_DIMENSION, timeout=OCR_TIMEOUT)
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        future.exception()  # mark retrieved when nobody else was waiting
+        raise
+    finally:
+        _inflight.pop(digest, None)
+    _latencies.append(time.perf_counter() - started)
+    cache.set(digest, text)
+    future.set_result(text)
+    return text
+
+def parse(text):
+    # Very simple parse heuristics: you can extend with regexes to capture amount, date, vendor
+    # Here we return raw text plus placeholder parsed fields
+    return {
+        "raw_text": text,
+        "amount": None,
+        "date": None,
+        "possible_descriptions": text.splitlines()[:8]
+    }
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * pct))], 4)
+
+def stats():
+    recent = list(_latencies)
+    return {
+        "queue": pool.stats(),
+        "in_flight": len(_inflight),
+        "latency_seconds": {"p50": _percentile(recent, 0.5), "p95": _percentile(recent, 0.95),
+                            "max": round(max(recent), 4) if recent else None, "samples": len(recent)},
+        "cache": cache.stats(),
+    }
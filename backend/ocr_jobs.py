@@ -0,0 +1,253 @@
+# ocr_jobs.py
+"""
+Background OCR jobs, for scans too slow to recognize inside one HTTP request.
+
+A submitted image is written to OCR_JOB_DIR and recorded in a local SQLite
+file (OCR_JOB_DB) before the job id is returned, so queued receipts survive a
+restart. OCR_WORKERS runner tasks claim jobs oldest first and recognize them
+through ocr.recognize, so they share its process pool and result cache. Finished
+jobs are kept for OCR_JOB_RETENTION seconds.
+
+Several API processes (uvicorn --workers N) can share one OCR_JOB_DB. A claimed
+job records the claiming process (WORKER_ID) and a heartbeat that process
+refreshes every OCR_JOB_LEASE / 3 seconds; a running job whose heartbeat is
+older than OCR_JOB_LEASE belonged to a process that died, and is put back in
+the queue. Waiters poll the table as well, so ?wait= works whichever process
+runs the job.
+"""
+from dotenv import load_dotenv
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+import ocr
+from workers import PoolBusy
+
+load_dotenv()
+
+OCR_JOB_DIR = os.getenv("OCR_JOB_DIR", "ocr_jobs")
+OCR_JOB_DB = os.getenv("OCR_JOB_DB", os.path.join(OCR_JOB_DIR, "jobs.sqlite3"))
+OCR_JOB_MAX_QUEUED = int(os.getenv("OCR_JOB_MAX_QUEUED", 1000))
+OCR_JOB_RETENTION = int(os.getenv("OCR_JOB_RETENTION", 86400))
+OCR_JOB_LEASE = float(os.getenv("OCR_JOB_LEASE", 60))        # seconds without a heartbeat before a job is requeued
+OCR_JOB_WAIT_POLL = float(os.getenv("OCR_JOB_WAIT_POLL", 1))  # how often waiters re-read a job run elsewhere
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+class QueueFull(Exception):
+    pass
+
+_state = {"db": None, "runners": [], "keeper": None}
+_db_lock = threading.Lock()  # one connection, used from worker threads; also keeps writes out of _claim's transaction
+_wakeup = asyncio.Event()   # set when a job is queued
+_finished = {}              # job id -> asyncio.Event for waiters
+
+def _db():
+    if _state["db"] is None:
+        os.makedirs(OCR_JOB_DIR, exist_ok=True)
+        db = sqlite3.connect(OCR_JOB_DB, isolation_level=None, check_same_thread=False)
+        db.row_factory = sqlite3.Row
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("""
+        CREATE TABLE IF NOT EXISTS ocr_jobs (
+            id TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            status TEXT NOT NULL,          -- queued | running | done | failed
+            result TEXT,
+            error TEXT,
+            created_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL,
+            worker TEXT,                   -- WORKER_ID of the process running it
+            heartbeat_at REAL
+        )""")
+        columns = {c["name"] for c in db.execute("PRAGMA table_info(ocr_jobs)")}
+        for column, kind in (("worker", "TEXT"), ("heartbeat_at", "REAL")):
+            if column not in columns:
+                db.execute(f"ALTER TABLE ocr_jobs ADD COLUMN {column} {kind}")
+        db.execute("CREATE INDEX IF NOT EXISTS idx_ocr_jobs_status ON ocr_jobs (status, created_at)")
+        _state["db"] = db
+    return _state["db"]
+
+def _image_path(job_id):
+    return os.path.join(OCR_JOB_DIR, f"{job_id}.img")
+
+def _row(job):
+    out = {"job_id": job["id"], "status": job["status"], "created_at": job["created_at"],
+           "started_at": job["started_at"], "finished_at": job["finished_at"]}
+    if job["status"] == "done":
+        out["result"] = json.loads(job["result"])
+    elif job["status"] == "failed":
+        out["error"] = job["error"]
+    return out
+
+def _persist(contents, owner):
+    """Blocking part of submit: image file (fsynced) and job row."""
+    job_id = uuid.uuid4().hex
+    tmp = _image_path(job_id) + ".part"
+    with _db_lock:
+        db = _db()
+        queued = db.execute("SELECT COUNT(*) FROM ocr_jobs WHERE status IN ('queued', 'running')").fetchone()[0]
+        if queued >= OCR_JOB_MAX_QUEUED:
+            raise QueueFull("OCR job queue is full")
+    with open(tmp, "wb") as f:
+        f.write(contents)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, _image_path(job_id))
+    with _db_lock:
+        _db().execute("INSERT INTO ocr_jobs (id, owner, status, created_at) VALUES (?, ?, 'queued', ?)",
+                      (job_id, owner, time.time()))
+    return job_id
+
+async def submit(contents, owner):
+    """Persists the image and queues it; returns the job id. Raises QueueFull."""
+    # the fsync can take tens of milliseconds on a busy disk, so it runs off the event loop
+    job_id = await asyncio.to_thread(_persist, contents, owner)
+    _wakeup.set()
+    return job_id
+
+def _get(job_id):
+    with _db_lock:
+        job = _db().execute("SELECT * FROM ocr_jobs WHERE id = ?", (job_id,)).fetchone()
+    if job is None:
+        return None
+    return job["owner"], _row(job)
+
+async def get(job_id):
+    """(owner, job dict) or None."""
+    return await asyncio.to_thread(_get, job_id)
+
+async def wait(job_id, timeout):
+    """Waits up to `timeout` seconds for the job to finish, then returns get(job_id)."""
+    deadline = time.monotonic() + timeout
+    event = _finished.setdefault(job_id, asyncio.Event())
+    try:
+        while True:
+            found = await get(job_id)
+            remaining = deadline - time.monotonic()
+            if found is None or found[1]["status"] in ("done", "failed") or remaining <= 0:
+                return found
+            # set when this process finishes the job; another process's runner is seen by polling
+            try:
+                await asyncio.wait_for(event.wait(), min(remaining, OCR_JOB_WAIT_POLL))
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        if not event.is_set() and _finished.get(job_id) is event:
+            _finished.pop(job_id, None)
+
+def _claim():
+    with _db_lock:
+        db = _db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            job = db.execute("SELECT id FROM ocr_jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1").fetchone()
+            if job is not None:
+                now = time.time()
+                db.execute("UPDATE ocr_jobs SET status = 'running', started_at = ?, worker = ?, heartbeat_at = ? "
+                           "WHERE id = ?", (now, WORKER_ID, now, job["id"]))
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+    return job["id"] if job else None
+
+def _requeue(job_id):
+    with _db_lock:
+        _db().execute("UPDATE ocr_jobs SET status = 'queued', started_at = NULL, worker = NULL, heartbeat_at = NULL "
+                      "WHERE id = ? AND worker = ?", (job_id, WORKER_ID))
+
+def _read_image(job_id):
+    with open(_image_path(job_id), "rb") as f:
+        return f.read()
+
+def _finish(job_id, result=None, error=None):
+    with _db_lock:
+        _db().execute("UPDATE ocr_jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                      ("failed" if error else "done", json.dumps(result) if result is not None else None,
+                       error, time.time(), job_id))
+    try:
+        os.remove(_image_path(job_id))
+    except OSError:
+        pass
+
+async def _runner():
+    while True:
+        job_id = await asyncio.to_thread(_claim)
+        if job_id is None:
+            _wakeup.clear()
+            await _wakeup.wait()
+            continue
+        try:
+            contents = await asyncio.to_thread(_read_image, job_id)
+            text = await ocr.recognize(contents)
+        except PoolBusy:
+            # synchronous /utils/ocr calls filled the pool; put the job back and retry shortly
+            await asyncio.to_thread(_requeue, job_id)
+            await asyncio.sleep(1)
+            continue
+        except asyncio.CancelledError:
+            await asyncio.to_thread(_requeue, job_id)
+            raise
+        except asyncio.TimeoutError:
+            await asyncio.to_thread(_finish, job_id, error=f"OCR timed out after {ocr.OCR_TIMEOUT:g} seconds")
+        except Exception as e:
+            # an empty message would read as success in _finish
+            await asyncio.to_thread(_finish, job_id, error=str(e) or type(e).__name__)
+        else:
+            await asyncio.to_thread(_finish, job_id, result=ocr.parse(text))
+        event = _finished.pop(job_id, None)
+        if event:
+            event.set()
+
+def _heartbeat():
+    """Renews this process's leases and requeues expired ones; returns how many were requeued."""
+    now = time.time()
+    with _db_lock:
+        db = _db()
+        db.execute("UPDATE ocr_jobs SET heartbeat_at = ? WHERE status = 'running' AND worker = ?", (now, WORKER_ID))
+        return db.execute("UPDATE ocr_jobs SET status = 'queued', started_at = NULL, worker = NULL, heartbeat_at = NULL "
+                          "WHERE status = 'running' AND (heartbeat_at IS NULL OR heartbeat_at < ?)",
+                          (now - OCR_JOB_LEASE,)).rowcount
+
+async def _keep_leases():
+    while True:
+        if await asyncio.to_thread(_heartbeat):
+            _wakeup.set()
+        await asyncio.sleep(OCR_JOB_LEASE / 3)
+
+def _purge():
+    cutoff = time.time() - OCR_JOB_RETENTION
+    with _db_lock:
+        _db().execute("DELETE FROM ocr_jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (cutoff,))
+
+async def start(workers=ocr.OCR_WORKERS):
+    """Purges old jobs and starts the runner tasks and the lease keeper."""
+    await asyncio.to_thread(_purge)
+    _wakeup.set()
+    _state["runners"] = [asyncio.create_task(_runner()) for _ in range(workers)]
+    _state["keeper"] = asyncio.create_task(_keep_leases())
+
+async def stop():
+    tasks = _state["runners"] + [_state["keeper"]] if _state["keeper"] else _state["runners"]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    _state["runners"], _state["keeper"] = [], None
+    if _state["db"] is not None:
+        _state["db"].close()
+        _state["db"] = None
+
+def _counts():
+    with _db_lock:
+        return dict(_db().execute("SELECT status, COUNT(*) FROM ocr_jobs GROUP BY status").fetchall())
+
+async def stats():
+    counts = await asyncio.to_thread(_counts)
+    return {"runners": len(_state["runners"]), "max_queued": OCR_JOB_MAX_QUEUED, "worker": WORKER_ID,
+            **{s: counts.get(s, 0) for s in ("queued", "running", "done", "failed")}}
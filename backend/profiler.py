@@ -0,0 +1,201 @@
+# profiler.py
+"""
+Opt-in slow-request profiler and slow-query log (off unless PROFILE_ENABLED=1).
+
+While enabled, every request collects its SQL statements with timings (from
+database.py) and its named spans (`with profiler.span("name"):` in hot
+helpers). A PROFILE_SAMPLE_RATE fraction of requests also runs under a
+profiler: pyinstrument (in requirements.txt), a sampling profiler that follows
+the request's own coroutines. Without it, cProfile is used, with a warning at
+import: it records the whole event loop, so its output also contains the other
+requests that ran while the sampled one was awaiting. Only one request is
+profiled at a time, because both profilers hook the whole thread. A request slower than PROFILE_SLOW_MS is written to
+PROFILE_DIR as one text file with its spans, its SQL and, if it was sampled,
+its profile. Only the newest PROFILE_MAX_FILES files are kept.
+"""
+from dotenv import load_dotenv
+from contextvars import ContextVar
+import asyncio
+import datetime
+import io
+import os
+import random
+import re
+import time
+import warnings
+
+load_dotenv()
+
+PROFILE_ENABLED = os.getenv("PROFILE_ENABLED", "0") == "1"
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0.05))
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", 500))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", 200))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", 0.001))  # pyinstrument sampling interval, seconds
+MAX_QUERIES = 500  # per request, so a runaway loop cannot grow a trace without bound
+
+try:
+    from pyinstrument import Profiler as _Pyinstrument
+except ImportError:
+    _Pyinstrument = None
+    if PROFILE_ENABLED and PROFILE_SAMPLE_RATE > 0:
+        warnings.warn("pyinstrument is not installed; sampled profiles fall back to cProfile, whose output "
+                      "includes other requests running concurrently on the event loop", RuntimeWarning)
+
+_current = ContextVar("request_trace", default=None)
+_state = {"profiling": False}
+
+class Trace:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = []    # (name, offset, seconds)
+        self.queries = []  # (sql, seconds)
+        self.dropped_queries = 0
+
+class _Span:
+    __slots__ = ("trace", "name", "started")
+
+    def __init__(self, trace, name):
+        self.trace, self.name = trace, name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        ended = time.perf_counter()
+        self.trace.spans.append((self.name, self.started - self.trace.started, ended - self.started))
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+_NO_SPAN = _NoSpan()
+
+def span(name):
+    """Times a block into the current request's trace; free when profiling is off."""
+    trace = _current.get()
+    return _Span(trace, name) if trace is not None else _NO_SPAN
+
+def record_query(sql, seconds, many=None):
+    """`many` is the parameter list of an executemany."""
+    trace = _current.get()
+    if trace is None:
+        return
+    if len(trace.queries) >= MAX_QUERIES:
+        trace.dropped_queries += 1
+        return
+    sql = " ".join(str(sql).split())
+    if many is not None:
+        sql += f"  -- executemany x{len(many) if hasattr(many, '__len__') else '?'}"
+    trace.queries.append((sql, seconds))
+
+# ---------------------------------
+# Profilers
+# ---------------------------------
+class _CProfile:
+    def __init__(self):
+        import cProfile
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def output(self):
+        import pstats
+        out = io.StringIO()
+        pstats.Stats(self.profile, stream=out).sort_stats("cumulative").print_stats(60)
+        return "cProfile (deterministic; includes other requests interleaved on the event loop)\n" + out.getvalue()
+
+class _PyinstrumentProfile:
+    def __init__(self):
+        self.profile = _Pyinstrument(interval=PROFILE_INTERVAL, async_mode="enabled")
+
+    def start(self):
+        self.profile.start()
+
+    def stop(self):
+        self.profile.stop()
+
+    def output(self):
+        return self.profile.output_text(unicode=True, show_all=False)
+
+def _new_profiler():
+    return _PyinstrumentProfile() if _Pyinstrument is not None else _CProfile()
+
+# ---------------------------------
+# Dumps
+# ---------------------------------
+def _write_dump(filename, text):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(os.path.join(PROFILE_DIR, filename), "w") as f:
+        f.write(text)
+    # names start with a timestamp, so sorting puts the oldest first
+    dumps = sorted(n for n in os.listdir(PROFILE_DIR) if n.endswith(".txt"))
+    for old in dumps[:-PROFILE_MAX_FILES]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, old))
+        except OSError:
+            pass
+
+def _format(method, route, status, elapsed, trace, profile_text):
+    lines = [f"{method} {route} -> {status} in {elapsed * 1000:.1f} ms",
+             f"at {datetime.datetime.utcnow().isoformat()}Z", "", "Spans (offset, duration):"]
+    for name, offset, seconds in trace.spans:
+        lines.append(f"  {offset * 1000:9.1f} ms  {seconds * 1000:9.1f} ms  {name}")
+    db_total = sum(s for _, s in trace.queries)
+    lines += ["", f"SQL ({len(trace.queries)} statements, {db_total * 1000:.1f} ms):"]
+    for sql, seconds in trace.queries:
+        lines.append(f"  {seconds * 1000:9.2f} ms  {sql}")
+    if trace.dropped_queries:
+        lines.append(f"  ... {trace.dropped_queries} more not recorded")
+    lines += ["", profile_text or "(request was not sampled for profiling)"]
+    return "\n".join(lines) + "\n"
+
+# ---------------------------------
+# ASGI middleware (added by main.py only when PROFILE_ENABLED)
+# ---------------------------------
+class ProfilerMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        trace = Trace()
+        token = _current.set(trace)
+        profiler = None
+        if not _state["profiling"] and random.random() < PROFILE_SAMPLE_RATE:
+            _state["profiling"] = True
+            profiler = _new_profiler()
+            profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if profiler is not None:
+                profiler.stop()
+                _state["profiling"] = False
+            _current.reset(token)
+            elapsed = time.perf_counter() - trace.started
+            if elapsed * 1000 >= PROFILE_SLOW_MS:
+                route = getattr(scope.get("route"), "path", scope["path"])
+                slug = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+                filename = (f"{datetime.datetime.utcnow():%Y%m%d-%H%M%S-%f}-{scope['method']}-{slug}"
+                            f"-{int(elapsed * 1000)}ms.txt")
+                text = _format(scope["method"], route, status["code"], elapsed, trace,
+                               profiler.output() if profiler is not None else None)
+                await asyncio.to_thread(_write_dump, filename, text)
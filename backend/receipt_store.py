@@ -0,0 +1,116 @@
+# receipt_store.py
+"""
+Content-addressed receipt files on local disk.
+
+Uploads are streamed to a temporary file, in RECEIPT_CHUNK_SIZE writes, while
+their SHA-256 is computed, then moved to RECEIPT_DIR/ab/cd/<sha256>. The same
+receipt uploaded twice is stored once. Uploads larger than RECEIPT_MAX_BYTES
+are rejected. The content type is detected from the file's first bytes; only
+CONTENT_TYPES are served inline (see api/receipts.py). Thumbnails (<sha256>.thumb.jpg next to the file) are made in the
+background for images; PDFs and other files have none.
+"""
+from dotenv import load_dotenv
+import asyncio
+import hashlib
+import os
+import tempfile
+
+load_dotenv()
+
+RECEIPT_DIR = os.getenv("RECEIPT_DIR", "receipts")
+RECEIPT_MAX_BYTES = int(os.getenv("RECEIPT_MAX_BYTES", 20 * 1024 * 1024))
+RECEIPT_CHUNK_SIZE = int(os.getenv("RECEIPT_CHUNK_SIZE", 1024 * 1024))
+RECEIPT_THUMBNAIL_SIZE = int(os.getenv("RECEIPT_THUMBNAIL_SIZE", 320))
+
+# types recognized from a file's first bytes; only these are ever served inline
+SIGNATURES = (
+    (b"%PDF-", "application/pdf"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+CONTENT_TYPES = {content_type for _, content_type in SIGNATURES} | {"image/webp"}
+UNKNOWN_TYPE = "application/octet-stream"
+
+class TooLarge(Exception):
+    pass
+
+def detect_type(head):
+    """Content type of a file starting with `head` (its first 12 bytes or more), by signature."""
+    for signature, content_type in SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return UNKNOWN_TYPE
+
+def path_for(sha256):
+    return os.path.join(RECEIPT_DIR, sha256[:2], sha256[2:4], sha256)
+
+def thumbnail_path(sha256):
+    return path_for(sha256) + ".thumb.jpg"
+
+def _write_chunk(f, digest, chunk):
+    f.write(chunk)
+    digest.update(chunk)
+
+def _finalize(tmp_path, sha256):
+    dest = path_for(sha256)
+    if os.path.exists(dest):
+        os.remove(tmp_path)  # already stored
+        return
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    os.replace(tmp_path, dest)
+
+async def save(chunks):
+    """
+    Streams an async iterable of bytes (e.g. upload_stream.FilePart.chunks()) to the
+    store; returns (sha256, size, content_type), the type detected from the content,
+    never the one the client declared. Raises TooLarge as soon as the limit is passed.
+    """
+    os.makedirs(RECEIPT_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=RECEIPT_DIR, suffix=".part")
+    digest, size, buffered, pending = hashlib.sha256(), 0, [], 0
+    head = b""
+    try:
+        with os.fdopen(fd, "wb") as f:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > RECEIPT_MAX_BYTES:
+                    raise TooLarge(f"Receipt exceeds {RECEIPT_MAX_BYTES} bytes")
+                if len(head) < 12:
+                    head += chunk[:12 - len(head)]
+                buffered.append(chunk)
+                pending += len(chunk)
+                # clients send small pieces; write in RECEIPT_CHUNK_SIZE batches
+                if pending >= RECEIPT_CHUNK_SIZE:
+                    await asyncio.to_thread(_write_chunk, f, digest, b"".join(buffered))
+                    buffered, pending = [], 0
+            if buffered:
+                await asyncio.to_thread(_write_chunk, f, digest, b"".join(buffered))
+        sha256 = digest.hexdigest()
+        await asyncio.to_thread(_finalize, tmp_path, sha256)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return sha256, size, detect_type(head)
+
+def _make_thumbnail(sha256):
+    from PIL import Image
+
+    dest = thumbnail_path(sha256)
+    if os.path.exists(dest):
+        return
+    try:
+        with Image.open(path_for(sha256)) as image:
+            image.thumbnail((RECEIPT_THUMBNAIL_SIZE, RECEIPT_THUMBNAIL_SIZE))
+            tmp = dest + ".part"
+            image.convert("RGB").save(tmp, "JPEG", quality=80)
+        os.replace(tmp, dest)
+    except Exception:
+        pass  # not an image (e.g. a PDF); served without a thumbnail
+
+async def make_thumbnail(sha256):
+    await asyncio.to_thread(_make_thumbnail, sha256)
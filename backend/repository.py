@@ -0,0 +1,172 @@
+# repository.py
+"""
+Shared data access: every fixed SQL statement the API runs, defined once, with
+small helpers that run them on a cursor the caller provides (normally from the
+request's database.Session).
+
+The driver has no server-side prepared statements, so "prepared" here means
+built once at import time, instead of being rebuilt in each handler. Query
+builders with a variable shape, such as the expense list filters, the export
+and the inbox, stay next to their endpoints in api/expenses.py.
+"""
+import json
+
+# ---------------------------------
+# Users
+# ---------------------------------
+USER_IDENTITY = "SELECT id, username, role, manager FROM users WHERE username = %s"
+USER_WITH_PASSWORD = "SELECT * FROM users WHERE username = %s"
+USER_EXISTS = "SELECT id FROM users WHERE username = %s"
+INSERT_USER = "INSERT INTO users (username, password, role, manager) VALUES (%s, %s, %s, %s)"
+UPDATE_PASSWORD = "UPDATE users SET password = %s WHERE id = %s"
+LIST_USERS = "SELECT id, username, role, manager, created_at FROM users"
+DELETE_USER = "DELETE FROM users WHERE username = %s"
+ORG_EDGES = "SELECT username, manager FROM users"
+
+async def fetch_one(cur, sql, params=()):
+    await cur.execute(sql, params)
+    return await cur.fetchone()
+
+async def fetch_all(cur, sql, params=()):
+    await cur.execute(sql, params)
+    return await cur.fetchall()
+
+async def insert_user(cur, username, hashed, role, manager):
+    await cur.execute(INSERT_USER, (username, hashed, role, manager))
+
+async def update_user_fields(cur, username, fields):
+    """fields: {column: value}, columns already validated by the caller's model."""
+    assignments = ", ".join(f"{k} = %s" for k in fields)
+    await cur.execute(f"UPDATE users SET {assignments} WHERE username = %s", (*fields.values(), username))
+
+# ---------------------------------
+# Rules
+# ---------------------------------
+INSERT_RULE = """
+    INSERT INTO rules (name, type, threshold, approvers, specific_approver, seq, is_active)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+"""
+UPDATE_RULE = """
+    UPDATE rules SET name=%s, type=%s, threshold=%s, approvers=%s, specific_approver=%s, seq=%s, is_active=%s
+    WHERE id=%s
+"""
+LIST_RULES = "SELECT * FROM rules"
+RULE_BY_ID = "SELECT * FROM rules WHERE id = %s"
+DELETE_RULE = "DELETE FROM rules WHERE id = %s"
+ACTIVE_RULES = "SELECT * FROM rules WHERE is_active = 1"
+
+INSERT_CONDITIONAL_RULE = """
+    INSERT INTO conditional_rules (name, condition_field, operator, value, approver)
+    VALUES (%s, %s, %s, %s, %s)
+"""
+LIST_CONDITIONAL_RULES = "SELECT * FROM conditional_rules"
+CONDITIONAL_RULES_FOR_MATCHING = "SELECT condition_field, operator, value, approver FROM conditional_rules ORDER BY id"
+DELETE_CONDITIONAL_RULE = "DELETE FROM conditional_rules WHERE id = %s"
+
+def rule_params(rule, rule_type):
+    return (rule.name, rule_type, rule.threshold, json.dumps(rule.approvers or []),
+            rule.specific_approver, json.dumps(rule.seq) if rule.seq else None, int(rule.is_active))
+
+# ---------------------------------
+# Expenses and approvals
+# ---------------------------------
+INSERT_EXPENSE = """
+    INSERT INTO expenses (employee, amount, currency, category, description, status, base_amount, fx_rate)
+    VALUES (%s,%s,%s,%s,%s,%s,%s,%s)
+"""
+EXPENSE_FOR_UPDATE = "SELECT id, employee, status FROM expenses WHERE id=%s FOR UPDATE"
+SET_EXPENSE_STATUS = "UPDATE expenses SET status=%s WHERE id=%s"
+AUTO_INCREMENT_STEP = "SELECT @@SESSION.auto_increment_increment AS step"
+
+INSERT_APPROVER = "INSERT INTO expense_approvers (expense_id, approver, seq) VALUES (%s, %s, %s)"
+PENDING_ROW_OF_APPROVER = """
+    SELECT id, seq FROM expense_approvers
+    WHERE expense_id=%s AND approver=%s AND decision='pending'
+    ORDER BY seq LIMIT 1
+"""
+SET_VOTE = "UPDATE expense_approvers SET decision=%s, decided_at=%s, comment=%s WHERE id=%s"
+DECIDED_ROW_OF_APPROVER = """
+    SELECT id FROM expense_approvers
+    WHERE expense_id=%s AND approver=%s AND decision IN ('approved','rejected')
+    LIMIT 1
+"""
+PENDING_APPROVERS = "SELECT approver FROM expense_approvers WHERE expense_id=%s AND decision='pending'"
+# admins/managers may vote without being an assigned approver (seq 0 = outside the chain)
+INSERT_ADHOC_VOTE = """
+    INSERT INTO expense_approvers (expense_id, approver, seq, decision, decided_at, comment)
+    VALUES (%s, %s, 0, %s, %s, %s)
+"""
+SKIP_PENDING_APPROVERS = "UPDATE expense_approvers SET decision='skipped' WHERE expense_id=%s AND decision='pending'"
+INBOX_PENDING_COUNT = "SELECT COUNT(*) AS pending FROM expense_approvers WHERE approver=%s AND decision='pending'"
+
+async def insert_expense(cur, employee, exp, base_amount, fx_rate, status="pending"):
+    """Returns the new expense id."""
+    await cur.execute(INSERT_EXPENSE, (employee, exp.amount, exp.currency, exp.category, exp.description,
+                                       status, base_amount, fx_rate))
+    return cur.lastrowid
+
+async def insert_approvers(cur, rows):
+    """rows: (expense_id, approver, seq) tuples."""
+    if rows:
+        await cur.executemany(INSERT_APPROVER, rows)
+
+# ---------------------------------
+# Approval state (see approval_rules.py)
+# ---------------------------------
+STATE_COLUMNS = ("expense_id", "rule_id", "rule_type", "threshold", "specific_approver", "total",
+                 "approved", "rejected", "seq_pos", "specific_decision")
+INSERT_APPROVAL_STATE = (f"INSERT INTO approval_state ({', '.join(STATE_COLUMNS)}) VALUES "
+                         f"({', '.join(['%s'] * len(STATE_COLUMNS))})")
+APPROVAL_STATE = f"SELECT {', '.join(STATE_COLUMNS)} FROM approval_state WHERE expense_id = %s"
+UPDATE_APPROVAL_STATE = """
+    UPDATE approval_state SET approved=%s, rejected=%s, seq_pos=%s, specific_decision=%s
+    WHERE expense_id=%s
+"""
+# a decided expense needs no state; dropping it keeps the table (and the role inbox) to pending work
+DELETE_APPROVAL_STATE = "DELETE FROM approval_state WHERE expense_id=%s"
+# state of pending expenses submitted before approval_state existed: all assigned approvers must approve
+BACKFILL_APPROVAL_STATE = """
+    INSERT INTO approval_state (expense_id, rule_type, total, approved, rejected, seq_pos)
+    SELECT e.id, 'all', COUNT(ea.id),
+           COALESCE(SUM(ea.decision = 'approved'), 0), COALESCE(SUM(ea.decision = 'rejected'), 0),
+           COALESCE(MIN(CASE WHEN ea.decision = 'pending' THEN ea.seq END), 1)
+    FROM expenses e LEFT JOIN expense_approvers ea ON ea.expense_id = e.id AND ea.seq > 0
+    WHERE e.status = 'pending' AND NOT EXISTS (SELECT 1 FROM approval_state s WHERE s.expense_id = e.id)
+"""
+
+# pending expenses (alias e) waiting on a role (first param) named as specific approver, that the
+# user (second param) has no approver row for: not assigned, not voted yet (approval_state alias s)
+SPECIFIC_PENDING_WHERE = """s.specific_approver = %s AND e.status = 'pending'
+          AND NOT EXISTS (SELECT 1 FROM expense_approvers x WHERE x.expense_id = s.expense_id AND x.approver = %s)"""
+SPECIFIC_PENDING_COUNT = (f"SELECT COUNT(*) AS pending FROM approval_state s JOIN expenses e ON e.id = s.expense_id"
+                          f" WHERE {SPECIFIC_PENDING_WHERE}")
+
+async def insert_approval_states(cur, states):
+    """states: (expense_id, approval_rules.initial_state(...)) pairs."""
+    if states:
+        await cur.executemany(INSERT_APPROVAL_STATE,
+                              [(eid, *(st[c] for c in STATE_COLUMNS[1:])) for eid, st in states])
+
+async def approval_state(cur, expense_id):
+    """The expense's approval_state row (cur must be a DictCursor), created on first use if missing."""
+    state = await fetch_one(cur, APPROVAL_STATE, (expense_id,))
+    if state is None:
+        await cur.execute(BACKFILL_APPROVAL_STATE + " AND e.id = %s GROUP BY e.id", (expense_id,))
+        state = await fetch_one(cur, APPROVAL_STATE, (expense_id,))
+    return state
+
+async def save_approval_state(cur, state):
+    await cur.execute(UPDATE_APPROVAL_STATE, (state["approved"], state["rejected"], state["seq_pos"],
+                                              state["specific_decision"], state["expense_id"]))
+
+# ---------------------------------
+# Receipts
+# ---------------------------------
+RECEIPT_COLUMNS = "id, expense_id, filename, url, sha256, size_bytes, content_type, uploaded_by, created_at"
+INSERT_RECEIPT = """
+    INSERT INTO receipts (expense_id, filename, sha256, size_bytes, content_type, uploaded_by)
+    VALUES (%s, %s, %s, %s, %s, %s)
+"""
+SET_RECEIPT_URL = "UPDATE receipts SET url = %s WHERE id = %s"
+RECEIPTS_OF_EXPENSE = f"SELECT {RECEIPT_COLUMNS} FROM receipts WHERE expense_id = %s ORDER BY id"
+RECEIPT_FILE = "SELECT id, expense_id, filename, sha256, content_type FROM receipts WHERE id = %s"
@@ -0,0 +1,82 @@
+# rollups.py
+"""
+Pre-aggregated expense totals for the analytics endpoints.
+
+expense_rollups holds one row per (month, category, employee, status) with the
+number of expenses and their total base_amount (BASE_CURRENCY, see
+fx_history.py). Expense writes adjust the affected rows in the same
+transaction: a new expense adds to its pending row, and a status change moves
+it from the old status row to the new one. Dashboards then sum a few hundred
+rows instead of scanning the expenses table.
+
+Expenses without a base_amount count towards expense_count only. After
+`python fx_history.py backfill` (or any manual fix-up), recompute everything with:
+
+    python rollups.py rebuild
+"""
+from database import get_db
+
+# month is the first day of the expense's created_at month; a NULL category is stored as ''
+_APPLY_SQL = """
+    INSERT INTO expense_rollups (month, category, employee, status, expense_count, total_base_amount)
+    SELECT DATE_FORMAT(created_at, '%%Y-%%m-01'), COALESCE(category, ''), employee, {status},
+           %s, %s * COALESCE(base_amount, 0)
+    FROM expenses WHERE id IN ({ids})
+    ON DUPLICATE KEY UPDATE expense_count = expense_count + VALUES(expense_count),
+                            total_base_amount = total_base_amount + VALUES(total_base_amount)
+"""
+
+async def _apply(cur, expense_ids, sign, status=None):
+    if not expense_ids:
+        return
+    ids = ",".join(["%s"] * len(expense_ids))
+    params = [sign, sign]
+    if status is None:
+        sql = _APPLY_SQL.format(status="status", ids=ids)
+    else:
+        sql = _APPLY_SQL.format(status="%s", ids=ids)
+        params.insert(0, status)
+    await cur.execute(sql, params + list(expense_ids))
+
+async def record_created(cur, expense_ids):
+    """Counts newly inserted expenses under their current status. Call inside the insert's transaction."""
+    await _apply(cur, expense_ids, 1)
+
+async def record_status_change(cur, expense_id, old_status, new_status):
+    """Moves one expense between status rows. Call inside the transaction that updates its status."""
+    if old_status == new_status:
+        return
+    await _apply(cur, [expense_id], -1, old_status)
+    await _apply(cur, [expense_id], 1, new_status)
+
+def rebuild():
+    """Recomputes expense_rollups from expenses in one transaction; returns the number of rollup rows."""
+    conn = get_db()
+    cur = conn.cursor()
+    try:
+        cur.execute("START TRANSACTION")
+        cur.execute("DELETE FROM expense_rollups")
+        cur.execute("""
+            INSERT INTO expense_rollups (month, category, employee, status, expense_count, total_base_amount)
+            SELECT DATE_FORMAT(created_at, '%Y-%m-01'), COALESCE(category, ''), employee, status,
+                   COUNT(*), COALESCE(SUM(base_amount), 0)
+            FROM expenses
+            GROUP BY 1, 2, 3, 4
+        """)
+        rows = cur.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+    return rows
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Expense analytics rollups")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.parse_args()
+    print(f"Rebuilt expense_rollups: {rebuild()} rows.")
@@ -0,0 +1,117 @@
+# rule_cache.py
+"""
+In-memory, versioned copy of the approval rules used on the submit path.
+
+Active `rules` rows and the `conditional_rules` table are loaded together and
+compiled into lookup structures:
+  - amount '>' / '<' rules -> sorted threshold lists, matched with bisect
+  - amount '=' rules       -> dict keyed by the numeric value
+  - category '=' rules     -> dict keyed by the lower-cased category
+so matching an expense costs O(log n + k) and no queries. api/rules.py calls
+invalidate() on every change; other worker processes rebuild after
+RULE_CACHE_TTL seconds at the latest.
+"""
+from dotenv import load_dotenv
+import asyncio
+import bisect
+import json
+import os
+import time
+from database import connection, DictCursor
+import repository
+
+load_dotenv()
+
+RULE_CACHE_TTL = int(os.getenv("RULE_CACHE_TTL", 60))
+
+_load_lock = asyncio.Lock()
+_state = {
+    "version": 0,            # bumped by invalidate()
+    "compiled_version": -1,
+    "compiled_at": 0.0,
+    "rules": {},             # id -> active rule row
+    "matcher": None,
+}
+
+def invalidate():
+    _state["version"] += 1
+
+async def _load():
+    async with connection() as conn:
+        async with conn.cursor(DictCursor) as cur:
+            rules = await repository.fetch_all(cur, repository.ACTIVE_RULES)
+            conditional = await repository.fetch_all(cur, repository.CONDITIONAL_RULES_FOR_MATCHING)
+    return rules, conditional
+
+def _parse_rule(r):
+    for key in ("approvers", "seq"):
+        try:
+            r[key] = json.loads(r.get(key) or "[]")
+        except:
+            r[key] = []
+    return r
+
+def compile_conditional_rules(rows):
+    gt, lt, eq, category = [], [], {}, {}
+    for r in rows:
+        field, op, val, approver = r.get("condition_field"), r.get("operator"), r.get("value"), r.get("approver")
+        if not approver or val is None:
+            continue
+        if field == "amount":
+            try:
+                val_f = float(val)
+            except ValueError:
+                continue
+            if op == ">":
+                gt.append((val_f, approver))
+            elif op == "<":
+                lt.append((val_f, approver))
+            elif op in ("=", "=="):
+                eq.setdefault(val_f, []).append(approver)
+        elif field == "category" and op in ("=", "=="):
+            category.setdefault(val.lower(), []).append(approver)
+    gt.sort()
+    lt.sort()
+    return {
+        "gt_values": [v for v, _ in gt], "gt_approvers": [a for _, a in gt],
+        "lt_values": [v for v, _ in lt], "lt_approvers": [a for _, a in lt],
+        "eq": eq,
+        "category": category,
+    }
+
+def _is_fresh():
+    return (_state["compiled_version"] == _state["version"]
+            and time.monotonic() - _state["compiled_at"] < RULE_CACHE_TTL)
+
+async def _snapshot():
+    if _is_fresh():
+        return _state["rules"], _state["matcher"]
+    async with _load_lock:
+        # another request may have rebuilt while we waited for the lock
+        if not _is_fresh():
+            version = _state["version"]
+            rules, conditional = await _load()
+            _state.update(rules={r["id"]: _parse_rule(r) for r in rules},
+                          matcher=compile_conditional_rules(conditional),
+                          compiled_version=version, compiled_at=time.monotonic())
+        return _state["rules"], _state["matcher"]
+
+async def get_rule(rule_id):
+    """Active rule by id, or None."""
+    rules, _ = await _snapshot()
+    rule = rules.get(rule_id)
+    return dict(rule) if rule else None
+
+async def match_conditional_approvers(amount, category):
+    """Approvers triggered by conditional_rules for this amount/category, without duplicates."""
+    _, m = await _snapshot()
+    result = []
+    amt = float(amount)
+    # '>' rules whose threshold is below the amount form a prefix of the sorted list
+    result.extend(m["gt_approvers"][:bisect.bisect_left(m["gt_values"], amt)])
+    # '<' rules whose threshold is above the amount form a suffix
+    result.extend(m["lt_approvers"][bisect.bisect_right(m["lt_values"], amt):])
+    result.extend(m["eq"].get(amt, []))
+    if category:
+        result.extend(m["category"].get(category.lower(), []))
+    return list(dict.fromkeys(result))
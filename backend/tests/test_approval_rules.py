@@ -0,0 +1,160 @@
+# tests/test_approval_rules.py
+"""
+Rule evaluation, vote by vote: each case starts from initial_state(rule, total)
+and lists votes as (username, role, seq, approve), seq 0 being a vote from
+outside the assigned approvers. That is also how a repeated vote arrives, since
+the voter no longer has a pending row. After every vote the case expects the
+status apply_vote returns ('approved', 'rejected' or None), or OUT_OF_TURN /
+ALREADY_VOTED when check_turn refuses the vote.
+"""
+import pytest
+import approval_rules
+
+OUT_OF_TURN = "out of turn"
+ALREADY_VOTED = "already voted"
+Y, N = True, False
+
+PERCENTAGE = {"id": 1, "type": "percentage", "threshold": 50, "approvers": ["a", "b"]}
+PERCENTAGE_75 = dict(PERCENTAGE, threshold=75)
+SPECIFIC_ROLE = {"id": 2, "type": "specific", "specific_approver": "cfo"}
+SPECIFIC_USER = {"id": 3, "type": "specific", "specific_approver": "carol"}
+HYBRID = {"id": 4, "type": "hybrid", "threshold": 50, "specific_approver": "carol"}
+HYBRID_ROLE = dict(HYBRID, specific_approver="cfo")
+SEQUENCE = {"id": 5, "type": "sequence", "seq": ["a", "b", "c"]}
+NO_RULE = None
+
+CASES = [
+    # percentage: 50% of 4 assigned approvers
+    pytest.param(PERCENTAGE, 4, [("a", "manager", 1, Y), ("b", "manager", 2, Y)],
+                 [None, "approved"], id="percentage-approve"),
+    pytest.param(PERCENTAGE, 4, [("a", "manager", 1, N), ("b", "manager", 2, N), ("c", "manager", 3, N)],
+                 [None, None, "rejected"], id="percentage-reject"),
+    pytest.param(PERCENTAGE_75, 4, [("a", "manager", 1, N), ("b", "manager", 2, N)],
+                 [None, "rejected"], id="percentage-early-reject"),
+    pytest.param(PERCENTAGE, 4, [("c", "manager", 3, Y), ("a", "manager", 1, N), ("d", "manager", 4, Y)],
+                 [None, None, "approved"], id="percentage-early-approve"),
+    pytest.param(PERCENTAGE, 4, [("root", "admin", 0, Y), ("a", "manager", 1, Y)],
+                 [None, None], id="percentage-unassigned-approve-is-recorded-only"),
+    pytest.param(PERCENTAGE, 4, [("boss", "manager", 0, N)],
+                 ["rejected"], id="percentage-unassigned-reject"),
+    pytest.param(PERCENTAGE, 4, [("a", "manager", 1, N), ("a", "manager", 0, N)],
+                 [None, ALREADY_VOTED], id="percentage-repeated-reject"),
+    pytest.param(PERCENTAGE, 0, [("root", "admin", 0, Y)],
+                 ["approved"], id="percentage-no-approvers-admin-approves"),
+    pytest.param(PERCENTAGE, 0, [("boss", "manager", 0, Y)],
+                 ["approved"], id="percentage-no-approvers-manager-approves"),
+
+    # specific: only the specific approver's vote decides
+    pytest.param(SPECIFIC_ROLE, 2, [("a", "manager", 1, Y), ("b", "manager", 2, Y), ("carol", "cfo", 0, Y)],
+                 [None, None, "approved"], id="specific-approve"),
+    pytest.param(SPECIFIC_ROLE, 2, [("a", "manager", 1, Y), ("carol", "cfo", 0, N)],
+                 [None, "rejected"], id="specific-reject"),
+    pytest.param(SPECIFIC_ROLE, 2, [("carol", "cfo", 0, Y)],
+                 ["approved"], id="specific-early-approve"),
+    pytest.param(SPECIFIC_USER, 3, [("carol", "employee", 3, Y)],
+                 ["approved"], id="specific-by-username"),
+    pytest.param(SPECIFIC_USER, 2, [("dave", "cfo", 0, Y)],
+                 [None], id="specific-other-user-approve-is-recorded-only"),
+    pytest.param(SPECIFIC_ROLE, 2, [("root", "admin", 0, Y)],
+                 [None], id="specific-unassigned-approve-is-recorded-only"),
+    pytest.param(SPECIFIC_ROLE, 2, [("boss", "manager", 0, N)],
+                 ["rejected"], id="specific-unassigned-reject"),
+    pytest.param(SPECIFIC_ROLE, 2, [("root", "admin", 0, Y), ("root", "admin", 0, N)],
+                 [None, ALREADY_VOTED], id="specific-unassigned-repeated-vote"),
+
+    # hybrid: 50% of 4, or carol
+    pytest.param(HYBRID, 4, [("a", "manager", 1, Y), ("b", "manager", 2, Y)],
+                 [None, "approved"], id="hybrid-approve-by-percentage"),
+    pytest.param(HYBRID, 4, [("a", "manager", 1, N), ("carol", "manager", 0, Y)],
+                 [None, "approved"], id="hybrid-early-approve-by-specific"),
+    pytest.param(HYBRID, 4, [("carol", "manager", 0, N), ("a", "manager", 1, N), ("b", "manager", 2, N),
+                             ("c", "manager", 3, N)],
+                 [None, None, None, "rejected"], id="hybrid-reject"),
+    pytest.param(HYBRID, 4, [("a", "manager", 1, N), ("b", "manager", 2, N), ("c", "manager", 3, N),
+                             ("carol", "manager", 0, N)],
+                 [None, None, None, "rejected"], id="hybrid-reject-needs-specific"),
+    pytest.param(HYBRID, 4, [("carol", "manager", 0, N), ("a", "manager", 1, Y), ("b", "manager", 2, Y)],
+                 [None, None, "approved"], id="hybrid-percentage-overrides-specific-reject"),
+    pytest.param(HYBRID, 4, [("root", "admin", 0, Y)],
+                 [None], id="hybrid-unassigned-approve-is-recorded-only"),
+    pytest.param(HYBRID, 4, [("boss", "manager", 0, N)],
+                 ["rejected"], id="hybrid-unassigned-reject"),
+    pytest.param(HYBRID_ROLE, 4, [("carol", "cfo", 0, N), ("carol", "cfo", 0, Y)],
+                 [None, ALREADY_VOTED], id="hybrid-role-specific-cannot-flip"),
+    pytest.param(HYBRID, 4, [("a", "manager", 1, N), ("a", "manager", 0, N)],
+                 [None, ALREADY_VOTED], id="hybrid-repeated-reject"),
+
+    # sequence: a, b, c in order, all must approve
+    pytest.param(SEQUENCE, 3, [("a", "manager", 1, Y), ("b", "manager", 2, Y), ("c", "manager", 3, Y)],
+                 [None, None, "approved"], id="sequence-approve"),
+    pytest.param(SEQUENCE, 3, [("a", "manager", 1, Y), ("b", "manager", 2, N)],
+                 [None, "rejected"], id="sequence-early-reject"),
+    pytest.param(SEQUENCE, 3, [("b", "manager", 2, Y), ("a", "manager", 1, Y), ("c", "manager", 3, Y),
+                               ("b", "manager", 2, Y), ("c", "manager", 3, Y)],
+                 [OUT_OF_TURN, None, OUT_OF_TURN, None, "approved"], id="sequence-out-of-turn"),
+    pytest.param(SEQUENCE, 3, [("root", "admin", 0, Y), ("a", "manager", 1, Y)],
+                 [None, None], id="sequence-unassigned-approve-is-recorded-only"),
+    pytest.param(SEQUENCE, 3, [("a", "manager", 1, Y), ("boss", "manager", 0, N)],
+                 [None, "rejected"], id="sequence-unassigned-reject"),
+    pytest.param(SEQUENCE, 3, [("a", "manager", 1, Y), ("a", "manager", 0, Y)],
+                 [None, ALREADY_VOTED], id="sequence-repeated-approve"),
+
+    # no rule: every assigned approver must approve
+    pytest.param(NO_RULE, 2, [("a", "manager", 1, Y), ("b", "manager", 2, Y)],
+                 [None, "approved"], id="all-approve"),
+    pytest.param(NO_RULE, 3, [("b", "manager", 2, N)],
+                 ["rejected"], id="all-early-reject"),
+    pytest.param(NO_RULE, 2, [("b", "manager", 2, Y), ("a", "manager", 1, Y)],
+                 [None, "approved"], id="all-any-order"),
+    pytest.param(NO_RULE, 2, [("root", "admin", 0, Y)],
+                 [None], id="all-unassigned-approve-is-recorded-only"),
+    pytest.param(NO_RULE, 2, [("boss", "manager", 0, N)],
+                 ["rejected"], id="all-unassigned-reject"),
+    pytest.param(NO_RULE, 0, [("root", "admin", 0, Y)],
+                 ["approved"], id="all-no-approvers-admin-approves"),
+    pytest.param(NO_RULE, 2, [("a", "manager", 1, Y), ("a", "manager", 0, Y)],
+                 [None, ALREADY_VOTED], id="all-repeated-approve"),
+]
+
+@pytest.mark.parametrize("rule, total, votes, expected", CASES)
+def test_votes(rule, total, votes, expected):
+    state = approval_rules.initial_state(rule, total)
+    outcomes, decided = [], set()
+    for username, role, seq, approve in votes:
+        try:
+            approval_rules.check_turn(state, seq, voted=seq == 0 and username in decided)
+        except approval_rules.OutOfTurn:
+            outcomes.append(OUT_OF_TURN)
+            continue
+        except approval_rules.AlreadyVoted:
+            outcomes.append(ALREADY_VOTED)
+            continue
+        decided.add(username)
+        outcomes.append(approval_rules.apply_vote(state, username, role, seq, approve))
+    assert outcomes == expected
+
+def test_counters_ignore_unassigned_votes():
+    state = approval_rules.initial_state(SEQUENCE, 3)
+    approval_rules.apply_vote(state, "root", "admin", 0, True)
+    approval_rules.apply_vote(state, "a", "manager", 1, True)
+    assert (state["approved"], state["rejected"], state["seq_pos"]) == (1, 0, 2)
+
+@pytest.mark.parametrize("rule, rule_type, specific", [
+    pytest.param(NO_RULE, "all", None, id="no-rule"),
+    pytest.param({"type": "Sequential", "approvers": ["a"]}, "sequence", None, id="alias"),
+    pytest.param({"type": "percentage", "threshold": 0}, "all", None, id="invalid-threshold"),
+    pytest.param({"type": "specific"}, "all", None, id="specific-without-approver"),
+    pytest.param({"type": "unknown"}, "all", None, id="unknown-type"),
+    pytest.param(dict(PERCENTAGE, specific_approver="cfo"), "percentage", None, id="specific-ignored"),
+    pytest.param(HYBRID, "hybrid", "carol", id="hybrid"),
+])
+def test_initial_state(rule, rule_type, specific):
+    state = approval_rules.initial_state(rule, 2)
+    assert (state["rule_type"], state["specific_approver"], state["total"]) == (rule_type, specific, 2)
+
+def test_is_specific_matches_username_or_role():
+    state = approval_rules.initial_state(SPECIFIC_ROLE, 1)
+    assert approval_rules.is_specific(state, "carol", "cfo")
+    assert approval_rules.is_specific(state, "cfo", "employee")
+    assert not approval_rules.is_specific(state, "carol", "manager")
+    assert not approval_rules.is_specific(approval_rules.initial_state(NO_RULE, 1), "carol", "cfo")
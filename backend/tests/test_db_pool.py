@@ -0,0 +1,90 @@
+# tests/test_db_pool.py
+"""
+Concurrency of the async data-access path: with DB_POOL_SIZE above 5, more
+than 5 requests hold a connection at once and finish in parallel. The MySQL
+pool is replaced by a stub with the same acquire/release interface, whose
+connections "run" a query by sleeping.
+"""
+import asyncio
+import time
+import pytest
+import database
+
+QUERY_SECONDS = 0.05
+REQUESTS = 20
+
+class StubConnection:
+    async def query(self):
+        await asyncio.sleep(QUERY_SECONDS)
+
+class StubPool:
+    def __init__(self, maxsize):
+        self._free = asyncio.Semaphore(maxsize)
+        self.in_use = 0
+        self.peak = 0
+
+    async def acquire(self):
+        await self._free.acquire()
+        self.in_use += 1
+        self.peak = max(self.peak, self.in_use)
+        return StubConnection()
+
+    def release(self, conn):
+        self.in_use -= 1
+        self._free.release()
+
+async def handle_request():
+    """One request: a RequestSession checks out a connection lazily and runs one query."""
+    session = database.RequestSession()
+    try:
+        conn = await session.connection()
+        await conn.query()
+    finally:
+        await session.close()
+
+async def run_requests(pool):
+    started = time.perf_counter()
+    await asyncio.gather(*(handle_request() for _ in range(REQUESTS)))
+    return time.perf_counter() - started
+
+@pytest.mark.parametrize("pool_size, overflow", [(10, 0), (10, 10), (20, 5)])
+def test_more_than_five_requests_run_concurrently(monkeypatch, pool_size, overflow):
+    monkeypatch.setattr(database, "DB_POOL_SIZE", pool_size)
+    monkeypatch.setattr(database, "DB_POOL_OVERFLOW", overflow)
+
+    async def scenario():
+        pool = StubPool(database.DB_POOL_SIZE + database.DB_POOL_OVERFLOW)
+        monkeypatch.setattr(database, "async_pool", pool)
+        elapsed = await run_requests(pool)
+        return pool, elapsed
+
+    pool, elapsed = asyncio.run(scenario())
+    capacity = min(REQUESTS, pool_size + overflow)
+    assert pool.peak == capacity > 5
+    assert pool.in_use == 0
+    # a 5-connection pool needs REQUESTS / 5 rounds of one query each
+    assert elapsed < (REQUESTS // 5) * QUERY_SECONDS
+
+def test_five_connection_pool_serializes_into_rounds(monkeypatch):
+    """The old hardcoded size, for comparison: never more than 5 at once."""
+    async def scenario():
+        pool = StubPool(5)
+        monkeypatch.setattr(database, "async_pool", pool)
+        return pool, await run_requests(pool)
+
+    pool, elapsed = asyncio.run(scenario())
+    assert pool.peak == 5
+    assert elapsed >= (REQUESTS // 5) * QUERY_SECONDS * 0.9
+
+def test_checkout_times_out_when_pool_is_exhausted(monkeypatch):
+    monkeypatch.setattr(database, "DB_POOL_TIMEOUT", 0.05)
+
+    async def scenario():
+        pool = StubPool(1)
+        monkeypatch.setattr(database, "async_pool", pool)
+        async with database.get_async_db():
+            with pytest.raises(database.PoolTimeout):
+                async with database.get_async_db():
+                    pass
+
+    asyncio.run(scenario())
@@ -0,0 +1,53 @@
+# tests/test_events.py
+"""
+Delivery of published events to subscriptions, by username and by role, and the
+ticket that opens GET /events/stream.
+"""
+import asyncio
+import jwt
+from fastapi.testclient import TestClient
+import events
+from api import auth
+from api.events import redeemed_tickets
+from main import app
+
+def drain(sub):
+    return [sub.queue.get_nowait()[1] for _ in range(sub.queue.qsize())]
+
+def test_publish_reaches_recipients_and_role_holders():
+    async def scenario():
+        employee = events.subscribe("emp", "employee")
+        cfo = events.subscribe("carol", "cfo")
+        other = events.subscribe("dave", "manager")
+        try:
+            events.publish("expense.submitted", {"expense_ids": [1]}, ["emp"], ["cfo"])
+            events.publish("expense.vote", {"expense_ids": [1]}, ["emp", "carol"], ["cfo"])
+            return drain(employee), drain(cfo), drain(other)
+        finally:
+            for sub in (employee, cfo, other):
+                events.unsubscribe(sub)
+
+    employee, cfo, other = asyncio.run(scenario())
+    assert employee == ["expense.submitted", "expense.vote"]
+    # named and holding the role: still one copy
+    assert cfo == ["expense.submitted", "expense.vote"]
+    assert other == []
+    assert not events.listening()
+
+def test_stream_accepts_only_unused_tickets():
+    app.dependency_overrides[auth.get_current_user] = lambda: {"id": 1, "username": "emp", "role": "employee"}
+    try:
+        client = TestClient(app)
+        ticket = client.post("/events/ticket").json()["ticket"]
+    finally:
+        app.dependency_overrides.pop(auth.get_current_user, None)
+    claims = jwt.decode(ticket, auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
+    assert (claims["sub"], claims["scope"]) == ("emp", "events")
+
+    # an access token is not a ticket, and a ticket is not an access token
+    access = auth.create_access_token({"sub": "emp", "role": "employee"})
+    assert client.get("/events/stream", params={"ticket": access}).status_code == 401
+    assert client.get("/auth/me", headers={"Authorization": f"Bearer {ticket}"}).status_code == 401
+
+    redeemed_tickets.set(claims["jti"], True)
+    assert client.get("/events/stream", params={"ticket": ticket}).status_code == 401
@@ -0,0 +1,129 @@
+# tests/test_expense_votes.py
+"""
+POST /expenses/{id}/approve and /reject against an in-memory stand-in for the
+tables record_decision touches (expenses, expense_approvers, approval_state),
+served through the real RequestSession from a stubbed pool.
+"""
+import pytest
+from fastapi.testclient import TestClient
+import approval_rules
+import database
+import repository
+from api.auth import get_current_user
+from main import app
+
+class FakeTables:
+    def __init__(self, rule, approvers):
+        self.status = "pending"
+        self.rows = [{"id": i, "approver": a, "seq": i, "decision": "pending"}
+                     for i, a in enumerate(approvers, start=1)]
+        self.state = dict(approval_rules.initial_state(rule, len(approvers)), expense_id=1)
+
+class FakeCursor:
+    def __init__(self, tables):
+        self.t = tables
+        self.result = []
+        self.lastrowid = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def execute(self, sql, params=()):
+        t, self.result = self.t, []
+        if sql == repository.EXPENSE_FOR_UPDATE:
+            self.result = [{"id": 1, "employee": "emp", "status": t.status}]
+        elif sql == repository.APPROVAL_STATE:
+            self.result = [dict(t.state)]
+        elif sql == repository.PENDING_ROW_OF_APPROVER:
+            self.result = sorted(({"id": r["id"], "seq": r["seq"]} for r in t.rows
+                                  if r["approver"] == params[1] and r["decision"] == "pending"),
+                                 key=lambda r: r["seq"])[:1]
+        elif sql == repository.DECIDED_ROW_OF_APPROVER:
+            self.result = [{"id": r["id"]} for r in t.rows
+                           if r["approver"] == params[1] and r["decision"] in ("approved", "rejected")][:1]
+        elif sql == repository.SET_VOTE:
+            next(r for r in t.rows if r["id"] == params[3])["decision"] = params[0]
+        elif sql == repository.INSERT_ADHOC_VOTE:
+            t.rows.append({"id": len(t.rows) + 1, "approver": params[1], "seq": 0, "decision": params[2]})
+        elif sql == repository.UPDATE_APPROVAL_STATE:
+            t.state.update(approved=params[0], rejected=params[1], seq_pos=params[2], specific_decision=params[3])
+        elif sql == repository.SET_EXPENSE_STATUS:
+            t.status = params[0]
+        # anything else (rollups, skipping pending rows) does not matter here
+
+    async def fetchone(self):
+        return self.result[0] if self.result else None
+
+    async def fetchall(self):
+        return self.result
+
+class FakeConnection:
+    def __init__(self, tables):
+        self.tables = tables
+
+    def cursor(self, cursor_class=None):
+        return FakeCursor(self.tables)
+
+    async def begin(self):
+        pass
+
+    async def commit(self):
+        pass
+
+    async def rollback(self):
+        pass
+
+class FakePool:
+    def __init__(self, tables):
+        self.tables = tables
+
+    async def acquire(self):
+        return FakeConnection(self.tables)
+
+    def release(self, conn):
+        pass
+
+@pytest.fixture
+def vote(monkeypatch):
+    """vote(tables, username, role, action) -> response"""
+    current = {}
+    app.dependency_overrides[get_current_user] = lambda: current
+    client = TestClient(app)
+
+    def vote(tables, username, role, action):
+        monkeypatch.setattr(database, "async_pool", FakePool(tables))
+        current.update(id=1, username=username, role=role, manager=None)
+        return client.post(f"/expenses/1/{action}")
+
+    yield vote
+    app.dependency_overrides.pop(get_current_user, None)
+
+def test_assigned_approver_cannot_reject_twice(vote):
+    tables = FakeTables({"type": "percentage", "threshold": 50}, ["a", "b", "c", "d"])
+    first = vote(tables, "a", "manager", "reject")
+    assert first.status_code == 200 and first.json()["status"] == "pending"
+    second = vote(tables, "a", "manager", "reject")
+    assert second.status_code == 409
+    assert tables.status == "pending"
+    assert (tables.state["rejected"], len(tables.rows)) == (1, 4)
+
+def test_assigned_approver_cannot_approve_again(vote):
+    tables = FakeTables(None, ["a", "b"])
+    assert vote(tables, "a", "manager", "approve").status_code == 200
+    assert vote(tables, "a", "manager", "approve").status_code == 409
+    assert tables.state["approved"] == 1
+
+def test_role_specific_approver_cannot_flip_decision(vote):
+    tables = FakeTables({"type": "hybrid", "threshold": 50, "specific_approver": "cfo"}, ["a", "b", "c", "d"])
+    first = vote(tables, "carol", "cfo", "reject")
+    assert first.status_code == 200 and first.json()["status"] == "pending"
+    assert vote(tables, "carol", "cfo", "approve").status_code == 409
+    assert tables.state["specific_decision"] == "rejected"
+    assert tables.status == "pending"
+
+def test_unrelated_employee_cannot_vote(vote):
+    tables = FakeTables(None, ["a"])
+    assert vote(tables, "mallory", "employee", "approve").status_code == 403
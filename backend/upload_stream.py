@@ -0,0 +1,94 @@
+# upload_stream.py
+"""
+Streaming reader for one file field of a multipart/form-data request.
+
+An UploadFile endpoint parameter makes FastAPI read (and spool to disk) the
+whole body before the endpoint runs. FilePart parses request.stream() as it
+arrives instead, so the caller can hash, store and size-check the file while
+the client is still sending it. That works for chunked bodies too, which carry
+no Content-Length. Other fields of the form are skipped without buffering.
+"""
+import python_multipart
+from python_multipart.exceptions import FormParserError
+from python_multipart.multipart import parse_options_header
+
+class BadUpload(Exception):
+    pass
+
+class FilePart:
+    """
+    The first file sent as form field `field`. `filename` and `content_type` (as
+    declared by the client) are set once its headers are parsed, before chunks()
+    yields its first piece.
+    """
+    def __init__(self, request, field="file"):
+        self._request = request
+        self._field = field.encode()
+        self.filename = None
+        self.content_type = None
+        self._found = False
+        self._in_file = False
+        self._headers = {}
+        self._header_name = b""
+        self._header_value = b""
+        self._pending = []
+
+    def _on_part_begin(self):
+        self._headers = {}
+        self._in_file = False
+
+    def _on_header_field(self, data, start, end):
+        self._header_name += data[start:end]
+
+    def _on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_name.lower()] = self._header_value
+        self._header_name, self._header_value = b"", b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if self._found or options.get(b"name") != self._field or b"filename" not in options:
+            return
+        self._found = self._in_file = True
+        self.filename = options[b"filename"].decode("utf-8", "replace")
+        content_type = self._headers.get(b"content-type")
+        self.content_type = content_type.decode("latin-1") if content_type else None
+
+    def _on_part_data(self, data, start, end):
+        if self._in_file:
+            self._pending.append(data[start:end])
+
+    def _on_part_end(self):
+        self._in_file = False
+
+    async def chunks(self):
+        """The file's bytes, as they arrive. Raises BadUpload."""
+        _, params = parse_options_header(self._request.headers.get("content-type", ""))
+        boundary = params.get(b"boundary")
+        if not boundary:
+            raise BadUpload("Expected a multipart/form-data body")
+        parser = python_multipart.MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+        async for chunk in self._request.stream():
+            try:
+                parser.write(chunk)
+            except FormParserError:
+                raise BadUpload("Invalid multipart data")
+            pending, self._pending = self._pending, []
+            for piece in pending:
+                yield piece
+        try:
+            parser.finalize()
+        except FormParserError:
+            raise BadUpload("Invalid multipart data")
+        if not self._found:
+            raise BadUpload(f"Missing file field '{self._field.decode()}'")
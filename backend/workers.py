@@ -0,0 +1,87 @@
+# workers.py
+"""
+Bounded process pools for CPU-heavy work (password hashing, OCR).
+
+Each pool caps the number of jobs queued or running at `max_pending`; a submit
+beyond that fails immediately with PoolBusy instead of piling up behind the
+others, so one burst cannot starve the rest of the API.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import asyncio
+import multiprocessing
+import threading
+import time
+
+class PoolBusy(Exception):
+    pass
+
+class BoundedProcessPool:
+    def __init__(self, name, max_workers, max_pending):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+
+    def _get_executor(self):
+        # created on first use so importing the module never forks; "spawn" keeps
+        # children independent of the server's threads
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    def submit(self, fn, *args):
+        """Returns a concurrent.futures.Future, or raises PoolBusy when the queue is full."""
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise PoolBusy(f"{self.name} pool is busy")
+            self.pending += 1
+            executor = self._get_executor()
+        started = time.perf_counter()
+        try:
+            future = executor.submit(fn, *args)
+        except Exception:
+            with self._lock:
+                self.pending -= 1
+            raise
+
+        def _done(f):
+            with self._lock:
+                self.pending -= 1
+                self.completed += 1
+                self.total_seconds += time.perf_counter() - started
+                # a crashed worker breaks the whole executor; start a fresh one on the next submit
+                if not f.cancelled() and isinstance(f.exception(), BrokenProcessPool) and self._executor is executor:
+                    self._executor = None
+        future.add_done_callback(_done)
+        return future
+
+    def run(self, fn, *args, timeout=None):
+        """Submits and blocks the calling thread until the result is ready."""
+        return self.submit(fn, *args).result(timeout=timeout)
+
+    async def run_async(self, fn, *args, timeout=None):
+        """Submits and awaits the result without blocking the event loop."""
+        return await asyncio.wait_for(asyncio.wrap_future(self.submit(fn, *args)), timeout)
+
+    def stats(self):
+        return {
+            "workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_seconds": round(self.total_seconds / self.completed, 4) if self.completed else None,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
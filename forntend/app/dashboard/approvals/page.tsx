@@ -3,22 +3,23 @@
 import { useEffect, useState } from "react";
 import api from "@/lib/api";
 import Button from "@/components/ui/Button";
+import { useExpenseEvents } from "@/lib/events";
 
 interface Expense {
   id: number;
-  title: string;
+  description: string;
   amount: number;
   category: string;
   status: string;
-  user: string;
+  employee: string;
 }
 
 export default function ApprovalsPage() {
   const [expenses, setExpenses] = useState<Expense[]>([]);
 
   const fetchPending = async () => {
-    const res = await api.get("/expenses/pending");
-    setExpenses(res.data);
+    const res = await api.get("/expenses/inbox");
+    setExpenses(res.data.items);
   };
 
   const handleApprove = async (id: number) => {
@@ -35,6 +36,15 @@ export default function ApprovalsPage() {
     fetchPending();
   }, []);
 
+  // decided expenses leave the inbox in place; only new submissions need a fetch
+  useExpenseEvents((event) => {
+    if (event && event.type !== "expense.submitted") {
+      setExpenses((current) => current.filter((exp) => !event.expense_ids.includes(exp.id)));
+    } else {
+      fetchPending();
+    }
+  });
+
   return (
     <div>
       <h1 className="text-2xl font-semibold mb-4">Pending Approvals</h1>
@@ -52,10 +62,10 @@ export default function ApprovalsPage() {
           <tbody>
             {expenses.map((exp) => (
               <tr key={exp.id} className="border-b hover:bg-gray-50">
-                <td className="py-2">{exp.title}</td>
-                <td>${exp.amount.toFixed(2)}</td>
+                <td className="py-2">{exp.description}</td>
+                <td>${Number(exp.amount).toFixed(2)}</td>
                 <td>{exp.category}</td>
-                <td>{exp.user}</td>
+                <td>{exp.employee}</td>
                 <td className="space-x-2">
                   <Button onClick={() => handleApprove(exp.id)} className="bg-green-600 hover:bg-green-700">
                     Approve
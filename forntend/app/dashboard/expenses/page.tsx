@@ -4,6 +4,7 @@ import { useEffect, useState } from "react";
 import api from "@/lib/api";
 import Button from "@/components/ui/Button";
 import Input from "@/components/ui/Input";
+import { useExpenseEvents } from "@/lib/events";
 
 interface Expense {
   id: number;
@@ -21,7 +22,7 @@ export default function ExpensesPage() {
 
   const fetchExpenses = async () => {
     const res = await api.get("/expenses/");
-    setExpenses(res.data);
+    setExpenses(res.data.items);
   };
 
   const handleAdd = async (e: React.FormEvent) => {
@@ -41,6 +42,17 @@ export default function ExpensesPage() {
     fetchExpenses();
   }, []);
 
+  // status changes are patched in place; only new submissions need a fetch
+  useExpenseEvents((event) => {
+    if (event && event.type !== "expense.submitted") {
+      setExpenses((current) =>
+        current.map((exp) => (event.expense_ids.includes(exp.id) ? { ...exp, status: event.status } : exp))
+      );
+    } else {
+      fetchExpenses();
+    }
+  });
+
   return (
     <div>
       <h1 className="text-2xl font-semibold mb-4">Expenses</h1>
@@ -15,6 +15,8 @@ interface Expense {
   employee?: string;
 }
 
+const PAGE_SIZE = 10;
+
 export default function DashboardHome() {
   const [user, setUser] = useState<any>(null);
   const [expenses, setExpenses] = useState<Expense[]>([]);
@@ -25,21 +27,39 @@ export default function DashboardHome() {
     description: "",
   });
   const [filter, setFilter] = useState("pending");
-  const [search, setSearch] = useState("");
-  const [currentPage, setCurrentPage] = useState(1);
-  const itemsPerPage = 5;
+  const [category, setCategory] = useState("");
+  // cursor of every page visited so far; the last one is the page on screen
+  const [cursors, setCursors] = useState<(string | null)[]>([null]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [loading, setLoading] = useState(false);
 
+  // status, category and paging are applied by GET /expenses (keyset cursor)
   const fetchExpenses = async () => {
+    const params: Record<string, string | number> = { limit: PAGE_SIZE };
+    if (filter !== "all") params.status = filter;
+    if (category.trim()) params.category = category.trim();
+    const cursor = cursors[cursors.length - 1];
+    if (cursor) params.cursor = cursor;
     try {
-      const res = await api.get("/expenses/");
-      setExpenses(res.data);
+      const res = await api.get("/expenses/", { params });
+      setExpenses(res.data.items);
+      setNextCursor(res.data.next_cursor);
     } catch (err) {
       console.error(err);
       toast.error("Failed to fetch expenses");
     }
   };
 
+  // a new filter starts again from the first page
+  const changeFilter = (value: string) => {
+    setFilter(value);
+    setCursors([null]);
+  };
+  const changeCategory = (value: string) => {
+    setCategory(value);
+    setCursors([null]);
+  };
+
   useEffect(() => {
     api
       .get("/auth/me")
@@ -48,8 +68,11 @@ export default function DashboardHome() {
   }, []);
 
   useEffect(() => {
-    if (user) fetchExpenses();
-  }, [user]);
+    if (!user) return;
+    // wait for typing in the category box to pause
+    const timer = setTimeout(fetchExpenses, 300);
+    return () => clearTimeout(timer);
+  }, [user, filter, category, cursors]);
 
   const handleSubmit = async (e: React.FormEvent) => {
     e.preventDefault();
@@ -85,40 +108,6 @@ export default function DashboardHome() {
     }
   };
 
-  // ✅ Fixed filtering logic
-  const filteredExpenses = expenses.filter((exp) => {
-    if (user?.role === "employee") {
-      // Employee: apne khud ke expense aur filter ke hisaab se
-      return filter === "all" ? true : exp.status === filter;
-    } else {
-      // Manager/Admin: sab dekh sakta hai (pending default)
-      if (filter === "all") return true;
-      return exp.status === filter;
-    }
-  });
-
-  const searchedExpenses = filteredExpenses.filter((exp) => {
-    const searchTerm = search.toLowerCase();
-    return (
-      exp.employee?.toLowerCase().includes(searchTerm) ||
-      exp.category.toLowerCase().includes(searchTerm) ||
-      exp.description.toLowerCase().includes(searchTerm)
-    );
-  });
-
-  // ✅ Manager/Admin ke liye pending default view
- const displayedExpenses =
-  user?.role === "manager" || user?.role === "admin"
-    ? filter === "all"
-      ? searchedExpenses
-      : searchedExpenses.filter((exp) => exp.status === filter)
-    : searchedExpenses;
-
-  const paginatedExpenses = displayedExpenses.slice(
-    (currentPage - 1) * itemsPerPage,
-    currentPage * itemsPerPage
-  );
-
   if (!user)
     return (
       <main className="min-h-screen flex items-center justify-center bg-gradient-to-br from-indigo-500 via-purple-500 to-pink-400">
@@ -194,7 +183,7 @@ export default function DashboardHome() {
               </h2>
               <select
                 value={filter}
-                onChange={(e) => setFilter(e.target.value)}
+                onChange={(e) => changeFilter(e.target.value)}
                 className="border border-gray-300 rounded-lg px-3 py-2 bg-white text-gray-700 focus:ring-2 focus:ring-indigo-400 focus:border-indigo-400 shadow-sm"
               >
                 <option value="all">All</option>
@@ -204,11 +193,18 @@ export default function DashboardHome() {
               </select>
             </div>
 
-            {filteredExpenses.length === 0 ? (
+            {expenses.length === 0 ? (
               <p className="text-gray-600">No expenses found.</p>
             ) : (
-              <ExpenseTable data={filteredExpenses} role="employee" />
+              <ExpenseTable data={expenses} role="employee" />
             )}
+
+            <Pager
+              page={cursors.length}
+              hasNext={nextCursor !== null}
+              onPrev={() => setCursors((c) => c.slice(0, -1))}
+              onNext={() => setCursors((c) => [...c, nextCursor])}
+            />
           </>
         )}
 
@@ -223,14 +219,14 @@ export default function DashboardHome() {
             <div className="flex flex-col sm:flex-row justify-between gap-4 mb-4">
               <input
                 type="text"
-                placeholder="🔍 Search by employee, category, or description..."
-                value={search}
-                onChange={(e) => setSearch(e.target.value)}
+                placeholder="🔍 Filter by category..."
+                value={category}
+                onChange={(e) => changeCategory(e.target.value)}
                 className="flex-1 border border-gray-300 rounded-lg px-4 py-2 bg-white text-gray-700 focus:ring-2 focus:ring-indigo-400 focus:border-indigo-400 shadow-sm"
               />
               <select
                 value={filter}
-                onChange={(e) => setFilter(e.target.value)}
+                onChange={(e) => changeFilter(e.target.value)}
                 className="border border-gray-300 rounded-lg px-3 py-2 bg-white text-gray-700 focus:ring-2 focus:ring-indigo-400 focus:border-indigo-400 shadow-sm"
               >
                 <option value="pending">Pending</option>
@@ -240,46 +236,22 @@ export default function DashboardHome() {
               </select>
             </div>
 
-            {displayedExpenses.length === 0 ? (
+            {expenses.length === 0 ? (
               <p className="text-gray-600">No matching expenses found.</p>
             ) : (
               <ExpenseTable
-                data={paginatedExpenses}
+                data={expenses}
                 role={user.role}
                 onAction={handleApproveReject}
               />
             )}
 
-            {/* Pagination */}
-            <div className="flex justify-between items-center mt-4">
-              <button
-                onClick={() => setCurrentPage((p) => Math.max(1, p - 1))}
-                disabled={currentPage === 1}
-                className="px-3 py-1 bg-indigo-500 text-white rounded-md disabled:opacity-50"
-              >
-                Prev
-              </button>
-              <span className="text-gray-700">
-                Page {currentPage} of{" "}
-                {Math.ceil(displayedExpenses.length / itemsPerPage) || 1}
-              </span>
-              <button
-                onClick={() =>
-                  setCurrentPage((p) =>
-                    p < Math.ceil(displayedExpenses.length / itemsPerPage)
-                      ? p + 1
-                      : p
-                  )
-                }
-                disabled={
-                  currentPage >=
-                  Math.ceil(displayedExpenses.length / itemsPerPage)
-                }
-                className="px-3 py-1 bg-indigo-500 text-white rounded-md disabled:opacity-50"
-              >
-                Next
-              </button>
-            </div>
+            <Pager
+              page={cursors.length}
+              hasNext={nextCursor !== null}
+              onPrev={() => setCursors((c) => c.slice(0, -1))}
+              onNext={() => setCursors((c) => [...c, nextCursor])}
+            />
           </>
         )}
       </div>
@@ -288,6 +260,38 @@ export default function DashboardHome() {
 }
 
 /* --- Helper Components --- */
+function Pager({
+  page,
+  hasNext,
+  onPrev,
+  onNext,
+}: {
+  page: number;
+  hasNext: boolean;
+  onPrev: () => void;
+  onNext: () => void;
+}) {
+  return (
+    <div className="flex justify-between items-center mt-4">
+      <button
+        onClick={onPrev}
+        disabled={page === 1}
+        className="px-3 py-1 bg-indigo-500 text-white rounded-md disabled:opacity-50"
+      >
+        Prev
+      </button>
+      <span className="text-gray-700">Page {page}</span>
+      <button
+        onClick={onNext}
+        disabled={!hasNext}
+        className="px-3 py-1 bg-indigo-500 text-white rounded-md disabled:opacity-50"
+      >
+        Next
+      </button>
+    </div>
+  );
+}
+
 function InputField({ label, ...props }: any) {
   return (
     <div className="flex flex-col">
@@ -0,0 +1,67 @@
+"use client";
+
+import { useEffect, useRef } from "react";
+import api from "@/lib/api";
+
+const API_URL = process.env.NEXT_PUBLIC_API_URL ?? "http://127.0.0.1:8000";
+
+const EVENT_TYPES = ["expense.submitted", "expense.approved", "expense.rejected", "expense.vote"];
+
+export interface ExpenseEvent {
+  type: string;
+  expense_ids: number[];
+  status: string;
+}
+
+// Subscribes to GET /events/stream. `onEvent` gets null when the page should
+// reload everything: after a (re)connect, and when the server asks for a resync.
+// EventSource cannot send the Authorization header, so each connection opens
+// with a fresh single-use ticket from POST /events/ticket, never the access token.
+export function useExpenseEvents(onEvent: (event: ExpenseEvent | null) => void) {
+  const handler = useRef(onEvent);
+  handler.current = onEvent;
+
+  useEffect(() => {
+    let source: EventSource | null = null;
+    let retry: ReturnType<typeof setTimeout> | undefined;
+    let opened = false;
+    let closed = false;
+
+    const connect = async () => {
+      if (!localStorage.getItem("token")) return;
+      let ticket: string;
+      try {
+        ticket = (await api.post("/events/ticket")).data.ticket;
+      } catch {
+        retry = setTimeout(connect, 10000);
+        return;
+      }
+      if (closed) return;
+      const es = new EventSource(`${API_URL}/events/stream?ticket=${encodeURIComponent(ticket)}`);
+      source = es;
+      es.onopen = () => {
+        // anything may have changed while disconnected
+        if (opened) handler.current(null);
+        opened = true;
+      };
+      EVENT_TYPES.forEach((type) =>
+        es.addEventListener(type, (e) =>
+          handler.current({ type, ...JSON.parse((e as MessageEvent).data) })
+        )
+      );
+      es.addEventListener("resync", () => handler.current(null));
+      es.onerror = () => {
+        // the ticket is spent, so EventSource's own retry would be refused; reconnect with a new one
+        es.close();
+        retry = setTimeout(connect, 5000);
+      };
+    };
+
+    connect();
+    return () => {
+      closed = true;
+      clearTimeout(retry);
+      source?.close();
+    };
+  }, []);
+}